@@ -6,6 +6,14 @@ import json
 from google.cloud import aiplatform
 import openai
 
+# Shared helpers live in the Django app (pip install -e web)
+from myapp.corpus import load_corpus
+from myapp.embedding_cache import get_embedding_cache
+from myapp.llm_client import complete_sync
+from myapp.prompts import INTERPRETATION_TEMPLATE, build_prompt
+
+EMBEDDING_MODEL = "text-embedding-ada-002"
+
 
 class Transformation:
     def __init__(self, passage):
@@ -22,32 +30,30 @@ class Transformation:
         You will also provide insights into the dreamer's subconscious mind and emotional state based on the dream"""    
 
     def get_data(self):
-        folder_path = "./dreams"
-        count = 0
-        all_files = []
-        for i in os.listdir(folder_path):
-            if i.endswith(".json"):
-                count += 1
-                all_files.append(i)
-        dreams = []
-        for i in all_files:
-            full_name = os.path.join(folder_path, i)
-            with open(full_name, "r") as f:
-                data = json.load(f)
-                for x in data["dreams"]:
-                    dreams.append({"content": x.get("content", "")})
+        """Load every dream (all fields) from the memory-mapped corpus cache.
 
-        df = pd.DataFrame(dreams)
-        self.data_frame = df
+        The cache is rebuilt in parallel from ./dreams only when a source file changes.
+        """
+        folder_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dreams")
+        corpus = load_corpus(folder_path)
+        self.corpus = corpus
+        self.data_frame = corpus.to_frame()
     def get_embeddings(self, text):
         """
         Get vector embeddings for a given text using OpenAI's text-embedding-ada-002 model.
+        Embeddings are cached by content, so the same text is only ever sent once.
         """
+        cache = get_embedding_cache()
+        cached = cache.get(EMBEDDING_MODEL, text)
+        if cached is not None:
+            return cached.tolist()
+
         response = openai.Embedding.create(
-            model="text-embedding-ada-002",
+            model=EMBEDDING_MODEL,
             input=text
         )
         embeddings = response['data'][0]['embedding']
+        cache.put(EMBEDDING_MODEL, text, embeddings)
         return embeddings
 
 
@@ -55,12 +61,13 @@ class Transformation:
         # we are going to use openai and
         # print(5)
         self.openai_key
-        prompt = f"""
-        Analyze this dream{self.dream} and its themes{self.themes}. Give a detailed response to why someone may be having these dreams and using these symbols, 
-        {self.symbols} explain what they represent. Tell the person whether they would need to go be more mindful of their activities if theyre dreams
-        are very negative. Explain also any emotional undertones they might be going through."""
-        chat = openai.ChatCompletion.create(
-            model="google/gemini-2.0-flash-001",
-            messages=[{"role": "user", "content": prompt}],
-        )
+        # Dream trimmed to budget, plus the dictionary meanings of its symbols only
+        symbols = list(dict.fromkeys([*self.themes, *self.symbols]))
+        prompt = build_prompt(self.dream, symbols, template=INTERPRETATION_TEMPLATE).text
+        # The model is an OpenRouter id, so the OpenRouter key and endpoint go with it
+        openrouter_key = os.getenv("OPENROUTER_API_KEY")
+        if not openrouter_key:
+            raise ValueError("OPENROUTER_API_KEY not found in environment variables")
+        # Deadline, retries, fallback models and circuit breakers as in the web app
+        chat = complete_sync(prompt, model="google/gemini-2.0-flash-001", api_key=openrouter_key)
         return chat
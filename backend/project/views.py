@@ -1,37 +1,19 @@
 from django.http import JsonResponse
-import csv
+import logging
 import os
 from rest_framework.decorators import api_view
+from myapp.dream_dictionary import dictionary_response, get_shared_dictionary
+
+logger = logging.getLogger(__name__)
+
+# backend/dream_dict.csv, next to this project package
+DREAM_DICT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'dream_dict.csv')
 
 @api_view(['GET'])
 def get_dream_dictionary(request):
+    """Serve the pre-encoded dream dictionary (supports ?offset=&limit=&prefix=)"""
     try:
-        # Get the absolute path to dream_dict.csv
-        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        file_path = os.path.join(base_dir, 'dream_dict.csv')
-        
-        print(f"Looking for file at: {file_path}")
-        print(f"File exists: {os.path.exists(file_path)}")
-        
-        dream_dict = []
-        with open(file_path, 'r', encoding='utf-8') as file:
-            # Skip header if it exists
-            next(file, None)
-            
-            # Read CSV file
-            csv_reader = csv.reader(file)
-            for row in csv_reader:
-                if len(row) >= 2:
-                    symbol = row[0].strip()
-                    interpretation = row[1].strip()
-                    if symbol:
-                        dream_dict.append({
-                            'symbol': symbol,
-                            'interpretation': interpretation
-                        })
-        
-        print(f"Processed {len(dream_dict)} dream symbols")
-        return JsonResponse(dream_dict, safe=False)
+        return dictionary_response(request, get_shared_dictionary(DREAM_DICT_PATH))
     except Exception as e:
-        print(f"Error reading dream dictionary: {str(e)}")
-        return JsonResponse({'error': str(e)}, status=500) 
\ No newline at end of file
+        logger.error(f"Error reading dream dictionary: {str(e)}")
+        return JsonResponse({'error': str(e)}, status=500)
@@ -1,9 +1,22 @@
-from transformers import BertTokenizer, BertModel
+import asyncio
 import torch
 import os
-from openai import OpenAI
+import queue
+import threading
+import time
 from dotenv import load_dotenv
 import logging
+from .analysis_cache import Abandoned, analysis_key, get_analysis_cache
+from .batching import InferenceBatcher
+from .llm_client import complete, make_client, open_stream, record_usage
+from .conf import get_setting
+from .embedding_cache import get_embedding_cache
+from .metrics import observe, register_collector, span, timed
+from .executors import await_io, run_io, configure_torch_threads, get_inference_executor, inference_workers
+from .model_loader import load_encoder
+from .prompts import build_prompt, count_tokens
+from .segments import pool_segments, split_segments
+from .symbol_scanner import get_symbol_scanner
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -12,70 +25,279 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
+# Bump whenever the analysis prompt changes so cached analyses are not reused
+PROMPT_VERSION = 2
+
 class DreamAnalyzer:
-    def __init__(self):
-        # Initialize OpenAI client for OpenRouter
-        self.client = OpenAI(
-            api_key=os.getenv("OPENROUTER_API_KEY"),
-            base_url=os.getenv("OPENROUTER_BASE_URL")
+    def __init__(self, client=None):
+        # Async OpenRouter client, created lazily on the shared I/O loop
+        # (or a fixed client, e.g. fakes.FakeAsyncOpenAI for offline runs)
+        self._client_override = client
+        self._client = None
+        self._client_pid = None
+
+        # BERT is loaded on first use (or by warm_up), not at construction
+        self._tokenizer = None
+        self._bert_model = None
+        self._model_lock = threading.Lock()
+
+        # Concurrent submissions share batched forward passes
+        self.batcher = InferenceBatcher(
+            self.encode_batch,
+            max_batch_size=get_setting('BATCH_MAX_SIZE'),
+            max_wait_ms=get_setting('BATCH_WAIT_MS'),
+            get_executor=get_inference_executor,
+            max_concurrency=inference_workers(),
         )
-        
-        # Initialize BERT
-        self.tokenizer = BertTokenizer.from_pretrained('bert-base-uncased')
-        self.bert_model = BertModel.from_pretrained('bert-base-uncased')
 
-    async def extract_themes(self, dream_text):
-        """Extract themes using BERT model"""
-        try:
-            # Tokenize and prepare input
-            inputs = self.tokenizer(
-                dream_text,
+    def _load_model(self):
+        with self._model_lock:
+            if self._bert_model is None:
+                configure_torch_threads()
+                self._tokenizer, self._bert_model = load_encoder()
+
+    @property
+    def tokenizer(self):
+        if self._tokenizer is None:
+            self._load_model()
+        return self._tokenizer
+
+    @property
+    def bert_model(self):
+        if self._bert_model is None:
+            self._load_model()
+        return self._bert_model
+
+    def warm_up(self):
+        """Load BERT and run one forward pass so the first request doesn't pay for it"""
+        self._load_model()
+        self.encode_batch(["Warm-up dream about flying over the sea."])
+        logger.info("Dream analyzer warmed up")
+
+    @property
+    def client(self):
+        """Async OpenAI client for OpenRouter with a pooled keep-alive HTTP session"""
+        if self._client_override is not None:
+            return self._client_override
+        if self._client is None or self._client_pid != os.getpid():
+            self._client = make_client()
+            self._client_pid = os.getpid()
+        return self._client
+
+    def encode_batch(self, texts):
+        """Run one BERT forward pass over ``texts`` and return one embedding per text"""
+        tokenizer, model = self.tokenizer, self.bert_model  # load outside the timed spans
+        # Pad only to the longest text in this batch
+        with span('tokenize'):
+            inputs = tokenizer(
+                texts,
                 return_tensors="pt",
                 max_length=512,
                 truncation=True,
-                padding=True
+                padding='longest'
             )
-            
-            # Get BERT embeddings
-            with torch.no_grad():
-                outputs = self.bert_model(**inputs)
-            
-            # Process embeddings to extract themes
-            # This is a placeholder - implement your theme extraction logic here
-            themes = ["placeholder_theme_1", "placeholder_theme_2"]
-            
+        with span('bert_forward'), torch.no_grad():
+            hidden = model(inputs['input_ids'], inputs['attention_mask'])
+
+        # Mean-pool each text over its own (unpadded) tokens
+        mask = inputs['attention_mask'].unsqueeze(-1).to(hidden.dtype)
+        pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+        return list(pooled.numpy())
+
+    @property
+    def embedding_model(self):
+        """Embedding cache namespace for this encoder, its precision and pooling"""
+        # Tracing doesn't change the numbers, quantization does
+        precision = get_setting('INFERENCE_MODE').split('-')[0]
+        if precision == 'fp32':
+            return f"{get_setting('BERT_MODEL_NAME')}:mean"
+        return f"{get_setting('BERT_MODEL_NAME')}:{precision}:mean"
+
+    @property
+    def document_model(self):
+        """Name of the dream-level vectors (pooled segment embeddings) for index manifests"""
+        return f"{self.embedding_model}:segments"
+
+    def segments(self, dream_text):
+        return split_segments(dream_text, max_words=get_setting('SEGMENT_MAX_WORDS'))
+
+    async def embed(self, dream_text):
+        """Dream embedding pooled from its sentences; only uncached sentences go through BERT"""
+        segments = self.segments(dream_text)
+        cache = get_embedding_cache()
+        vectors = cache.get_many(self.embedding_model, segments)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            # Each new sentence joins the shared micro-batch with other submissions
+            computed = await asyncio.gather(*(self.batcher.infer(segments[i]) for i in missing))
+            cache.put_many(self.embedding_model, [segments[i] for i in missing], computed)
+            for i, vector in zip(missing, computed):
+                vectors[i] = vector
+        return pool_segments(segments, vectors)
+
+    def embed_many(self, texts):
+        """Pooled embeddings for many dreams; uncached sentences are encoded in batches"""
+        batch_size = get_setting('BATCH_MAX_SIZE')
+
+        def encode(missing):
+            embeddings = []
+            for start in range(0, len(missing), batch_size):
+                embeddings.extend(self.encode_batch(missing[start:start + batch_size]))
+            return embeddings
+
+        segments = [self.segments(text) for text in texts]
+        unique = list(dict.fromkeys(segment for text_segments in segments for segment in text_segments))
+        vectors = dict(zip(unique, get_embedding_cache().get_or_compute(self.embedding_model, unique, encode)))
+        return [
+            pool_segments(text_segments, [vectors[segment] for segment in text_segments])
+            for text_segments in segments
+        ]
+
+    def extract_symbols(self, dream_text):
+        """Match dream dictionary symbols in the text (single linear scan, no model)"""
+        return get_symbol_scanner().scan(dream_text)
+
+    def cached_embeddings(self, texts):
+        """Pooled embeddings of ``texts`` from the embedding cache alone; ``None`` where a sentence is missing"""
+        segments = [self.segments(text) for text in texts]
+        unique = list(dict.fromkeys(segment for text_segments in segments for segment in text_segments))
+        vectors = dict(zip(unique, get_embedding_cache().get_many(self.embedding_model, unique)))
+        return [
+            pool_segments(text_segments, [vectors[segment] for segment in text_segments])
+            if text_segments and all(vectors[segment] is not None for segment in text_segments) else None
+            for text_segments in segments
+        ]
+
+    def cache_embeddings(self, texts):
+        """Encode the new sentences of ``texts`` on the inference pool in the background.
+
+        Nothing waits for them: the vectors are cached for similar-dream
+        lookups and the similarity index, not used by the analysis itself.
+        """
+        def log_failure(future):
+            if future.exception() is not None:
+                logger.warning(f"Background embedding failed: {future.exception()!r}")
+
+        get_inference_executor().submit(self.embed_many, list(texts)).add_done_callback(log_failure)
+
+    async def extract_themes(self, dream_text):
+        """Extract themes using the dictionary symbol scanner; BERT runs afterwards, off the response path"""
+        try:
+            # Lexical themes: dictionary symbols found in the dream
+            with span('symbol_scan'):
+                themes = get_symbol_scanner().themes(dream_text, limit=get_setting('MAX_THEMES'))
+            self.cache_embeddings([dream_text])
             return themes
         except Exception as e:
-            logger.error(f"Error in BERT processing: {str(e)}")
+            logger.error(f"Error extracting themes: {str(e)}")
             raise
 
+    def _analysis_prompt(self, dream_text, themes):
+        """Token-budgeted prompt with the dictionary meanings of the dream's symbols"""
+        prompt = build_prompt(dream_text, themes)
+        if prompt.trimmed:
+            logger.info(f"Dream trimmed to {prompt.dream_tokens} tokens for the analysis prompt")
+        return prompt.text
+
     async def get_openai_analysis(self, dream_text, themes):
         """Get detailed analysis through OpenRouter"""
         try:
-            prompt = f"""Analyze this dream and its themes:
-            Dream: {dream_text}
-            Extracted Themes: {', '.join(themes)}
-            
-            Provide a detailed psychological analysis including:
-            1. Key symbols and their meanings
-            2. Emotional undertones
-            3. Possible interpretations
-            4. Connections to the dreamer's psyche"""
-
-            response = self.client.chat.completions.create(
-                model="google/palm-2",
-                messages=[{"role": "user", "content": prompt}],
-                headers={
-                    "HTTP-Referer": "http://localhost:3000",  # Your site domain
-                    "X-Title": "Dream Analyzer"
-                }
-            )
-            
-            return response.choices[0].message.content
+            prompt = self._analysis_prompt(dream_text, themes)
+
+            async def request_analysis():
+                # Runs on the shared I/O loop so connections are reused across requests
+                # Deadline, retries, hedging and circuit breakers live in llm_client
+                with span('llm'):
+                    response = await await_io(complete(self.client, prompt, **self._completion_options()))
+                return response.choices[0].message.content
+
+            # Identical concurrent or recent requests share one upstream call
+            key = analysis_key(dream_text, themes, get_setting('LLM_MODEL'), PROMPT_VERSION)
+            return await get_analysis_cache().get_or_call(key, request_analysis)
         except Exception as e:
             logger.error(f"Error in OpenRouter processing: {str(e)}")
             raise
 
+    def iter_openai_analysis(self, dream_text, themes):
+        """Yield the OpenRouter analysis in chunks as the model generates it
+
+        The stream is the in-flight call for its cache key, so identical
+        streamed and non-streamed requests share one upstream call; a
+        request that joins another one's call gets the whole analysis as
+        a single chunk.
+        """
+        key = analysis_key(dream_text, themes, get_setting('LLM_MODEL'), PROMPT_VERSION)
+        cache = get_analysis_cache()
+        while True:
+            cached = cache.results.get(key)
+            if cached is not None:
+                yield cached
+                return
+            flight, leader = cache.join(key)
+            if leader:
+                break
+            try:
+                yield flight.result()
+                return
+            except Abandoned:
+                continue  # its client went away; lead the call instead
+
+        # The stream is read on the shared I/O loop and handed over chunk by chunk
+        chunks = queue.Queue()
+        parts = []
+        try:
+            future = run_io(self._stream_completion(self._analysis_prompt(dream_text, themes), chunks.put))
+            try:
+                while True:
+                    chunk = chunks.get()
+                    if chunk is None:
+                        break
+                    parts.append(chunk)
+                    yield chunk
+                future.result()  # re-raise upstream errors
+            finally:
+                # Stop generating if the client went away mid-stream
+                if not future.done():
+                    future.cancel()
+        except Exception as e:
+            logger.error(f"Error in OpenRouter streaming: {str(e)}")
+            cache.settle(key, flight, error=e)
+            raise
+        except BaseException:
+            cache.settle(key, flight, error=Abandoned())
+            raise
+        cache.settle(key, flight, ''.join(parts))
+
+    def _completion_options(self):
+        max_tokens = get_setting('LLM_MAX_TOKENS')
+        return {'max_tokens': max_tokens} if max_tokens else {}
+
+    async def _stream_completion(self, prompt, put):
+        try:
+            with span('llm_stream'):
+                started = time.perf_counter()
+                stream = await open_stream(self.client, prompt, **self._completion_options())
+                first = True
+                model, usage, parts = get_setting('LLM_MODEL'), None, []
+                async for event in stream:
+                    model = getattr(event, 'model', None) or model
+                    usage = getattr(event, 'usage', None) or usage
+                    if event.choices and event.choices[0].delta.content:
+                        if first:
+                            observe('dream_stage_duration_seconds', {'stage': 'llm_first_token'},
+                                    time.perf_counter() - started)
+                            first = False
+                        parts.append(event.choices[0].delta.content)
+                        put(event.choices[0].delta.content)
+                # Streams rarely report usage, so the tokens are counted here instead
+                if usage is not None:
+                    record_usage(model, usage.prompt_tokens, usage.completion_tokens)
+                else:
+                    record_usage(model, count_tokens(prompt), count_tokens(''.join(parts)))
+        finally:
+            put(None)
+
+    @timed('analyze_dream')
     async def analyze_dream(self, dream_text):
         """Complete dream analysis pipeline"""
         try:
@@ -88,4 +310,19 @@ class DreamAnalyzer:
             }
         except Exception as e:
             logger.error(f"Error in dream analysis: {str(e)}")
-            raise 
\ No newline at end of file
+            raise
+
+
+_analyzer = None
+_analyzer_lock = threading.Lock()
+
+
+def get_dream_analyzer():
+    """Process-wide DreamAnalyzer, created on first use"""
+    global _analyzer
+    if _analyzer is None:
+        with _analyzer_lock:
+            if _analyzer is None:
+                _analyzer = DreamAnalyzer()
+                register_collector(lambda: [('dream_queue_depth', {'queue': 'bert_batch'}, _analyzer.batcher.qsize())])
+    return _analyzer
@@ -0,0 +1,125 @@
+"""LLM analysis result cache with in-flight request coalescing.
+
+Results are cached under a hash of the normalised dream text, the themes,
+the model and the prompt version, with a TTL and LRU size bound.
+Concurrent requests for the same key share one upstream call
+(single-flight): the first caller makes the call, the others await its
+result.  Coalescing works across event loops and threads because waiters
+share a :class:`concurrent.futures.Future`; streamed analyses take part
+through :meth:`SingleFlightCache.join` and :meth:`SingleFlightCache.settle`.
+"""
+import asyncio
+import hashlib
+import json
+import threading
+from concurrent.futures import Future
+
+from .caching import LRUCache
+from .conf import get_setting
+from .embedding_cache import normalize_text
+from .metrics import register_collector
+
+
+def analysis_key(dream_text, themes, model, prompt_version):
+    payload = json.dumps(
+        [normalize_text(dream_text), list(themes), model, prompt_version],
+        ensure_ascii=False, separators=(',', ':'),
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class Abandoned(Exception):
+    """The leader of a call stopped before it had a result; waiters try again."""
+
+
+class SingleFlightCache:
+    """TTL/LRU result cache whose misses are coalesced per key."""
+
+    def __init__(self, max_items, ttl):
+        self.results = LRUCache(max_items, ttl=ttl)
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def join(self, key):
+        """``(future, leader)``: the in-flight call for ``key``, or a new one the caller leads.
+
+        A leader must :meth:`settle` the future; other callers wait on it.
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = self._inflight[key] = Future()
+            future.set_running_or_notify_cancel()  # a waiter going away can't cancel it
+            return future, True
+
+    def settle(self, key, future, value=None, error=None):
+        """Finish a call led by the caller: cache and hand out ``value``, or ``error``"""
+        try:
+            if error is None:
+                self.results.set(key, value)
+                future.set_result(value)
+            else:
+                future.set_exception(error)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    async def get_or_call(self, key, call):
+        """Cached value for ``key``, or the result of awaiting ``call()`` once for all waiters."""
+        while True:
+            value = self.results.get(key)
+            if value is not None:
+                return value
+            future, leader = self.join(key)
+            if leader:
+                break
+            try:
+                return await asyncio.wrap_future(future)
+            except Abandoned:
+                continue
+
+        try:
+            value = await call()
+        except asyncio.CancelledError:
+            self.settle(key, future, error=Abandoned())
+            raise
+        except BaseException as e:
+            self.settle(key, future, error=e)
+            raise
+        self.settle(key, future, value)
+        return value
+
+    def inflight(self):
+        return len(self._inflight)
+
+    def stats(self):
+        return dict(self.results.stats(), coalesced=self.coalesced, inflight=self.inflight())
+
+
+def _collect_metrics():
+    stats = _cache.stats()
+    return [
+        ('dream_cache_hits_total', {'cache': 'analysis'}, stats['hits'] + stats['coalesced']),
+        ('dream_cache_misses_total', {'cache': 'analysis'}, stats['misses'] - stats['coalesced']),
+        ('dream_cache_items', {'cache': 'analysis'}, stats['items']),
+        ('dream_inflight', {'service': 'llm'}, stats['inflight']),
+    ]
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_analysis_cache():
+    """Process-wide analysis :class:`SingleFlightCache`."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SingleFlightCache(
+                    get_setting('ANALYSIS_CACHE_ITEMS'), get_setting('ANALYSIS_CACHE_TTL'))
+                register_collector(_collect_metrics)
+    return _cache
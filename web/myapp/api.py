@@ -1,22 +1,79 @@
 from rest_framework.decorators import api_view, permission_classes, authentication_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from django.http import JsonResponse
-from .ai_processor import DreamAnalyzer
+from django.http import JsonResponse, StreamingHttpResponse
+from .ai_processor import get_dream_analyzer
+import json
 import logging
 from django.shortcuts import get_object_or_404
-from .models import Dream
+from django.urls import reverse
+from .models import AnalysisJob, Dream
+from .jobs import enqueue_analysis
+from .bulk_import import import_dreams, parse_bulk_payload
+from . import replica
+from .rollups import PERIODS, THEME_PERIODS, calendar, record_dreams, record_reanalysis, theme_trends, top_themes
+from datetime import date, datetime, timedelta, timezone
 from .auth import SupabaseAuthentication
-from supabase import create_client
+from .embedding_cache import normalize_text
+from .supabase_client import get_supabase
 from django.conf import settings
+from asgiref.sync import async_to_sync
+from .conf import get_setting
+from .pagination import (
+    DREAM_FIELDS, after_cursor, encode_cursor, newest_first, normalize_timestamp, parse_fields, serialize_dream,
+)
+from .similarity import get_corpus_index, normalize_rows, top_k
 
 logger = logging.getLogger(__name__)
-dream_analyzer = DreamAnalyzer()
+
+def save_dream(user_id, dream_text, themes, analysis):
+    """
+    Insert an analyzed dream into Supabase and return its API representation
+    """
+    response = get_supabase().table('Dreams').insert({
+        'user_id': user_id,
+        'dream_text': dream_text,
+        'themes_symbols': themes,
+        'interpretation': analysis,
+    }).execute()
+    
+    if not response.data:
+        raise Exception('Failed to save dream to database')
+        
+    replica.mirror(response.data)
+    dream = serialize_dream(response.data[0], DREAM_FIELDS)
+    record_dreams(user_id, [dream])
+    return dream
+
+def update_dream(user_id, row, dream_text):
+    """
+    Re-analyze an edited dream (its Dreams ``row`` before the edit) and write
+    it back to Supabase; only sentences not seen before go through BERT
+    """
+    if normalize_text(dream_text) == normalize_text(row['dream_text']):
+        # Whitespace-only edit: the analysis still applies
+        themes, analysis = row['themes_symbols'], row['interpretation']
+    else:
+        result = async_to_sync(get_dream_analyzer().analyze_dream)(dream_text)
+        themes, analysis = result.get('themes', []), result.get('analysis', '')
+
+    response = get_supabase().table('Dreams').update({
+        'dream_text': dream_text,
+        'themes_symbols': themes,
+        'interpretation': analysis,
+    }).eq('dream_id', row['dream_id']).eq('user_id', user_id).execute()
+    if not response.data:
+        raise Exception(f"Dream {row['dream_id']} no longer exists")
+
+    replica.mirror(response.data)
+    dream = serialize_dream(response.data[0], DREAM_FIELDS)
+    record_reanalysis(user_id, dream, row['themes_symbols'] or [])
+    return dream
 
 @api_view(['POST'])
 @authentication_classes([SupabaseAuthentication])
 @permission_classes([IsAuthenticated])
-async def submit_dream(request):
+def submit_dream(request):
     """
     Submit a new dream for analysis and save to Supabase
     """
@@ -25,37 +82,14 @@ async def submit_dream(request):
         if not dream_text:
             return Response({'error': 'Dream text is required'}, status=400)
             
-        # Process dream through AI pipeline
-        result = await dream_analyzer.analyze_dream(dream_text)
+        # Process dream through AI pipeline (BERT runs on the inference pool, the LLM call on the shared I/O loop)
+        result = async_to_sync(get_dream_analyzer().analyze_dream)(dream_text)
         
-        # Create Supabase client
-        supabase = create_client(
-            settings.SUPABASE['URL'],
-            settings.SUPABASE['KEY']
-        )
-        
-        # Save to Supabase
-        response = supabase.table('Dreams').insert({
-            'user_id': request.user.username,
-            'dream_text': dream_text,
-            'themes_symbols': result.get('themes', []),
-            'interpretation': result.get('analysis', ''),
-        }).execute()
-        
-        if not response.data:
-            raise Exception('Failed to save dream to database')
-            
-        dream = response.data[0]
+        dream = save_dream(request.user.username, dream_text, result.get('themes', []), result.get('analysis', ''))
         
         return Response({
             'status': 'success',
-            'data': {
-                'dream_id': dream['dream_id'],
-                'dream_text': dream['dream_text'],
-                'themes': dream['themes_symbols'],
-                'analysis': dream['interpretation'],
-                'created_at': dream['timestamp']
-            }
+            'data': dream
         })
     except Exception as e:
         logger.error(f"Error processing dream: {str(e)}")
@@ -64,56 +98,255 @@ async def submit_dream(request):
             'details': str(e)
         }, status=500)
 
+@api_view(['POST'])
+@authentication_classes([SupabaseAuthentication])
+@permission_classes([IsAuthenticated])
+def bulk_import_dreams(request):
+    """
+    Import many dreams at once (see bulk_import for the accepted shapes);
+    saves them and responds 202 Accepted with a result for every item, in
+    order: a job to poll for each queued analysis, or an error
+    """
+    try:
+        try:
+            texts = parse_bulk_payload(request.data)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
+
+        results = import_dreams(request.user, texts)
+        for result in results:
+            if result['status'] == 'queued':
+                result['status_url'] = reverse('dream_job_status', args=[result['job_id']])
+        queued = sum(1 for result in results if result['status'] == 'queued')
+        if queued:
+            status = 202
+        elif any(result['error'] == 'Failed to save dream' for result in results):
+            status = 500
+        else:
+            status = 400  # no usable dream text at all
+        return Response({
+            'status': 'accepted' if queued == len(results) else 'partial',
+            'queued': queued,
+            'failed': len(results) - queued,
+            'results': results,
+        }, status=status)
+
+    except Exception as e:
+        logger.error(f"Error importing dreams: {str(e)}")
+        return Response({'error': str(e)}, status=500)
+
+def _sse(event, data):
+    """Format one Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@api_view(['POST'])
+@authentication_classes([SupabaseAuthentication])
+@permission_classes([IsAuthenticated])
+def submit_dream_stream(request):
+    """
+    Submit a new dream and stream the analysis back as Server-Sent Events:
+    a `themes` event first, `token` events as the model generates, then
+    `done` with the saved dream (or `error`)
+    """
+    dream_text = request.data.get('dream_text')
+    if not dream_text:
+        return Response({'error': 'Dream text is required'}, status=400)
+    user_id = request.user.username
+
+    def event_stream():
+        try:
+            analyzer = get_dream_analyzer()
+            themes = async_to_sync(analyzer.extract_themes)(dream_text)
+            yield _sse('themes', {'themes': themes})
+
+            parts = []
+            for chunk in analyzer.iter_openai_analysis(dream_text, themes):
+                parts.append(chunk)
+                yield _sse('token', {'text': chunk})
+
+            # Persist once the whole analysis has arrived
+            dream = save_dream(user_id, dream_text, themes, ''.join(parts))
+            yield _sse('done', {'status': 'success', 'data': dream})
+        except Exception as e:
+            logger.error(f"Error streaming dream analysis: {str(e)}")
+            yield _sse('error', {'error': 'An error occurred while processing your dream'})
+
+    response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # don't let nginx buffer the stream
+    return response
+
+def _job_status(job):
+    return {
+        'job_id': str(job.pk),
+        'dream_id': job.dream_id,
+        'status': job.status,
+        'progress': job.progress,
+        'attempts': job.attempts,
+        'result': job.result,
+        'error': job.error or None,
+        'created_at': job.created_at.isoformat(),
+        'updated_at': job.updated_at.isoformat(),
+    }
+
+@api_view(['POST'])
+@authentication_classes([SupabaseAuthentication])
+@permission_classes([IsAuthenticated])
+def submit_dream_job(request):
+    """
+    Save a dream and queue its analysis in the background; responds
+    202 Accepted straight away with a job to poll
+    """
+    try:
+        dream_text = request.data.get('dream_text')
+        if not dream_text:
+            return Response({'error': 'Dream text is required'}, status=400)
+
+        dream = save_dream(request.user.username, dream_text, [], '')
+        job = enqueue_analysis(request.user, dream['dream_id'], dream_text)
+        return Response({
+            'status': 'accepted',
+            'data': {
+                'job_id': str(job.pk),
+                'dream_id': job.dream_id,
+                'status': job.status,
+                'status_url': reverse('dream_job_status', args=[job.pk]),
+            }
+        }, status=202)
+
+    except Exception as e:
+        logger.error(f"Error queueing dream analysis: {str(e)}")
+        return Response({'error': 'An error occurred while processing your dream'}, status=500)
+
+@api_view(['GET'])
+@authentication_classes([SupabaseAuthentication])
+@permission_classes([IsAuthenticated])
+def get_dream_job(request, job_id):
+    """
+    Status of a queued analysis job; `result` holds the analyzed dream once
+    the job has succeeded
+    """
+    try:
+        job = AnalysisJob.objects.filter(pk=job_id, user=request.user).first()
+        if job is None:
+            return Response({'error': 'Job not found'}, status=404)
+        return Response({'status': 'success', 'data': _job_status(job)})
+
+    except Exception as e:
+        return Response({'error': str(e)}, status=500)
+
 @api_view(['GET'])
 @authentication_classes([SupabaseAuthentication])
 @permission_classes([IsAuthenticated])
 def get_dream_history(request):
     """
-    Get user's dream history from Supabase
+    Get a page of the user's dream history from Supabase (or the local
+    replica), newest first
+
+    Query params: limit (capped at HISTORY_MAX_PAGE_SIZE), cursor (next_cursor
+    from the previous page), fields (e.g. dream_id,created_at,themes) and
+    since (only dreams recorded after this timestamp, for incremental sync)
     """
     try:
-        # Create Supabase client
-        supabase = create_client(
-            settings.SUPABASE['URL'],
-            settings.SUPABASE['KEY']
-        )
+        try:
+            limit = int(request.query_params.get('limit', get_setting('HISTORY_PAGE_SIZE')))
+            limit = max(1, min(limit, get_setting('HISTORY_MAX_PAGE_SIZE')))
+            names, columns = parse_fields(request.query_params.get('fields'))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
+
+        if replica.enabled():
+            try:
+                dreams, next_cursor = replica.history_page(
+                    request.user, names, limit,
+                    cursor=request.query_params.get('cursor'),
+                    since=request.query_params.get('since'),
+                )
+            except ValueError as e:
+                return Response({'error': str(e)}, status=400)
+            return Response({'dreams': dreams, 'next_cursor': next_cursor})
+
+        # Shared, pooled Supabase client
+        supabase = get_supabase()
         
         # Use the authenticated user_id from the token
         user_id = request.user.username
         
-        # Fetch dreams from Supabase
-        response = supabase.table('Dreams') \
-            .select('*') \
-            .eq('user_id', user_id) \
-            .order('timestamp', desc=True) \
-            .execute()
+        # Fetch one page (plus one row to know whether there is another)
+        query = supabase.table('Dreams') \
+            .select(columns) \
+            .eq('user_id', user_id)
+        since = request.query_params.get('since')
+        if since:
+            # Client input goes into a PostgREST filter; only a parsed timestamp may
+            try:
+                query = query.gt('timestamp', normalize_timestamp(since))
+            except ValueError:
+                return Response({'error': 'Invalid since timestamp'}, status=400)
+        cursor = request.query_params.get('cursor')
+        if cursor:
+            try:
+                query = after_cursor(query, cursor)
+            except ValueError as e:
+                return Response({'error': str(e)}, status=400)
+        response = newest_first(query).limit(limit + 1).execute()
+
+        rows = response.data[:limit]
+        next_cursor = None
+        if len(response.data) > limit:
+            last = rows[-1]
+            next_cursor = encode_cursor(last['timestamp'], last['dream_id'])
             
         return Response({
-            'dreams': [{
-                'dream_id': dream['dream_id'],
-                'dream_text': dream['dream_text'],
-                'themes': dream['themes_symbols'],
-                'analysis': dream['interpretation'],
-                'created_at': dream['timestamp']
-            } for dream in response.data]
+            'dreams': [serialize_dream(dream, names) for dream in rows],
+            'next_cursor': next_cursor,
         })
     except Exception as e:
         logger.error(f"Error fetching dream history: {str(e)}")
         return Response({'error': str(e)}, status=500)
 
-@api_view(['GET'])
+def edit_dream(request, dream_id):
+    """
+    PATCH {"dream_text": ...}: save an edited dream and refresh its themes
+    and analysis
+    """
+    dream_text = request.data.get('dream_text')
+    if not dream_text:
+        return Response({'error': 'Dream text is required'}, status=400)
+
+    response = get_supabase().table('Dreams') \
+        .select('*') \
+        .eq('dream_id', dream_id) \
+        .eq('user_id', request.user.username) \
+        .execute()
+    if not response.data:
+        return Response({'error': 'Dream not found'}, status=404)
+
+    dream = update_dream(request.user.username, response.data[0], dream_text)
+    return Response({
+        'status': 'success',
+        'data': dream
+    })
+
+@api_view(['GET', 'PATCH'])
 @authentication_classes([SupabaseAuthentication])
 @permission_classes([IsAuthenticated])
 def get_dream(request, dream_id):
     """
-    Retrieve a specific dream by ID from Supabase
+    Retrieve a specific dream by ID from Supabase (or the local replica),
+    or edit it (PATCH)
     """
     try:
-        # Create Supabase client
-        supabase = create_client(
-            settings.SUPABASE['URL'],
-            settings.SUPABASE['KEY']
-        )
+        if request.method == 'PATCH':
+            return edit_dream(request, dream_id)
+
+        if replica.enabled():
+            dream = replica.get_dream(request.user, dream_id)
+            if dream is not None:
+                return Response(dream)
+
+        # Shared, pooled Supabase client
+        supabase = get_supabase()
         
         # Use the authenticated user_id from the token
         user_id = request.user.username  # This is the Supabase user ID from our auth
@@ -127,6 +360,7 @@ def get_dream(request, dream_id):
             
         if not response.data:
             return Response({'error': 'Dream not found'}, status=404)
+        replica.mirror(response.data)
             
         dream = response.data[0]
         
@@ -140,4 +374,176 @@ def get_dream(request, dream_id):
         
     except Exception as e:
         logger.error(f"Error fetching dream: {str(e)}")
-        return Response({'error': str(e)}, status=500) 
\ No newline at end of file
+        return Response({'error': str(e)}, status=500)
+
+@api_view(['GET'])
+@authentication_classes([SupabaseAuthentication])
+@permission_classes([IsAuthenticated])
+def dream_calendar(request):
+    """
+    Dream counts and top themes per day, week or month, from the user's
+    precomputed daily rollups
+
+    Query params: start and end (YYYY-MM-DD, inclusive; default the last
+    year), period (day, week or month) and top (themes per bucket)
+    """
+    try:
+        params = request.query_params
+        try:
+            end = date.fromisoformat(params['end']) if params.get('end') else datetime.now(timezone.utc).date()
+            start = date.fromisoformat(params['start']) if params.get('start') else end - timedelta(days=364)
+            top = max(0, min(int(params.get('top', 5)), 50))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
+        period = params.get('period', 'day')
+        if period not in PERIODS:
+            return Response({'error': f"period must be one of {', '.join(PERIODS)}"}, status=400)
+        if start > end:
+            return Response({'error': 'start must not be after end'}, status=400)
+        if (end - start).days >= get_setting('CALENDAR_MAX_DAYS'):
+            return Response({'error': f"At most {get_setting('CALENDAR_MAX_DAYS')} days per request"}, status=400)
+
+        buckets = calendar(request.user.username, start, end, period=period, top_themes=top)
+        return Response({
+            'period': period,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'total': sum(bucket['count'] for bucket in buckets),
+            'buckets': buckets,
+        })
+
+    except Exception as e:
+        logger.error(f"Error building dream calendar: {str(e)}")
+        return Response({'error': str(e)}, status=500)
+
+@api_view(['GET'])
+@authentication_classes([SupabaseAuthentication])
+@permission_classes([IsAuthenticated])
+def dream_theme_trends(request):
+    """
+    The user's most frequent themes over a time window, with a per-week or
+    per-month series for each, from precomputed theme counters
+
+    Query params: period (week, month or all), start and end (YYYY-MM-DD,
+    inclusive; default the last year; ignored for all), top (number of
+    themes) and theme (repeatable; series for these themes instead of the
+    top ones)
+    """
+    try:
+        params = request.query_params
+        try:
+            end = date.fromisoformat(params['end']) if params.get('end') else datetime.now(timezone.utc).date()
+            start = date.fromisoformat(params['start']) if params.get('start') else end - timedelta(days=364)
+            top = max(1, min(int(params.get('top', 10)), 100))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
+        period = params.get('period', 'month')
+        if period not in THEME_PERIODS:
+            return Response({'error': f"period must be one of {', '.join(THEME_PERIODS)}"}, status=400)
+        if start > end:
+            return Response({'error': 'start must not be after end'}, status=400)
+
+        user_id = request.user.username
+        ranked = top_themes(user_id, period, start, end, k=top)
+        themes = params.getlist('theme')[:100] or [row['theme'] for row in ranked]
+        payload = {'period': period, 'top': ranked}
+        if period != 'all':
+            payload.update({
+                'start': start.isoformat(),
+                'end': end.isoformat(),
+                'series': theme_trends(user_id, themes, period, start, end),
+            })
+        return Response(payload)
+
+    except Exception as e:
+        logger.error(f"Error building theme trends: {str(e)}")
+        return Response({'error': str(e)}, status=500)
+
+@api_view(['POST'])
+@authentication_classes([SupabaseAuthentication])
+@permission_classes([IsAuthenticated])
+def similar_dreams(request):
+    """
+    Find dreams similar to a dream text (or one of the user's saved dreams),
+    both in the dream corpus and in the user's own history. History dreams
+    without cached embeddings are left out (counted in history_pending)
+    until their embeddings have been computed in the background
+    """
+    try:
+        dream_text = request.data.get('dream_text')
+        dream_id = request.data.get('dream_id')
+        try:
+            k = max(1, min(int(request.data.get('k', 5)), 50))
+        except (TypeError, ValueError):
+            return Response({'error': 'k must be an integer'}, status=400)
+
+        # Shared, pooled Supabase client
+        supabase = get_supabase()
+        user_id = request.user.username
+
+        if not dream_text and dream_id is not None:
+            response = supabase.table('Dreams') \
+                .select('dream_text') \
+                .eq('dream_id', dream_id) \
+                .eq('user_id', user_id) \
+                .execute()
+            if not response.data:
+                return Response({'error': 'Dream not found'}, status=404)
+            dream_text = response.data[0]['dream_text']
+        if not dream_text:
+            return Response({'error': 'dream_text or dream_id is required'}, status=400)
+
+        analyzer = get_dream_analyzer()
+        query = async_to_sync(analyzer.embed)(dream_text)
+
+        # Corpus matches from the prebuilt index (see build_similarity_index)
+        corpus_matches = []
+        index, corpus = get_corpus_index(analyzer.document_model)
+        if index is not None:
+            for row, score in index.search(query, k):
+                record = corpus.record(row)
+                corpus_matches.append({
+                    'dreamer': record['dreamer'],
+                    'number': record['number'],
+                    'head': record['head'],
+                    'content': record['content'],
+                    'score': score,
+                })
+
+        # The user's own recent dreams; embeddings come from the embedding cache
+        history = supabase.table('Dreams') \
+            .select('dream_id, dream_text, timestamp') \
+            .eq('user_id', user_id) \
+            .order('timestamp', desc=True) \
+            .limit(get_setting('SIMILAR_HISTORY_LIMIT')) \
+            .execute().data
+        history = [dream for dream in history if str(dream['dream_id']) != str(dream_id)]
+        history_matches = []
+        # Only cached embeddings are compared; a few of the missing ones are
+        # encoded in the background so later requests can include them
+        vectors = analyzer.cached_embeddings([dream['dream_text'] for dream in history])
+        pending = [dream['dream_text'] for dream, vector in zip(history, vectors) if vector is None]
+        if pending:
+            analyzer.cache_embeddings(pending[:get_setting('SIMILAR_EMBED_LIMIT')])
+        history = [dream for dream, vector in zip(history, vectors) if vector is not None]
+        if history:
+            vectors = normalize_rows([vector for vector in vectors if vector is not None])
+            scores = vectors @ normalize_rows(query)
+            for i in top_k(scores, k):
+                dream = history[i]
+                history_matches.append({
+                    'dream_id': dream['dream_id'],
+                    'dream_text': dream['dream_text'],
+                    'created_at': dream['timestamp'],
+                    'score': float(scores[i]),
+                })
+
+        return Response({
+            'corpus': corpus_matches,
+            'corpus_index_available': index is not None,
+            'history': history_matches,
+            'history_pending': len(pending),
+        })
+    except Exception as e:
+        logger.error(f"Error finding similar dreams: {str(e)}")
+        return Response({'error': str(e)}, status=500)
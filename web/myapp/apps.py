@@ -4,3 +4,19 @@ from django.apps import AppConfig
 class MyappConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "myapp"
+
+    def ready(self):
+        from django.core.signals import request_started
+
+        from . import replica  # noqa: F401 (connects the SQLite WAL receiver)
+        from .conf import get_setting
+
+        # Workers can opt in to loading the model before they take traffic
+        if get_setting('WARM_ON_STARTUP'):
+            from .ai_processor import get_dream_analyzer
+            get_dream_analyzer().warm_up()
+
+        # Not here directly: migrate and other commands must not start workers
+        if get_setting('JOB_IN_PROCESS_WORKERS'):
+            from .jobs import start_workers_on_request
+            request_started.connect(start_workers_on_request)
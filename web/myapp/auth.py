@@ -1,39 +1,129 @@
 from rest_framework.authentication import BaseAuthentication
 from rest_framework.exceptions import AuthenticationFailed
+import hashlib
+import threading
+import time
 import jwt
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .caching import LRUCache
+from .conf import get_setting
+from .metrics import register_collector, span
+
+# Verified token claims, keyed by a hash of the token, and Django users,
+# keyed by Supabase user id (`sub`); created on first use from the settings
+_claims_cache = None
+_user_cache = None
+_caches_lock = threading.Lock()
+
+def get_claims_cache():
+    global _claims_cache
+    if _claims_cache is None:
+        with _caches_lock:
+            if _claims_cache is None:
+                _claims_cache = LRUCache(get_setting('AUTH_TOKEN_CACHE_ITEMS'))
+    return _claims_cache
+
+def get_user_cache():
+    global _user_cache
+    if _user_cache is None:
+        with _caches_lock:
+            if _user_cache is None:
+                _user_cache = LRUCache(get_setting('AUTH_USER_CACHE_ITEMS'), ttl=get_setting('AUTH_USER_CACHE_TTL'))
+    return _user_cache
+
+def reset_auth_caches():
+    """Drop both caches; the next lookups create them from current settings"""
+    global _claims_cache, _user_cache
+    with _caches_lock:
+        _claims_cache = _user_cache = None
+
+def _verified_claims(token):
+    """
+    Decode and verify the token, or return the claims cached from an earlier
+    verification. Entries expire at the token's `exp` or after
+    AUTH_TOKEN_CACHE_TTL, whichever comes first
+    """
+    key = hashlib.sha256(token.encode('utf-8')).hexdigest()
+    claims_cache = get_claims_cache()
+    payload = claims_cache.get(key)
+    if payload is not None:
+        return payload
+
+    payload = jwt.decode(
+        token,
+        settings.SUPABASE['JWT_SECRET'],
+        algorithms=['HS256'],
+        audience='authenticated'
+    )
+    lifetime = get_setting('AUTH_TOKEN_CACHE_TTL')
+    if 'exp' in payload:
+        lifetime = min(lifetime, payload['exp'] - time.time())
+    if lifetime > 0:
+        claims_cache.set(key, payload, expires_at=time.monotonic() + lifetime)
+    return payload
+
+def _get_user(user_id, email):
+    user_cache = get_user_cache()
+    user = user_cache.get(user_id)
+    if user is None:
+        user, _ = User.objects.get_or_create(
+            username=user_id,
+            defaults={'email': email}
+        )
+        user_cache.set(user_id, user)
+    return user
+
+def _collect_metrics():
+    samples = []
+    for name, cache in (('auth_token', _claims_cache), ('auth_user', _user_cache)):
+        if cache is None:
+            continue
+        stats = cache.stats()
+        samples += [
+            ('dream_cache_hits_total', {'cache': name}, stats['hits']),
+            ('dream_cache_misses_total', {'cache': name}, stats['misses']),
+            ('dream_cache_items', {'cache': name}, stats['items']),
+        ]
+    return samples
+
+register_collector(_collect_metrics)
+
+@receiver([post_save, post_delete], sender=User)
+def forget_user(sender, instance, **kwargs):
+    # Don't keep serving a stale or deleted user from the cache
+    user_cache = _user_cache
+    if user_cache is not None:
+        user_cache.pop(instance.username)
 
 class SupabaseAuthentication(BaseAuthentication):
     def authenticate(self, request):
+        with span('auth'):
+            return self._authenticate(request)
+
+    def _authenticate(self, request):
         auth_header = request.headers.get('Authorization')
         if not auth_header or not auth_header.startswith('Bearer '):
             return None
 
         token = auth_header.split(' ')[1]
         try:
-            # Decode the JWT token
-            payload = jwt.decode(
-                token,
-                settings.SUPABASE['JWT_SECRET'],
-                algorithms=['HS256'],
-                audience='authenticated'
-            )
+            # Decode the JWT token (cached after the first verification)
+            payload = _verified_claims(token)
             
             # Get the user ID from the token
             user_id = payload.get('sub')
             if not user_id:
                 raise AuthenticationFailed('Invalid token payload')
 
-            # Get or create user
-            user, _ = User.objects.get_or_create(
-                username=user_id,
-                defaults={'email': payload.get('email', '')}
-            )
+            # Get or create user (cached by user ID)
+            user = _get_user(user_id, payload.get('email', ''))
             
             return (user, None)
             
         except jwt.InvalidTokenError as e:
             raise AuthenticationFailed(f'Invalid token: {str(e)}')
         except Exception as e:
-            raise AuthenticationFailed(f'Authentication failed: {str(e)}') 
\ No newline at end of file
+            raise AuthenticationFailed(f'Authentication failed: {str(e)}') 
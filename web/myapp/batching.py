@@ -0,0 +1,100 @@
+"""Dynamic micro-batching for model inference.
+
+Concurrent callers submit single texts; a collector thread gathers them for
+up to ``max_wait_ms`` (or until ``max_batch_size`` is reached), runs one
+batched call and resolves every caller's future with its own result.
+"""
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceBatcher:
+    """Queue that turns many single-item requests into batched ``run_batch`` calls.
+
+    ``run_batch`` receives a list of inputs and must return a list of
+    results of the same length and order.  When ``get_executor`` is given,
+    batches run on the executor it returns (looked up per batch so a
+    forked worker picks up its own pool) with at most ``max_concurrency`` in flight; while all
+    slots are busy, new requests keep accumulating into the next batch.
+    """
+
+    def __init__(self, run_batch, max_batch_size=16, max_wait_ms=10, get_executor=None, max_concurrency=1):
+        self._run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._get_executor = get_executor
+        self._max_concurrency = max_concurrency
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def submit(self, item):
+        """Queue ``item`` and return a :class:`concurrent.futures.Future` for its result."""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    async def infer(self, item):
+        """Awaitable wrapper around :meth:`submit` for use inside coroutines."""
+        return await asyncio.wrap_future(self.submit(item))
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def _ensure_started(self):
+        # A forked worker inherits the object but not the collector thread
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._slots = threading.BoundedSemaphore(self._max_concurrency)
+                self._pid = os.getpid()
+                self._thread = threading.Thread(
+                    target=self._collect, name='inference-batcher', daemon=True)
+                self._thread.start()
+
+    def _collect(self):
+        while True:
+            self._slots.acquire()
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            if self._get_executor is not None:
+                self._get_executor().submit(self._dispatch, batch)
+            else:
+                self._dispatch(batch)
+
+    def _dispatch(self, batch):
+        # A caller that went away (its awaiting task was cancelled) cancels its
+        # future; the others are marked running so they can no longer be cancelled
+        batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+        items = [item for item, _ in batch]
+        try:
+            results = self._run_batch(items) if items else []
+        except Exception as e:
+            logger.error(f"Error in batched inference ({len(items)} items): {str(e)}")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        finally:
+            self._slots.release()
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
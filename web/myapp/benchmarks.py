@@ -0,0 +1,340 @@
+"""Microbenchmarks for the request hot paths.
+
+Each ``@benchmark`` function yields ``(name, callable)`` cases; the
+runner times every case and reports the median, p95 and friends in
+milliseconds.  External services are replaced by local stand-ins from
+:mod:`myapp.fakes` (a PostgREST HTTP server and a fake LLM), so results
+reflect this code rather than network weather.  Results are saved as JSON
+and can be compared against a baseline with a regression threshold
+(``manage.py run_benchmarks``).
+"""
+import asyncio
+import json
+import logging
+import math
+import os
+import platform
+import statistics
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import jwt
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from .conf import get_setting
+
+logger = logging.getLogger(__name__)
+
+BENCHMARKS = []
+
+SAMPLE_SENTENCE = (
+    'I was standing at the edge of a frozen lake while my grandmother called my name '
+    'from a house I did not recognise, and the ice began to crack under my feet. '
+)
+
+
+class Skip(Exception):
+    """Raised by a benchmark whose prerequisites are missing."""
+
+
+def benchmark(group):
+    def register(func):
+        BENCHMARKS.append((group, func))
+        return func
+    return register
+
+
+def text_of_tokens(tokenizer, tokens):
+    """Dream-like text that tokenizes to roughly ``tokens`` word pieces."""
+    words = []
+    sentence = SAMPLE_SENTENCE.split()
+    while len(tokenizer.tokenize(' '.join(words))) < tokens - 2:
+        words.append(sentence[len(words) % len(sentence)])
+    return ' '.join(words)
+
+
+def measure(func, repeat, min_sample_ms=2.0):
+    """Time ``func`` ``repeat`` times; fast functions run several times per sample."""
+    func()  # warm-up
+    started = time.perf_counter()
+    func()
+    once = time.perf_counter() - started
+    number = max(1, math.ceil(min_sample_ms / 1000 / max(once, 1e-9)))
+
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - started) * 1000 / number)
+    samples.sort()
+    return {
+        'median_ms': statistics.median(samples),
+        'p95_ms': samples[min(len(samples) - 1, int(math.ceil(0.95 * len(samples))) - 1)],
+        'min_ms': samples[0],
+        'mean_ms': statistics.fmean(samples),
+        'stdev_ms': statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        'samples': len(samples),
+        'number': number,
+    }
+
+
+class Context:
+    """Shared fixtures for one benchmark run, created on first use."""
+
+    def __init__(self, quick):
+        self.quick = quick
+        self._analyzer = None
+
+    @property
+    def analyzer(self):
+        if self._analyzer is None:
+            from .ai_processor import DreamAnalyzer
+            from .fakes import FakeAsyncOpenAI
+            from .model_loader import ModelNotCached
+
+            analyzer = DreamAnalyzer(client=FakeAsyncOpenAI())
+            try:
+                analyzer.warm_up()
+            except ModelNotCached as e:
+                raise Skip(str(e))
+            self._analyzer = analyzer
+        return self._analyzer
+
+    @property
+    def batch_sizes(self):
+        return (1, 8) if self.quick else (1, 8, get_setting('BATCH_MAX_SIZE'))
+
+    @property
+    def text_lengths(self):
+        return (32, 128) if self.quick else (32, 128, 512)
+
+
+@benchmark('dictionary')
+def bench_dictionary(ctx):
+    from .dream_dictionary import DictionarySnapshot, get_shared_dictionary
+    from .views import get_dream_dictionary
+
+    path = str(get_setting('DREAM_DICT_PATH'))
+    yield 'dictionary.load', lambda: DictionarySnapshot.load(path, 0)
+
+    factory = RequestFactory()
+    snapshot = get_shared_dictionary().snapshot()
+    requests = {
+        'identity': factory.get('/api/dream-dictionary/'),
+        'gzip': factory.get('/api/dream-dictionary/', HTTP_ACCEPT_ENCODING='gzip'),
+        'not_modified': factory.get('/api/dream-dictionary/', HTTP_IF_NONE_MATCH=snapshot.etag('gzip'),
+                                    HTTP_ACCEPT_ENCODING='gzip'),
+        'page_prefix': factory.get('/api/dream-dictionary/', {'prefix': 'f', 'limit': 50}),
+    }
+    for name, request in requests.items():
+        yield f'dictionary.response[{name}]', lambda request=request: get_dream_dictionary(request)
+
+
+@benchmark('auth')
+def bench_auth(ctx):
+    from .auth import SupabaseAuthentication, get_claims_cache, get_user_cache, reset_auth_caches
+
+    secret = 'benchmark-secret-with-at-least-32-bytes'
+    token = jwt.encode({
+        'sub': 'benchmark-user',
+        'aud': 'authenticated',
+        'email': 'benchmark@example.com',
+        'exp': int(time.time()) + 3600,
+    }, secret, algorithm='HS256')
+    request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+    auth = SupabaseAuthentication()
+
+    with override_settings(SUPABASE=dict(settings.SUPABASE, JWT_SECRET=secret)):
+        # Seed the user cache so neither case touches the database
+        get_user_cache().set('benchmark-user', User(username='benchmark-user'))
+
+        def verify():
+            get_claims_cache().clear()
+            return auth.authenticate(request)
+
+        yield 'auth.jwt_verify', verify
+        yield 'auth.cached', lambda: auth.authenticate(request)
+    reset_auth_caches()
+
+
+@benchmark('bert')
+def bench_bert(ctx):
+    analyzer = ctx.analyzer
+    tokenizer = analyzer.tokenizer
+    for length in ctx.text_lengths:
+        text = text_of_tokens(tokenizer, length)
+        for batch_size in ctx.batch_sizes:
+            texts = [text] * batch_size
+            yield f'bert.tokenize[batch={batch_size},tokens={length}]', lambda texts=texts: tokenizer(
+                texts, return_tensors='pt', max_length=512, truncation=True, padding='longest')
+            yield f'bert.forward[batch={batch_size},tokens={length}]', lambda texts=texts: analyzer.encode_batch(texts)
+
+
+@benchmark('themes')
+def bench_themes(ctx):
+    from .symbol_scanner import get_symbol_scanner
+
+    analyzer = ctx.analyzer
+    scanner = get_symbol_scanner()
+    counter = iter(range(10 ** 9))
+    for length in ctx.text_lengths:
+        text = text_of_tokens(analyzer.tokenizer, length)
+        yield f'themes.scan[tokens={length}]', lambda text=text: scanner.themes(text, limit=get_setting('MAX_THEMES'))
+
+        def embed(text=text):
+            # Every sentence is new each time, so the embedding cache always misses
+            n = next(counter)
+            return asyncio.run(analyzer.embed(f"{n} {text.replace('. ', f'. {n} ')}"))
+
+        def embed_edited(text=text):
+            # Only the appended sentence is new
+            return asyncio.run(analyzer.embed(f'{text} Then I woke up {next(counter)} times.'))
+
+        yield f'themes.embed_uncached[tokens={length}]', embed
+        yield f'themes.embed_edited[tokens={length}]', embed_edited
+        yield f'themes.embed_cached[tokens={length}]', lambda text=text: asyncio.run(analyzer.embed(text))
+
+
+@benchmark('llm')
+def bench_llm(ctx):
+    from .analysis_cache import get_analysis_cache
+
+    analyzer = ctx.analyzer
+    text = SAMPLE_SENTENCE * 3
+    themes = ['Lake', 'Ice', 'Grandmother']
+
+    def uncached():
+        get_analysis_cache().results.clear()
+        return asyncio.run(analyzer.get_openai_analysis(text, themes))
+
+    yield 'llm.analysis_uncached[fake]', uncached
+    yield 'llm.analysis_cached', lambda: asyncio.run(analyzer.get_openai_analysis(text, themes))
+    yield 'llm.stream[fake]', lambda: ''.join(analyzer.iter_openai_analysis(f'{time.perf_counter()} {text}', themes))
+
+
+@benchmark('corpus')
+def bench_corpus(ctx):
+    from .corpus import corpus_files, load_corpus
+
+    corpus = load_corpus()
+    yield 'corpus.load_cached', load_corpus
+    yield 'corpus.read_all_content', lambda: sum(len(text) for text in corpus['content'])
+    try:
+        import pandas  # noqa: F401 (Transformation.get_data builds a DataFrame)
+    except ImportError:
+        pass
+    else:
+        yield 'corpus.to_frame', corpus.to_frame
+
+    if not ctx.quick:
+        paths = corpus_files()
+
+        def rebuild():
+            with tempfile.TemporaryDirectory() as cache_dir:
+                load_corpus(cache_dir=cache_dir)
+
+        yield f'corpus.rebuild[files={len(paths)}]', rebuild
+
+
+@benchmark('history')
+def bench_history(ctx):
+    from .api import get_dream_history
+    from .fakes import FakePostgrest, fake_dreams
+    from .supabase_client import reset_client
+
+    user = User(username='benchmark-user')
+    factory = APIRequestFactory()
+    key = jwt.encode({'role': 'anon'}, 'benchmark-secret-with-at-least-32-bytes', algorithm='HS256')
+
+    with FakePostgrest(fake_dreams(201)) as server:
+        with override_settings(SUPABASE=dict(settings.SUPABASE, URL=server.url, KEY=key)):
+            reset_client()
+            for limit, fields in ((50, None), (200, None), (50, 'dream_id,created_at,themes')):
+                params = {'limit': limit}
+                if fields:
+                    params['fields'] = fields
+
+                def fetch(params=params):
+                    request = factory.get('/api/dreams/history/', params)
+                    force_authenticate(request, user=user)
+                    response = get_dream_history(request)
+                    response.render()
+                    if response.status_code != 200:
+                        raise RuntimeError(response.content)
+                    return response
+
+                name = f"history.response[limit={limit}{',projected' if fields else ''}]"
+                yield name, fetch
+    reset_client()
+
+
+def selects_group(group, only):
+    """Whether any ``only`` pattern names ``group`` or a benchmark within it (``group.name``)."""
+    return not only or any(f'{pattern}.'.startswith(f'{group}.') for pattern in only)
+
+
+def run_benchmarks(only=None, repeat=20, quick=False, log=print):
+    """Run the registered benchmarks (``only``: groups or ``group.name`` substrings) and return the results document."""
+    ctx = Context(quick)
+    results = {}
+    skipped = {}
+    for group, func in BENCHMARKS:
+        # Decided before the generator runs, so unselected groups build no fixtures
+        if not selects_group(group, only):
+            continue
+        try:
+            for name, case in func(ctx):
+                if only and not any(pattern in name for pattern in only):
+                    continue
+                results[name] = measure(case, repeat=repeat)
+                log(f"{name:55s} {results[name]['median_ms']:10.3f} ms (p95 {results[name]['p95_ms']:.3f})")
+        except Skip as e:
+            skipped[group] = str(e)
+            log(f"{group}: skipped ({e})")
+
+    import torch
+
+    return {
+        'meta': {
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'torch': torch.__version__,
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'model': get_setting('BERT_MODEL_NAME'),
+            'inference_mode': get_setting('INFERENCE_MODE'),
+            'repeat': repeat,
+            'quick': quick,
+        },
+        'results': results,
+        'skipped': skipped,
+    }
+
+
+def compare(current, baseline, threshold):
+    """Compare medians; returns ``[(name, baseline_ms, current_ms, ratio, regressed), ...]``."""
+    rows = []
+    for name, result in current['results'].items():
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        ratio = result['median_ms'] / max(before['median_ms'], 1e-9)
+        rows.append((name, before['median_ms'], result['median_ms'], ratio, ratio > 1 + threshold))
+    return rows
+
+
+def save_results(path, document):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+
+
+def load_results(path):
+    with open(path, 'r') as f:
+        return json.load(f)
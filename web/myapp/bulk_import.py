@@ -0,0 +1,104 @@
+"""Bulk dream import: chunked inserts, analysis queued as background jobs.
+
+Accepted payloads (``parse_bulk_payload``):
+
+* ``{"dreams": ["text", ...]}`` or a bare list of texts
+* ``{"dreams": [{"dream_text": "..."}, ...]}``
+* the ``backend/dreams`` corpus shape,
+  ``{"dreamer": ..., "dreams": [{"head": ..., "content": ...}, ...]}``,
+  or a list of such documents
+
+Dreams are saved in multi-row chunks straight away, without themes or
+analysis, and an ``AnalysisJob`` is queued for each (see ``jobs``), so
+the request only costs the inserts.  Workers fill in the analyses at
+their own concurrency, and clients poll the jobs for progress.
+"""
+import logging
+
+from .conf import get_setting
+from .jobs import enqueue_analyses
+from .pagination import DREAM_FIELDS, serialize_dream
+from .replica import mirror
+from .rollups import record_dreams
+from .supabase_client import get_supabase
+
+logger = logging.getLogger(__name__)
+
+
+def _dream_text(item):
+    if isinstance(item, str):
+        return item
+    if isinstance(item, dict):
+        return item.get('dream_text') or item.get('content')
+    return None
+
+
+def parse_bulk_payload(data):
+    """Flatten a bulk payload into a list of dream texts (``None`` for unusable items).
+
+    Raises ``ValueError`` for payloads of the wrong shape or size.
+    """
+    if isinstance(data, dict):
+        documents = [data]
+    elif isinstance(data, list) and data and all(isinstance(doc, dict) and 'dreams' in doc for doc in data):
+        documents = data
+    else:
+        documents = [{'dreams': data}]
+    items = []
+    for document in documents:
+        dreams = document.get('dreams')
+        if not isinstance(dreams, list):
+            raise ValueError('Expected a list of dreams or an object with a "dreams" list')
+        items.extend(dreams)
+
+    if not items:
+        raise ValueError('No dreams to import')
+    if len(items) > get_setting('BULK_MAX_DREAMS'):
+        raise ValueError(f"At most {get_setting('BULK_MAX_DREAMS')} dreams per request")
+
+    texts = []
+    for item in items:
+        text = _dream_text(item)
+        texts.append(text.strip() if isinstance(text, str) and text.strip() else None)
+    return texts
+
+
+def insert_dreams(rows):
+    """Insert ``rows`` in one request; returns the saved dreams in the same order"""
+    response = get_supabase().table('Dreams').insert(rows).execute()
+    if len(response.data) != len(rows):
+        raise Exception('Failed to save dreams to database')
+    mirror(response.data)
+    dreams = [serialize_dream(row, DREAM_FIELDS) for row in response.data]
+    record_dreams(rows[0]['user_id'], dreams)
+    return dreams
+
+
+def import_dreams(user, texts):
+    """Save ``texts`` and queue their analysis; returns one result dict per item, in order"""
+    results = [None] * len(texts)
+    for i, text in enumerate(texts):
+        if text is None:
+            results[i] = {'index': i, 'status': 'error', 'error': 'Dream text is required'}
+    pending = [i for i, text in enumerate(texts) if text is not None]
+
+    chunk_size = get_setting('BULK_INSERT_CHUNK')
+    for start in range(0, len(pending), chunk_size):
+        indexes = pending[start:start + chunk_size]
+        rows = [{
+            'user_id': user.username,
+            'dream_text': texts[i],
+            'themes_symbols': [],
+            'interpretation': '',
+        } for i in indexes]
+        try:
+            dreams = insert_dreams(rows)
+        except Exception as e:
+            logger.error(f"Error saving {len(rows)} imported dreams: {str(e)}")
+            for i in indexes:
+                results[i] = {'index': i, 'status': 'error', 'error': 'Failed to save dream'}
+            continue
+        jobs = enqueue_analyses(user, [(dream['dream_id'], texts[i]) for i, dream in zip(indexes, dreams)])
+        for i, dream, job in zip(indexes, dreams, jobs):
+            results[i] = {'index': i, 'status': 'queued', 'dream_id': dream['dream_id'], 'job_id': str(job.pk)}
+    return results
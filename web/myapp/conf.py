@@ -0,0 +1,134 @@
+"""Defaults for the ``DREAM_ANALYZER`` settings dict.
+
+Any key can be overridden from the project settings, e.g.::
+
+    DREAM_ANALYZER = {'DREAM_DICT_PATH': '/srv/data/dream_dict.csv'}
+"""
+from pathlib import Path
+
+from django.conf import settings
+
+# Repository root (the directory holding ``web/`` and ``backend/``)
+REPO_ROOT = Path(__file__).resolve().parent.parent.parent
+
+DEFAULTS = {
+    # Dream dictionary CSV served by /api/dream-dictionary/
+    'DREAM_DICT_PATH': REPO_ROOT / 'backend' / 'dream_dict.csv',
+    # Maximum number of dictionary symbols reported as a dream's themes
+    'MAX_THEMES': 15,
+    # Encoder model and the local directory its weights are exported to
+    'BERT_MODEL_NAME': 'bert-base-uncased',
+    'MODEL_CACHE_DIR': REPO_ROOT / 'models',
+    # Download the model from the Hugging Face hub into MODEL_CACHE_DIR the
+    # first time it is needed (False: fail unless warm_analyzer --download ran)
+    'MODEL_ALLOW_DOWNLOAD': True,
+    # Load and warm the analyzer when the app starts (set in worker processes)
+    'WARM_ON_STARTUP': False,
+    # CPU inference mode: fp32, int8 (dynamic quantization of the linear
+    # layers), fp32-traced or int8-traced (frozen TorchScript graph)
+    'INFERENCE_MODE': 'fp32',
+    # BERT micro-batching: max texts per forward pass and how long to wait for them
+    'BATCH_MAX_SIZE': 16,
+    'BATCH_WAIT_MS': 10,
+    # Inference thread pool size and torch intra-op threads per worker
+    # (None: 1 worker per 4 cores, cores split evenly between workers)
+    'INFERENCE_WORKERS': None,
+    'TORCH_THREADS': None,
+    # Dreams are embedded sentence by sentence; longer sentences are split
+    # into pieces of at most this many words
+    'SEGMENT_MAX_WORDS': 128,
+    # Content-addressed embedding cache (SQLite file + in-memory LRU entries)
+    'EMBEDDING_CACHE_PATH': REPO_ROOT / 'cache' / 'embeddings.sqlite3',
+    'EMBEDDING_CACHE_MEMORY_ITEMS': 4096,
+    # Dream corpus JSON files and the columnar cache built from them
+    'CORPUS_DIR': REPO_ROOT / 'backend' / 'dreams',
+    'CORPUS_CACHE_DIR': REPO_ROOT / 'cache' / 'corpus',
+    # Dream history paging: default and maximum page size
+    'HISTORY_PAGE_SIZE': 50,
+    'HISTORY_MAX_PAGE_SIZE': 200,
+    # Similar-dreams index; NPROBE is how many IVF clusters a query scans
+    'SIMILARITY_INDEX_DIR': REPO_ROOT / 'cache' / 'similarity',
+    'SIMILARITY_NPROBE': 8,
+    # How many of the user's most recent dreams are compared against, and
+    # how many of those without cached embeddings one request may queue
+    # for background encoding (the others wait for later requests)
+    'SIMILAR_HISTORY_LIMIT': 500,
+    'SIMILAR_EMBED_LIMIT': 32,
+    # Shared Supabase client: HTTP pool size, timeout and keep-alive (seconds)
+    'SUPABASE_POOL_SIZE': 20,
+    'SUPABASE_TIMEOUT': 10,
+    'SUPABASE_KEEPALIVE_EXPIRY': 30,
+    # OpenRouter model used for dream analysis
+    'LLM_MODEL': 'google/palm-2',
+    # Analysis result cache: max entries and time-to-live (seconds)
+    'ANALYSIS_CACHE_ITEMS': 1024,
+    'ANALYSIS_CACHE_TTL': 3600,
+    # Analysis prompt token budgets: dream text, dictionary meanings of the
+    # dream's symbols in total and per symbol; cap on completion tokens
+    # (None: the model's own limit)
+    'PROMPT_DREAM_TOKENS': 1500,
+    'PROMPT_DICTIONARY_TOKENS': 400,
+    'PROMPT_SYMBOL_TOKENS': 80,
+    'LLM_MAX_TOKENS': None,
+    # OpenRouter HTTP pool size and per-request timeout (seconds)
+    'LLM_MAX_CONNECTIONS': 20,
+    'LLM_TIMEOUT': 60,
+    # Overall time (seconds) one analysis may take across retries and hedges,
+    # retries after a failed attempt and their base backoff (seconds)
+    'LLM_DEADLINE': 90,
+    'LLM_MAX_RETRIES': 2,
+    'LLM_RETRY_BACKOFF': 0.5,
+    # Models tried, in order, when LLM_MODEL fails or is slow; a request still
+    # unanswered after LLM_HEDGE_AFTER seconds (or 'p95': the model's observed
+    # p95) is raced against the next one (None: fail over on errors only)
+    'LLM_FALLBACK_MODELS': [],
+    'LLM_HEDGE_AFTER': None,
+    # Per-model circuit breaker: consecutive failures before a model is
+    # skipped, and for how long (seconds)
+    'LLM_BREAKER_FAILURES': 5,
+    'LLM_BREAKER_COOLDOWN': 30,
+    # Verified JWT claims and authenticated users kept in memory per process;
+    # claims never outlive the token's ``exp``
+    'AUTH_TOKEN_CACHE_ITEMS': 10000,
+    'AUTH_TOKEN_CACHE_TTL': 300,
+    'AUTH_USER_CACHE_ITEMS': 10000,
+    'AUTH_USER_CACHE_TTL': 300,
+    # Output and checkpoints of ``manage.py analyze_corpus``
+    'CORPUS_ANALYSIS_DIR': REPO_ROOT / 'cache' / 'analysis',
+    # Mirror Supabase dream writes into the local Dream table and serve dream
+    # lookups and history from it (run ``manage.py reconcile_replica`` first)
+    'LOCAL_REPLICA': False,
+    # Longest date range (days) one calendar request may cover
+    'CALENDAR_MAX_DAYS': 1830,
+    # Bulk import: max dreams per request and rows per insert (their analyses
+    # run as background jobs)
+    'BULK_MAX_DREAMS': 1000,
+    'BULK_INSERT_CHUNK': 100,
+    # Serve /metrics (off: it answers 404 and no snapshots are written),
+    # per-process metric snapshots merged by /metrics (None keeps metrics
+    # per process), how often they are written (seconds), and an optional
+    # bearer token required to scrape
+    'METRICS_ENABLED': False,
+    'METRICS_DIR': REPO_ROOT / 'cache' / 'metrics',
+    'METRICS_FLUSH_INTERVAL': 2,
+    'METRICS_TOKEN': None,
+    # Background analysis jobs: attempts before giving up, lease length and
+    # base retry delay (seconds), idle poll interval (seconds)
+    'JOB_MAX_ATTEMPTS': 3,
+    'JOB_VISIBILITY_TIMEOUT': 300,
+    'JOB_RETRY_BACKOFF': 5,
+    'JOB_POLL_INTERVAL': 1.0,
+    # Worker threads started inside the web process; 0 leaves the queue to
+    # ``manage.py run_analysis_workers``
+    'JOB_IN_PROCESS_WORKERS': 2,
+}
+
+
+def get_setting(name):
+    """Return a ``DREAM_ANALYZER`` setting, falling back to ``DEFAULTS``.
+
+    Works without configured Django settings so the offline scripts in
+    ``backend/`` can import modules from this app.
+    """
+    overrides = getattr(settings, 'DREAM_ANALYZER', {}) if settings.configured else {}
+    return overrides.get(name, DEFAULTS[name])
@@ -0,0 +1,190 @@
+"""Streaming loader and columnar cache for the ``backend/dreams`` corpus.
+
+Source files are parsed in parallel across a process pool and streamed as
+record batches.  The first full load also writes a columnar cache (one
+UTF-8 blob plus an offsets array per column, stored as ``.npy`` files);
+later loads memory-map it instead of re-parsing ~22 MB of JSON.  The cache
+is rebuilt whenever a source file is added, removed or modified.
+"""
+import json
+import logging
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .conf import get_setting
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ('source', 'dreamer', 'description', 'number', 'head', 'content')
+MANIFEST = 'manifest.json'
+CACHE_FORMAT = 1
+
+
+def corpus_files(folder=None):
+    """Sorted paths of the corpus JSON files."""
+    folder = str(folder or get_setting('CORPUS_DIR'))
+    return sorted(
+        os.path.join(folder, name) for name in os.listdir(folder) if name.endswith('.json')
+    )
+
+
+def fingerprint(paths):
+    """Name, size and mtime of every source file; any change invalidates the cache."""
+    entries = []
+    for path in paths:
+        st = os.stat(path)
+        entries.append([os.path.basename(path), st.st_size, st.st_mtime_ns])
+    return entries
+
+
+def parse_file(path):
+    """All records of one corpus file, keeping every field."""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    source = os.path.basename(path)
+    dreamer = data.get('dreamer', '')
+    description = data.get('description', '')
+    return [
+        {
+            'source': source,
+            'dreamer': dreamer,
+            'description': description,
+            'number': str(dream.get('number', '')),
+            'head': dream.get('head', ''),
+            'content': dream.get('content', ''),
+        }
+        for dream in data.get('dreams', [])
+    ]
+
+
+def iter_corpus(folder=None, batch_size=2000, processes=None, paths=None):
+    """Yield lists of at most ``batch_size`` records, parsing files in parallel.
+
+    Files are yielded in sorted order so the record order is stable.
+    """
+    paths = paths if paths is not None else corpus_files(folder)
+    batch = []
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        for records in pool.map(parse_file, paths):
+            batch.extend(records)
+            while len(batch) >= batch_size:
+                yield batch[:batch_size]
+                batch = batch[batch_size:]
+    if batch:
+        yield batch
+
+
+class StringColumn:
+    """Read-only sequence of strings backed by a UTF-8 blob and offsets array."""
+
+    def __init__(self, data, offsets):
+        self._data = data
+        self._offsets = offsets
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        start, end = self._offsets[index], self._offsets[index + 1]
+        return bytes(self._data[start:end]).decode('utf-8')
+
+    def __iter__(self):
+        data = bytes(self._data)
+        offsets = self._offsets.tolist()
+        for start, end in zip(offsets, offsets[1:]):
+            yield data[start:end].decode('utf-8')
+
+
+class CorpusTable:
+    """Columnar view of the corpus, memory-mapped from the cache directory."""
+
+    def __init__(self, columns):
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.columns['content'])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def record(self, index):
+        return {name: column[index] for name, column in self.columns.items()}
+
+    def to_frame(self):
+        import pandas as pd
+
+        return pd.DataFrame({name: list(column) for name, column in self.columns.items()})
+
+    @classmethod
+    def open(cls, cache_dir):
+        columns = {}
+        for name in COLUMNS:
+            data = np.load(os.path.join(cache_dir, f'{name}.data.npy'), mmap_mode='r')
+            offsets = np.load(os.path.join(cache_dir, f'{name}.offsets.npy'), mmap_mode='r')
+            columns[name] = StringColumn(data, offsets)
+        return cls(columns)
+
+
+def read_manifest(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, MANIFEST), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_cache(batches, cache_dir, files):
+    """Stream record batches into a new columnar cache at ``cache_dir``."""
+    parent = os.path.dirname(os.path.abspath(cache_dir))
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix='.corpus-', dir=parent)
+    try:
+        blobs = {name: open(os.path.join(tmp_dir, f'{name}.blob'), 'wb') for name in COLUMNS}
+        offsets = {name: [0] for name in COLUMNS}
+        rows = 0
+        for batch in batches:
+            for record in batch:
+                for name in COLUMNS:
+                    encoded = record[name].encode('utf-8')
+                    blobs[name].write(encoded)
+                    offsets[name].append(offsets[name][-1] + len(encoded))
+            rows += len(batch)
+        for name in COLUMNS:
+            blobs[name].close()
+            blob_path = os.path.join(tmp_dir, f'{name}.blob')
+            data = np.fromfile(blob_path, dtype=np.uint8)
+            np.save(os.path.join(tmp_dir, f'{name}.data.npy'), data)
+            np.save(os.path.join(tmp_dir, f'{name}.offsets.npy'), np.asarray(offsets[name], dtype=np.int64))
+            os.remove(blob_path)
+        with open(os.path.join(tmp_dir, MANIFEST), 'w') as f:
+            json.dump({'format': CACHE_FORMAT, 'rows': rows, 'files': files}, f)
+
+        # Swap the finished cache into place
+        if os.path.exists(cache_dir):
+            shutil.rmtree(cache_dir)
+        os.replace(tmp_dir, cache_dir)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    logger.info(f"Wrote corpus cache with {rows} records to {cache_dir}")
+    return rows
+
+
+def load_corpus(folder=None, cache_dir=None, processes=None):
+    """Return the corpus as a :class:`CorpusTable`, rebuilding the cache only if sources changed."""
+    cache_dir = str(cache_dir or get_setting('CORPUS_CACHE_DIR'))
+    paths = corpus_files(folder)
+    files = fingerprint(paths)
+    manifest = read_manifest(cache_dir)
+    if not manifest or manifest.get('format') != CACHE_FORMAT or manifest.get('files') != files:
+        logger.info(f"Corpus cache at {cache_dir} is missing or stale; rebuilding")
+        write_cache(iter_corpus(paths=paths, processes=processes), cache_dir, files)
+    return CorpusTable.open(cache_dir)
@@ -0,0 +1,196 @@
+"""Offline analysis of the whole ``backend/dreams`` corpus.
+
+The corpus is split into fixed row ranges (shards) that worker processes
+analyze independently: themes and BERT embeddings in batches, then LLM
+analyses with bounded concurrency.  Each finished shard is written
+atomically to ``shard-NNNNN.npz``, which doubles as the checkpoint: a
+rerun skips shards that already exist.  Once every shard is done they are
+merged into one columnar result (``.npy`` files, like the corpus cache)
+readable with :class:`AnalysisTable`.
+"""
+import asyncio
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from .conf import get_setting
+from .corpus import CorpusTable, StringColumn
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = 'manifest.json'
+RESULT_DIR = 'result'
+STRING_COLUMNS = ('themes', 'analysis')
+
+
+def shard_ranges(rows, shard_size):
+    """``[(shard, start, end), ...]`` covering ``rows`` rows."""
+    return [
+        (shard, start, min(start + shard_size, rows))
+        for shard, start in enumerate(range(0, rows, shard_size))
+    ]
+
+
+def shard_path(output_dir, shard):
+    return os.path.join(output_dir, f'shard-{shard:05d}.npz')
+
+
+def encode_strings(values):
+    """UTF-8 blob and offsets for a list of strings (the corpus cache layout)."""
+    encoded = [value.encode('utf-8') for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(value) for value in encoded])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def read_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, MANIFEST), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_manifest(output_dir, manifest):
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, MANIFEST), 'w') as f:
+        json.dump(manifest, f)
+
+
+def write_shard(output_dir, shard, rows, themes, analyses, embeddings):
+    columns = {'rows': np.asarray(rows, dtype=np.int64), 'embeddings': np.asarray(embeddings, dtype=np.float32)}
+    for name, values in (('themes', [json.dumps(t, ensure_ascii=False) for t in themes]), ('analysis', analyses)):
+        columns[f'{name}_data'], columns[f'{name}_offsets'] = encode_strings(values)
+    fd, tmp_path = tempfile.mkstemp(prefix='.shard-', suffix='.npz', dir=output_dir)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **columns)
+        os.replace(tmp_path, shard_path(output_dir, shard))
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+_worker = None
+
+
+def init_worker(offline, torch_threads):
+    """Process-pool initializer: one analyzer (and BERT copy) per worker process."""
+    global _worker
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()  # spawned rather than forked
+
+    import torch
+    from .ai_processor import DreamAnalyzer
+    from .fakes import FakeAsyncOpenAI
+
+    _worker = DreamAnalyzer(client=FakeAsyncOpenAI() if offline else None)
+    _worker.warm_up()
+    # Workers share the machine, so each gets its slice of the cores
+    torch.set_num_threads(torch_threads)
+
+
+def analyze_shard(cache_dir, output_dir, shard, start, end, llm_concurrency):
+    """Analyze corpus rows ``[start, end)`` and write them as one shard; returns ``(shard, rows)``."""
+    from .symbol_scanner import get_symbol_scanner
+
+    texts = CorpusTable.open(cache_dir)['content'][start:end]
+    scanner = get_symbol_scanner()
+    themes = [scanner.themes(text, limit=get_setting('MAX_THEMES')) for text in texts]
+    embeddings = _worker.embed_many(texts)
+
+    async def analyze_all():
+        semaphore = asyncio.Semaphore(llm_concurrency)
+
+        async def analyze(text, text_themes):
+            async with semaphore:
+                return await _worker.get_openai_analysis(text, text_themes)
+
+        return await asyncio.gather(*(analyze(text, t) for text, t in zip(texts, themes)))
+
+    analyses = asyncio.run(analyze_all())
+    write_shard(output_dir, shard, range(start, end), themes, analyses, embeddings)
+    return shard, end - start
+
+
+def merge_shards(output_dir, shards):
+    """Concatenate the shard files into the columnar result at ``output_dir/result``."""
+    tmp_dir = tempfile.mkdtemp(prefix='.result-', dir=output_dir)
+    try:
+        parts = {'rows': [], 'embeddings': []}
+        strings = {name: [] for name in STRING_COLUMNS}
+        for shard in shards:
+            with np.load(shard_path(output_dir, shard)) as data:
+                parts['rows'].append(data['rows'])
+                parts['embeddings'].append(data['embeddings'])
+                for name in STRING_COLUMNS:
+                    strings[name].append((data[f'{name}_data'], data[f'{name}_offsets']))
+        for name, arrays in parts.items():
+            np.save(os.path.join(tmp_dir, f'{name}.npy'), np.concatenate(arrays))
+        for name, pieces in strings.items():
+            blobs, offsets, base = [], [np.zeros(1, dtype=np.int64)], 0
+            for blob, shard_offsets in pieces:
+                blobs.append(blob)
+                offsets.append(shard_offsets[1:] + base)
+                base += len(blob)
+            np.save(os.path.join(tmp_dir, f'{name}.data.npy'), np.concatenate(blobs))
+            np.save(os.path.join(tmp_dir, f'{name}.offsets.npy'), np.concatenate(offsets))
+        shutil.copy(os.path.join(output_dir, MANIFEST), os.path.join(tmp_dir, MANIFEST))
+
+        result_dir = os.path.join(output_dir, RESULT_DIR)
+        if os.path.exists(result_dir):
+            shutil.rmtree(result_dir)
+        os.replace(tmp_dir, result_dir)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    return result_dir
+
+
+class AnalysisTable:
+    """Memory-mapped view of a merged analysis result."""
+
+    def __init__(self, rows, embeddings, themes, analysis, meta):
+        self.rows = rows
+        self.embeddings = embeddings
+        self._themes = themes
+        self.analysis = analysis
+        self.meta = meta
+
+    def __len__(self):
+        return len(self.rows)
+
+    def themes(self, index):
+        return json.loads(self._themes[index])
+
+    def record(self, index):
+        return {
+            'row': int(self.rows[index]),
+            'themes': self.themes(index),
+            'analysis': self.analysis[index],
+        }
+
+    @classmethod
+    def open(cls, result_dir):
+        def column(name):
+            return StringColumn(
+                np.load(os.path.join(result_dir, f'{name}.data.npy'), mmap_mode='r'),
+                np.load(os.path.join(result_dir, f'{name}.offsets.npy'), mmap_mode='r'),
+            )
+
+        with open(os.path.join(result_dir, MANIFEST), 'r') as f:
+            meta = json.load(f)
+        return cls(
+            np.load(os.path.join(result_dir, 'rows.npy'), mmap_mode='r'),
+            np.load(os.path.join(result_dir, 'embeddings.npy'), mmap_mode='r'),
+            column('themes'),
+            column('analysis'),
+            meta,
+        )
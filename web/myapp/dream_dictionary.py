@@ -0,0 +1,200 @@
+"""Parse-once, pre-serialized dream dictionary.
+
+The dictionary CSV is parsed a single time per process and kept as
+ready-to-send JSON bytes (plus compressed variants).  The file's mtime and
+size are checked on every access, so editing the CSV is picked up without a
+restart.
+"""
+import bisect
+import csv
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
+from django.utils.cache import patch_vary_headers
+
+from .conf import get_setting
+
+logger = logging.getLogger(__name__)
+
+
+class DictionarySnapshot:
+    """Immutable, pre-encoded view of one version of the CSV."""
+
+    def __init__(self, entries, version):
+        self.version = version
+        self.entries = entries
+        # One JSON fragment per entry so pages can be joined without re-encoding
+        self.fragments = [
+            json.dumps({'symbol': symbol, 'interpretation': interpretation},
+                       ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            for symbol, interpretation in entries
+        ]
+        self.body = b'[' + b','.join(self.fragments) + b']'
+        self.etag_hash = hashlib.sha256(self.body).hexdigest()[:32]
+        self.gzip_body = gzip.compress(self.body, compresslevel=6, mtime=0)
+        self.brotli_body = brotli.compress(self.body) if brotli else None
+        # Case-folded keys sorted for bisecting on ?prefix=
+        self._prefix_index = sorted((symbol.casefold(), i) for i, (symbol, _) in enumerate(entries))
+        self._prefix_keys = [key for key, _ in self._prefix_index]
+
+    @classmethod
+    def load(cls, path, version):
+        entries = []
+        with open(path, 'r', encoding='utf-8-sig', newline='') as file:
+            csv_reader = csv.reader(file)
+            next(csv_reader, None)  # header
+            for row in csv_reader:
+                if len(row) >= 2:
+                    symbol = row[0].strip()
+                    interpretation = row[1].strip()
+                    if symbol:
+                        entries.append((symbol, interpretation))
+        logger.info(f"Loaded {len(entries)} dream symbols from {path}")
+        return cls(entries, version)
+
+    def etag(self, variant=''):
+        """Strong ETag for the full body or a derived representation."""
+        if variant:
+            return f'"{self.etag_hash}-{variant}"'
+        return f'"{self.etag_hash}"'
+
+    def matching_indexes(self, prefix):
+        """Entry indexes whose symbol starts with ``prefix`` (case-insensitive), in CSV order."""
+        prefix = prefix.casefold()
+        start = bisect.bisect_left(self._prefix_keys, prefix)
+        indexes = []
+        for key, index in self._prefix_index[start:]:
+            if not key.startswith(prefix):
+                break
+            indexes.append(index)
+        indexes.sort()
+        return indexes
+
+    def page(self, offset=0, limit=None, prefix=''):
+        """Return ``(body, total)`` for a filtered/paged slice of the dictionary."""
+        if prefix:
+            fragments = [self.fragments[i] for i in self.matching_indexes(prefix)]
+        else:
+            fragments = self.fragments
+        total = len(fragments)
+        end = total if limit is None else offset + limit
+        return b'[' + b','.join(fragments[offset:end]) + b']', total
+
+
+class DreamDictionary:
+    """Process-wide holder that reloads the snapshot when the CSV changes."""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    def snapshot(self):
+        st = os.stat(self.path)
+        version = (st.st_mtime_ns, st.st_size)
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or snapshot.version != version:
+                snapshot = DictionarySnapshot.load(self.path, version)
+                self._snapshot = snapshot
+        return snapshot
+
+
+def etag_matches(if_none_match, etag):
+    """Weak comparison of an If-None-Match header against ``etag``."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    target = etag[2:] if etag.startswith('W/') else etag
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == target:
+            return True
+    return False
+
+
+def _parse_page_params(params):
+    offset = params.get('offset')
+    limit = params.get('limit')
+    offset = int(offset) if offset not in (None, '') else 0
+    limit = int(limit) if limit not in (None, '') else None
+    if offset < 0 or (limit is not None and limit < 0):
+        raise ValueError('offset and limit must be non-negative')
+    return offset, limit, params.get('prefix', '').strip()
+
+
+def _accepted_encodings(request):
+    header = request.headers.get('Accept-Encoding', '')
+    encodings = set()
+    for part in header.split(','):
+        name, _, params = part.strip().partition(';')
+        if params.strip().replace(' ', '') in ('q=0', 'q=0.0'):
+            continue
+        encodings.add(name.strip().lower())
+    return encodings
+
+
+def dictionary_response(request, dictionary):
+    """Build the HTTP response for ``dictionary`` honouring paging, ETags and compression."""
+    try:
+        offset, limit, prefix = _parse_page_params(request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': f'Invalid paging parameters: {e}'}, status=400)
+
+    snapshot = dictionary.snapshot()
+    content_encoding = None
+    if offset or limit is not None or prefix:
+        body, total = snapshot.page(offset, limit, prefix)
+        etag = snapshot.etag(hashlib.sha256(
+            f'{offset}:{limit}:{prefix.casefold()}'.encode('utf-8')).hexdigest()[:12])
+    else:
+        total = len(snapshot.fragments)
+        encodings = _accepted_encodings(request)
+        if snapshot.brotli_body is not None and 'br' in encodings:
+            body, content_encoding, etag = snapshot.brotli_body, 'br', snapshot.etag('br')
+        elif 'gzip' in encodings:
+            body, content_encoding, etag = snapshot.gzip_body, 'gzip', snapshot.etag('gzip')
+        else:
+            body, etag = snapshot.body, snapshot.etag()
+
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type='application/json')
+        if content_encoding:
+            response['Content-Encoding'] = content_encoding
+        response['X-Total-Count'] = str(total)
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache'
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+_dictionaries = {}
+_dictionaries_lock = threading.Lock()
+
+
+def get_shared_dictionary(path=None):
+    """Return the shared :class:`DreamDictionary` for ``path`` (default ``DREAM_DICT_PATH``)."""
+    path = str(path or get_setting('DREAM_DICT_PATH'))
+    dictionary = _dictionaries.get(path)
+    if dictionary is None:
+        with _dictionaries_lock:
+            dictionary = _dictionaries.setdefault(path, DreamDictionary(path))
+    return dictionary
@@ -0,0 +1,166 @@
+"""Content-addressed embedding cache.
+
+Embeddings are keyed by ``sha256(model, normalised text)`` and stored as
+float32 vectors in two tiers: an in-memory LRU in front of a SQLite file
+shared by every process on the host.  Used by both the BERT path in
+``DreamAnalyzer`` and the OpenAI embeddings in ``backend/Torch.py``.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import unicodedata
+
+import numpy as np
+
+from .caching import LRUCache
+from .conf import get_setting
+from .metrics import register_collector
+
+# Keys per SELECT ... IN (...) to stay under SQLite's bound-parameter limit
+_SQL_CHUNK = 500
+
+
+def normalize_text(text):
+    """Canonical form used for hashing: NFC, trimmed, whitespace collapsed."""
+    return ' '.join(unicodedata.normalize('NFC', text).split())
+
+
+def embedding_key(model, text):
+    digest = hashlib.sha256()
+    digest.update(model.encode('utf-8'))
+    digest.update(b'\x00')
+    digest.update(normalize_text(text).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class EmbeddingCache:
+    """Two-tier (memory LRU + SQLite) store of float32 embedding vectors."""
+
+    def __init__(self, path, memory_items=4096):
+        self.path = str(path)
+        self.memory = LRUCache(memory_items)
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.disk_hits = 0
+        self.misses = 0
+        self.writes = 0
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+
+    def _connection(self):
+        # One connection per thread (and per process after a fork)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS embeddings ('
+                ' key TEXT PRIMARY KEY, model TEXT NOT NULL, dim INTEGER NOT NULL, vector BLOB NOT NULL)'
+            )
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def get(self, model, text):
+        """Cached vector for ``text`` under ``model``, or ``None``."""
+        return self.get_many(model, [text])[0]
+
+    def get_many(self, model, texts):
+        keys = [embedding_key(model, text) for text in texts]
+        results = [self.memory.get(key) for key in keys]
+        missing = [i for i, vector in enumerate(results) if vector is None]
+        if missing:
+            found = {}
+            conn = self._connection()
+            for start in range(0, len(missing), _SQL_CHUNK):
+                chunk = [keys[i] for i in missing[start:start + _SQL_CHUNK]]
+                rows = conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                found.update((key, np.frombuffer(blob, dtype=np.float32)) for key, blob in rows)
+            for i in missing:
+                vector = found.get(keys[i])
+                if vector is not None:
+                    self.memory.set(keys[i], vector)
+                    results[i] = vector
+            self._count('disk_hits', len(found))
+            self._count('misses', len(missing) - len(found))
+        return results
+
+    def put(self, model, text, vector):
+        self.put_many(model, [text], [vector])
+
+    def put_many(self, model, texts, vectors):
+        rows = []
+        for text, vector in zip(texts, vectors):
+            key = embedding_key(model, text)
+            vector = np.asarray(vector, dtype=np.float32)
+            self.memory.set(key, vector)
+            rows.append((key, model, vector.shape[0], vector.tobytes()))
+        conn = self._connection()
+        with conn:
+            conn.executemany('INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)', rows)
+        self._count('writes', len(rows))
+
+    def get_or_compute(self, model, texts, compute):
+        """Vectors for ``texts``, calling ``compute(missing_texts)`` once for the misses."""
+        results = self.get_many(model, texts)
+        missing = [i for i, vector in enumerate(results) if vector is None]
+        if missing:
+            computed = compute([texts[i] for i in missing])
+            self.put_many(model, [texts[i] for i in missing], computed)
+            for i, vector in zip(missing, computed):
+                results[i] = np.asarray(vector, dtype=np.float32)
+        return results
+
+    def stats(self):
+        memory = self.memory.stats()
+        lookups = memory['hits'] + self.disk_hits + self.misses
+        return {
+            'memory_hits': memory['hits'],
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'writes': self.writes,
+            'memory_items': memory['items'],
+            'hit_rate': (memory['hits'] + self.disk_hits) / lookups if lookups else 0.0,
+        }
+
+
+def _collect_metrics():
+    stats = _cache.stats()
+    return [
+        ('dream_cache_hits_total', {'cache': 'embedding'}, stats['memory_hits'] + stats['disk_hits']),
+        ('dream_cache_misses_total', {'cache': 'embedding'}, stats['misses']),
+        ('dream_cache_items', {'cache': 'embedding'}, stats['memory_items']),
+    ]
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache():
+    """Process-wide :class:`EmbeddingCache` at ``EMBEDDING_CACHE_PATH``."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = EmbeddingCache(
+                    get_setting('EMBEDDING_CACHE_PATH'),
+                    memory_items=get_setting('EMBEDDING_CACHE_MEMORY_ITEMS'),
+                )
+                register_collector(_collect_metrics)
+    return _cache
+
+
+def reset_embedding_cache():
+    """Drop the process-wide cache; the next :func:`get_embedding_cache` opens one from current settings."""
+    global _cache
+    with _cache_lock:
+        _cache = None
@@ -0,0 +1,90 @@
+"""Shared executors that keep blocking work off the request event loops.
+
+* CPU-bound model inference runs on a bounded thread pool sized to the
+  cores available to this process, with torch intra-op threads split
+  between the pool's workers.
+* Network I/O to the LLM runs on one long-lived background event loop, so
+  its async HTTP client and keep-alive connections are reused across
+  requests no matter which loop (or sync thread) the caller is on.
+"""
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .conf import get_setting
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_inference_executor = None
+_io_loop = None
+_pid = None
+
+
+def available_cores():
+    """Number of CPUs this process may run on."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def inference_workers():
+    """Configured size of the inference pool (defaults to 1 worker per 4 cores)."""
+    workers = get_setting('INFERENCE_WORKERS')
+    if not workers:
+        workers = max(1, available_cores() // 4)
+    return workers
+
+
+def configure_torch_threads():
+    """Split the available cores between the inference workers' intra-op pools."""
+    import torch
+
+    threads = get_setting('TORCH_THREADS') or max(1, available_cores() // inference_workers())
+    torch.set_num_threads(threads)
+    logger.info(f"Torch intra-op threads: {threads} ({inference_workers()} inference workers)")
+    return threads
+
+
+def _reset_after_fork():
+    global _inference_executor, _io_loop, _pid
+    if _pid != os.getpid():
+        # Threads do not survive fork; start fresh in the child
+        _inference_executor = None
+        _io_loop = None
+        _pid = os.getpid()
+
+
+def get_inference_executor():
+    """Bounded thread pool for CPU-bound model work."""
+    global _inference_executor
+    with _lock:
+        _reset_after_fork()
+        if _inference_executor is None:
+            _inference_executor = ThreadPoolExecutor(
+                max_workers=inference_workers(), thread_name_prefix='inference')
+        return _inference_executor
+
+
+def _get_io_loop():
+    global _io_loop
+    with _lock:
+        _reset_after_fork()
+        if _io_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='llm-io-loop', daemon=True).start()
+            _io_loop = loop
+        return _io_loop
+
+
+def run_io(coro):
+    """Schedule ``coro`` on the shared I/O loop; returns a concurrent future."""
+    return asyncio.run_coroutine_threadsafe(coro, _get_io_loop())
+
+
+async def await_io(coro):
+    """Run ``coro`` on the shared I/O loop and await it from any other loop."""
+    return await asyncio.wrap_future(run_io(coro))
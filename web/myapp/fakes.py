@@ -0,0 +1,275 @@
+"""Deterministic stand-ins for external services, for offline runs and benchmarks.
+
+:class:`FakeAsyncOpenAI` implements the slice of the ``AsyncOpenAI``
+interface the analyzer uses (``chat.completions.create``, with and without
+``stream=True``).  Its reply is derived from a hash of the prompt, so
+the same input always gets the same analysis.  :class:`FakeOpenAIServer`
+serves the same replies over HTTP as an OpenAI-compatible API with
+configurable per-model latency and errors, and :class:`FakePostgrest`
+serves canned Dreams rows over HTTP in place of Supabase.
+"""
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlsplit
+
+OFFLINE_MODEL = 'offline/fake-llm'
+
+_PHRASES = (
+    'a wish for control over a changing situation',
+    'unresolved feelings about a close relationship',
+    'anxiety about an upcoming change',
+    'curiosity about a part of yourself you rarely show',
+    'a need for rest and safety',
+    'excitement about a new beginning',
+    'a memory resurfacing in symbolic form',
+    'tension between duty and desire',
+)
+
+
+def fake_analysis(prompt):
+    """Deterministic analysis text for ``prompt``"""
+    digest = hashlib.sha256(prompt.encode('utf-8')).digest()
+    picks = [_PHRASES[b % len(_PHRASES)] for b in digest[:3]]
+    return (
+        f"1. Key symbols point to {picks[0]}.\n"
+        f"2. The emotional undertone suggests {picks[1]}.\n"
+        f"3. One interpretation is {picks[2]}.\n"
+        f"4. (offline analysis {digest.hex()[:12]})"
+    )
+
+
+def _completion(model, content, prompt):
+    return SimpleNamespace(
+        model=model,
+        choices=[SimpleNamespace(
+            index=0, finish_reason='stop',
+            message=SimpleNamespace(role='assistant', content=content),
+        )],
+        usage=SimpleNamespace(
+            prompt_tokens=len(prompt.split()),
+            completion_tokens=len(content.split()),
+            total_tokens=len(prompt.split()) + len(content.split()),
+        ),
+    )
+
+
+class _FakeCompletions:
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+
+    async def create(self, model, messages, stream=False, **kwargs):
+        self.calls += 1
+        prompt = messages[-1]['content']
+        content = fake_analysis(prompt)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if not stream:
+            return _completion(model, content, prompt)
+        return self._stream(model, content)
+
+    async def _stream(self, model, content):
+        for word in content.split(' '):
+            yield SimpleNamespace(
+                model=model,
+                choices=[SimpleNamespace(index=0, delta=SimpleNamespace(content=word + ' '))],
+            )
+            await asyncio.sleep(0)
+
+
+class FakeAsyncOpenAI:
+    """Offline ``AsyncOpenAI`` replacement; ``latency`` (seconds) is added to every call."""
+
+    def __init__(self, latency=0.0):
+        self.chat = SimpleNamespace(completions=_FakeCompletions(latency))
+
+    @property
+    def calls(self):
+        return self.chat.completions.calls
+
+
+def fake_dreams(count, user_id='benchmark-user'):
+    """``count`` deterministic Dreams rows, newest first."""
+    return [
+        {
+            'dream_id': count - i,
+            'user_id': user_id,
+            'dream_text': f'I was walking through a house with {i % 7 + 2} doors and a river outside. ' * 4,
+            'themes_symbols': ['House', 'Door', 'River', 'Walking'][:i % 4 + 1],
+            'interpretation': fake_analysis(str(i)),
+            'timestamp': f'2024-01-{28 - i % 28:02d}T{i % 24:02d}:00:00+00:00',
+        }
+        for i in range(count)
+    ]
+
+
+class _LocalServer:
+    """Threaded HTTP server on a free localhost port, usable as a context manager."""
+
+    def __init__(self, handler):
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class FakeOpenAIServer(_LocalServer):
+    """Local OpenAI-compatible ``/chat/completions`` endpoint.
+
+    ``latency`` (seconds; a number or ``{model: seconds}``) is slept
+    before each reply and ``errors`` (``{model: HTTP status}``) makes a
+    model fail; both can be changed while the server runs.
+    :attr:`requests` counts requests per model.  Point an ``AsyncOpenAI``
+    client at :attr:`base_url`.
+    """
+
+    def __init__(self, latency=0.0, errors=None):
+        self.latency = latency
+        self.errors = dict(errors or {})
+        self.requests = Counter()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, content_type, body):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                request = json.loads(self.rfile.read(length))
+                model = request['model']
+                fake.requests[model] += 1
+                latency = fake.latency.get(model, 0.0) if isinstance(fake.latency, dict) else fake.latency
+                time.sleep(latency)
+                try:
+                    if model in fake.errors:
+                        error = {'error': {'message': f'{model} is unavailable', 'code': fake.errors[model]}}
+                        self._send(fake.errors[model], 'application/json', json.dumps(error).encode('utf-8'))
+                        return
+                    prompt = request['messages'][-1]['content']
+                    content = fake_analysis(prompt)
+                    base = {'id': f'chatcmpl-{fake.requests.total()}', 'created': int(time.time()), 'model': model}
+                    if not request.get('stream'):
+                        completion = dict(base, object='chat.completion', choices=[{
+                            'index': 0, 'finish_reason': 'stop',
+                            'message': {'role': 'assistant', 'content': content},
+                        }], usage={
+                            'prompt_tokens': len(prompt.split()),
+                            'completion_tokens': len(content.split()),
+                            'total_tokens': len(prompt.split()) + len(content.split()),
+                        })
+                        self._send(200, 'application/json', json.dumps(completion).encode('utf-8'))
+                        return
+                    events = [
+                        dict(base, object='chat.completion.chunk', choices=[{
+                            'index': 0, 'delta': {'content': word + ' '}, 'finish_reason': None,
+                        }])
+                        for word in content.split(' ')
+                    ]
+                    body = ''.join(f'data: {json.dumps(event)}\n\n' for event in events) + 'data: [DONE]\n\n'
+                    self._send(200, 'text/event-stream', body.encode('utf-8'))
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the client gave up (timeout or lost hedge race)
+
+        super().__init__(Handler)
+
+    @property
+    def base_url(self):
+        return f'{self.url}/v1'
+
+
+class FakePostgrest(_LocalServer):
+    """Local HTTP stand-in for Supabase's PostgREST API.
+
+    GET returns the canned ``rows`` (honouring ``select`` and ``limit``;
+    filters and ordering are ignored), POST echoes inserted rows with new
+    ids and PATCH echoes the update.  Point ``SUPABASE['URL']`` at
+    :attr:`url` to exercise the real client, pool and response handling.
+    """
+
+    def __init__(self, rows=(), latency=0.0):
+        self.rows = list(rows)
+        self.latency = latency
+        self.requests = 0
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True  # headers and body go out as separate writes
+
+            def log_message(self, *args):
+                pass
+
+            def _body(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                return json.loads(self.rfile.read(length) or b'null')
+
+            def _reply(self, payload, status=200):
+                fake.requests += 1
+                if fake.latency:
+                    time.sleep(fake.latency)
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                self._body()
+                params = parse_qs(urlsplit(self.path).query)
+                rows = fake.rows[:int(params['limit'][0])] if 'limit' in params else fake.rows
+                select = params.get('select', ['*'])[0]
+                if select != '*':
+                    columns = [column.strip() for column in select.split(',')]
+                    rows = [{column: row.get(column) for column in columns} for row in rows]
+                self._reply(rows)
+
+            def do_POST(self):
+                rows = self._body()
+                rows = rows if isinstance(rows, list) else [rows]
+                next_id = max((row['dream_id'] for row in fake.rows), default=0) + 1
+                saved = [
+                    dict(row, dream_id=next_id + i, timestamp='2024-01-01T00:00:00+00:00')
+                    for i, row in enumerate(rows)
+                ]
+                self._reply(saved, status=201)
+
+            def do_PATCH(self):
+                update = self._body()
+                self._reply([dict(fake.rows[0] if fake.rows else {}, **update)])
+
+        super().__init__(Handler)
@@ -0,0 +1,214 @@
+"""Database-backed queue for background dream analysis.
+
+Jobs live in the ``AnalysisJob`` table, so the queue needs no broker.
+Workers claim a job with a conditional UPDATE (safe on SQLite and
+Postgres alike) that also sets a lease; a job whose lease expires
+(worker crashed or hung) becomes claimable again.  Failures are retried
+with exponential backoff up to ``JOB_MAX_ATTEMPTS``.  A job's result
+(status and rollup counts) is written only while its worker still holds
+the lease, so a reclaimed job is counted once.
+
+Web processes with ``JOB_IN_PROCESS_WORKERS`` start their worker threads
+on their first request, so jobs queued before a restart are picked up
+without waiting for a new one.
+"""
+import logging
+import random
+import threading
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from django.core.signals import request_started
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .conf import get_setting
+from .models import AnalysisJob
+from .rollups import record_dreams
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_analysis(user, dream_id, dream_text):
+    """Queue analysis of a dream already saved to Supabase"""
+    job = AnalysisJob.objects.create(user=user, dream_id=dream_id, dream_text=dream_text)
+    ensure_in_process_workers()
+    return job
+
+
+def enqueue_analyses(user, dreams):
+    """Queue analysis of many saved dreams, given as ``(dream_id, dream_text)`` pairs"""
+    jobs = AnalysisJob.objects.bulk_create([
+        AnalysisJob(user=user, dream_id=dream_id, dream_text=dream_text) for dream_id, dream_text in dreams
+    ])
+    ensure_in_process_workers()
+    return jobs
+
+
+def queue_depth():
+    """Jobs waiting to run (including retries not yet due)"""
+    return AnalysisJob.objects.filter(status=AnalysisJob.STATUS_QUEUED).count()
+
+
+def _fail_exhausted(now):
+    # Jobs whose lease expired on their last attempt are not retried again
+    AnalysisJob.objects.filter(
+        status=AnalysisJob.STATUS_RUNNING,
+        lease_expires_at__lt=now,
+        attempts__gte=get_setting('JOB_MAX_ATTEMPTS'),
+    ).update(status=AnalysisJob.STATUS_FAILED, error='Lease expired on final attempt', updated_at=now)
+
+
+def claim_job():
+    """Claim the next runnable job for this worker, or return ``None``"""
+    now = timezone.now()
+    _fail_exhausted(now)
+    runnable = Q(status=AnalysisJob.STATUS_QUEUED, available_at__lte=now) | Q(
+        status=AnalysisJob.STATUS_RUNNING, lease_expires_at__lt=now)
+    candidates = AnalysisJob.objects.filter(runnable).order_by('available_at') \
+        .values_list('pk', 'status', 'attempts')[:10]
+    lease = now + timedelta(seconds=get_setting('JOB_VISIBILITY_TIMEOUT'))
+    for pk, status, attempts in candidates:
+        # Only one worker's UPDATE can match the (status, attempts) it saw
+        claimed = AnalysisJob.objects.filter(pk=pk, status=status, attempts=attempts).update(
+            status=AnalysisJob.STATUS_RUNNING,
+            attempts=F('attempts') + 1,
+            lease_expires_at=lease,
+            progress='claimed',
+            updated_at=now,
+        )
+        if claimed:
+            return AnalysisJob.objects.get(pk=pk)
+    return None
+
+
+def _owned(job):
+    """Queryset matching ``job`` only while this worker still holds its lease"""
+    return AnalysisJob.objects.filter(pk=job.pk, status=AnalysisJob.STATUS_RUNNING, attempts=job.attempts)
+
+
+def set_progress(job, stage):
+    _owned(job).update(
+        progress=stage,
+        lease_expires_at=timezone.now() + timedelta(seconds=get_setting('JOB_VISIBILITY_TIMEOUT')),
+        updated_at=timezone.now(),
+    )
+
+
+def complete_job(job, dream):
+    """Store ``dream`` as the result and count its themes; ``False`` if the lease was lost"""
+    with transaction.atomic():
+        if not _owned(job).update(
+                status=AnalysisJob.STATUS_SUCCEEDED, progress='done', result=dream,
+                error='', lease_expires_at=None, updated_at=timezone.now()):
+            return False
+        # The dream was counted when it was saved; its themes arrive now
+        record_dreams(job.user.username, [dream], count_dreams=False)
+    return True
+
+
+def fail_job(job, error):
+    """Schedule a retry with jittered exponential backoff, or give up"""
+    now = timezone.now()
+    if job.attempts >= get_setting('JOB_MAX_ATTEMPTS'):
+        _owned(job).update(
+            status=AnalysisJob.STATUS_FAILED, error=error, lease_expires_at=None, updated_at=now)
+        return
+    delay = get_setting('JOB_RETRY_BACKOFF') * 2 ** (job.attempts - 1)
+    delay *= random.uniform(0.5, 1.5)
+    _owned(job).update(
+        status=AnalysisJob.STATUS_QUEUED, error=error, lease_expires_at=None,
+        available_at=now + timedelta(seconds=delay), updated_at=now)
+
+
+def run_job(job):
+    """Run the BERT + LLM pipeline for ``job``, write the result to Supabase and return the dream"""
+    from .ai_processor import get_dream_analyzer
+    from .pagination import DREAM_FIELDS, serialize_dream
+    from .replica import mirror
+    from .supabase_client import get_supabase
+
+    analyzer = get_dream_analyzer()
+    set_progress(job, 'themes')
+    themes = async_to_sync(analyzer.extract_themes)(job.dream_text)
+    set_progress(job, 'analysis')
+    analysis = async_to_sync(analyzer.get_openai_analysis)(job.dream_text, themes)
+    set_progress(job, 'saving')
+    response = get_supabase().table('Dreams').update({
+        'themes_symbols': themes,
+        'interpretation': analysis,
+    }).eq('dream_id', job.dream_id).execute()
+    if not response.data:
+        raise Exception(f'Dream {job.dream_id} no longer exists')
+    mirror(response.data)
+    return serialize_dream(response.data[0], DREAM_FIELDS)
+
+
+def process_next_job():
+    """Claim and run one job; returns ``False`` when the queue was empty"""
+    job = claim_job()
+    if job is None:
+        return False
+    try:
+        if not complete_job(job, run_job(job)):
+            logger.warning(f"Analysis job {job.pk} lost its lease before finishing; its result was dropped")
+    except Exception as e:
+        logger.error(f"Analysis job {job.pk} failed (attempt {job.attempts}): {str(e)}")
+        fail_job(job, str(e))
+    return True
+
+
+class WorkerPool:
+    """Fixed number of threads draining the job queue; the size is the concurrency limit"""
+
+    def __init__(self, concurrency):
+        self.concurrency = concurrency
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for i in range(self.concurrency):
+            thread = threading.Thread(target=self._work, name=f'analysis-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _work(self):
+        poll_interval = get_setting('JOB_POLL_INTERVAL')
+        while not self._stop.is_set():
+            try:
+                busy = process_next_job()
+            except Exception as e:
+                logger.error(f"Analysis worker error: {str(e)}")
+                busy = False
+            finally:
+                close_old_connections()
+            if not busy:
+                self._stop.wait(poll_interval)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def ensure_in_process_workers():
+    """Start ``JOB_IN_PROCESS_WORKERS`` worker threads in this process, once"""
+    global _pool
+    concurrency = get_setting('JOB_IN_PROCESS_WORKERS')
+    if not concurrency or _pool is not None:
+        return
+    with _pool_lock:
+        if _pool is None:
+            _pool = WorkerPool(concurrency)
+            _pool.start()
+
+
+def start_workers_on_request(sender, **kwargs):
+    """``request_started`` receiver: start the in-process workers, then disconnect"""
+    request_started.disconnect(start_workers_on_request)
+    ensure_in_process_workers()
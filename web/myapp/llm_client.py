@@ -0,0 +1,321 @@
+"""Chat completions with deadlines, retries, hedging and circuit breakers.
+
+:func:`complete` asks ``LLM_MODEL`` for a completion and gives up once
+``LLM_DEADLINE`` seconds have passed.  Each request gets at most
+``LLM_TIMEOUT`` seconds.  A failed attempt is retried up to
+``LLM_MAX_RETRIES`` times, with jittered exponential backoff, while the
+deadline allows.
+
+With ``LLM_FALLBACK_MODELS`` set, a request still unanswered after
+``LLM_HEDGE_AFTER`` seconds is hedged: the same prompt goes to the next
+fallback model, the first answer wins and the other request is
+cancelled.  ``'p95'`` hedges at this process's observed p95 for the
+model.  A model that errors is failed over to the next one straight away.
+
+Every model has a :class:`CircuitBreaker`.  After
+``LLM_BREAKER_FAILURES`` consecutive failures the model is skipped for
+``LLM_BREAKER_COOLDOWN`` seconds; then a single trial request decides
+whether it is used again.
+
+The prompt and completion tokens of every answered request are counted
+per model (:func:`record_usage`).
+"""
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+
+import httpx
+from openai import AsyncOpenAI
+
+from .conf import get_setting
+from .metrics import local_quantile, observe, register_collector
+
+logger = logging.getLogger(__name__)
+
+OPENROUTER_BASE_URL = 'https://openrouter.ai/api/v1'
+EXTRA_HEADERS = {
+    "HTTP-Referer": "http://localhost:3000",  # Your site domain
+    "X-Title": "Dream Analyzer"
+}
+# Samples needed before the observed p95 is trusted as a hedging delay
+HEDGE_MIN_SAMPLES = 20
+
+
+class LLMUnavailable(Exception):
+    """No model could answer before the deadline."""
+
+
+def make_client(api_key=None, base_url=None):
+    """Async OpenAI client for OpenRouter with a pooled keep-alive HTTP session"""
+    return AsyncOpenAI(
+        api_key=api_key or os.getenv("OPENROUTER_API_KEY"),
+        base_url=base_url or os.getenv("OPENROUTER_BASE_URL") or OPENROUTER_BASE_URL,
+        timeout=get_setting('LLM_TIMEOUT'),
+        max_retries=0,  # retries are ours, so they respect the deadline and the breakers
+        http_client=httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=get_setting('LLM_MAX_CONNECTIONS'),
+                max_keepalive_connections=get_setting('LLM_MAX_CONNECTIONS'),
+            ),
+            timeout=get_setting('LLM_TIMEOUT'),
+        ),
+    )
+
+
+class CircuitBreaker:
+    """Closed -> open after ``failures`` consecutive errors -> one trial after ``cooldown`` seconds."""
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+    # Permit for a request sent while the breaker is closed
+    REGULAR = object()
+
+    def __init__(self, failures, cooldown):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._trial = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Permit to send a request now, or ``None``; an open breaker past its cooldown issues one trial permit."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return self.REGULAR
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = self.HALF_OPEN
+                self._trial = object()
+                return self._trial
+            return None
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self._trial = None
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failures:
+                if self.state != self.OPEN:
+                    logger.warning(f"Circuit breaker opened after {self.consecutive_failures} failures")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._trial = None
+
+    def release(self, permit):
+        """Give back the trial slot if ``permit`` holds it and its request was cancelled before it answered."""
+        with self._lock:
+            if self.state == self.HALF_OPEN and permit is self._trial:
+                self.state = self.OPEN
+                self._trial = None
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+_stats = {}  # (family, model, extra labels) -> count
+_stats_lock = threading.Lock()
+
+
+def get_breaker(model):
+    with _breakers_lock:
+        breaker = _breakers.get(model)
+        if breaker is None:
+            breaker = _breakers[model] = CircuitBreaker(
+                get_setting('LLM_BREAKER_FAILURES'), get_setting('LLM_BREAKER_COOLDOWN'))
+        return breaker
+
+
+def _count(family, model, amount=1, **labels):
+    key = (family, model, tuple(sorted(labels.items())))
+    with _stats_lock:
+        _stats[key] = _stats.get(key, 0) + amount
+
+
+def record_usage(model, prompt_tokens, completion_tokens):
+    """Count the tokens of one answered request"""
+    _count('dream_llm_tokens_total', model, prompt_tokens or 0, kind='prompt')
+    _count('dream_llm_tokens_total', model, completion_tokens or 0, kind='completion')
+    logger.debug(f"LLM request to {model}: {prompt_tokens} prompt + {completion_tokens} completion tokens")
+
+
+def _collect_metrics():
+    with _stats_lock:
+        samples = [
+            (family, dict(labels, service='llm', model=model), n)
+            for (family, model, labels), n in _stats.items()
+        ]
+    with _breakers_lock:
+        samples += [
+            ('dream_circuit_open', {'service': 'llm', 'model': model}, int(breaker.state != CircuitBreaker.CLOSED))
+            for model, breaker in _breakers.items()
+        ]
+    return samples
+
+
+register_collector(_collect_metrics)
+
+
+def _retryable(error):
+    # Client errors other than timeouts, conflicts and rate limits would fail again
+    status = getattr(error, 'status_code', None)
+    return status is None or status in (408, 409, 429) or status >= 500
+
+
+def _hedge_delay(model):
+    hedge_after = get_setting('LLM_HEDGE_AFTER')
+    if hedge_after == 'p95':
+        return local_quantile('dream_stage_duration_seconds', {'stage': 'llm_attempt', 'model': model},
+                              0.95, min_count=HEDGE_MIN_SAMPLES)
+    return hedge_after
+
+
+async def _request(client, model, permit, prompt, timeout, kwargs):
+    """One upstream request under ``permit``; its outcome is recorded on the model's breaker."""
+    breaker = get_breaker(model)
+    _count('dream_requests_total', model)
+    started = time.perf_counter()
+    try:
+        response = await asyncio.wait_for(client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            extra_headers=EXTRA_HEADERS,
+            **kwargs
+        ), timeout)
+    except asyncio.CancelledError:
+        breaker.release(permit)  # lost a hedge race; says nothing about the model
+        raise
+    except Exception as e:
+        _count('dream_errors_total', model)
+        if _retryable(e):
+            breaker.record_failure()
+        else:
+            # The model answered; the request was at fault.  This also
+            # settles a half-open trial, which would otherwise stay open for good
+            breaker.record_success()
+        raise
+    breaker.record_success()
+    if kwargs.get('stream'):
+        # Time to the response headers of a stream, not to a full answer
+        observe('dream_stage_duration_seconds', {'stage': 'llm_stream_open', 'model': model},
+                time.perf_counter() - started)
+        return response
+    usage = getattr(response, 'usage', None)
+    if usage is not None:
+        record_usage(model, usage.prompt_tokens, usage.completion_tokens)
+    # Only answered requests count towards the latency the hedge delay is based on
+    observe('dream_stage_duration_seconds', {'stage': 'llm_attempt', 'model': model}, time.perf_counter() - started)
+    return response
+
+
+async def _attempt(client, models, prompt, deadline, kwargs):
+    """Send to the first available model, hedging or failing over to the next ones."""
+    loop = asyncio.get_running_loop()
+    remaining = list(models)
+    pending = {}
+    errors = []
+
+    def launch():
+        while remaining and loop.time() < deadline:
+            model = remaining.pop(0)
+            permit = get_breaker(model).allow()
+            if permit is not None:
+                timeout = min(get_setting('LLM_TIMEOUT'), deadline - loop.time())
+                pending[asyncio.ensure_future(_request(client, model, permit, prompt, timeout, kwargs))] = model
+                return model
+        return None
+
+    primary = launch()
+    if primary is None:
+        raise LLMUnavailable(f"Circuit open for every model ({', '.join(models)})")
+    hedge_delay = _hedge_delay(primary)
+    hedge_at = loop.time() + hedge_delay if hedge_delay is not None else None
+    try:
+        while pending:
+            wake_at = deadline if hedge_at is None or not remaining else min(deadline, hedge_at)
+            done, _ = await asyncio.wait(pending, timeout=max(0.0, wake_at - loop.time()),
+                                         return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                model = pending.pop(task)
+                try:
+                    return task.result()
+                except Exception as e:
+                    logger.warning(f"LLM request to {model} failed: {e!r}")
+                    errors.append(e)
+            if done:
+                if not pending:
+                    launch()  # fail over without waiting for the hedge delay
+                continue
+            if loop.time() >= deadline:
+                break
+            # Still no answer at the hedge delay: race a fallback model
+            hedge_at = None
+            hedged = launch()
+            if hedged is not None:
+                _count('dream_hedged_total', hedged)
+        if errors and loop.time() < deadline:
+            raise errors[-1]
+        raise LLMUnavailable('LLM deadline exceeded')
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def complete(client, prompt, model=None, **kwargs):
+    """Chat completion for ``prompt`` from ``model`` (default ``LLM_MODEL``) or a fallback."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + get_setting('LLM_DEADLINE')
+    models = [model or get_setting('LLM_MODEL')]
+    models += [fallback for fallback in get_setting('LLM_FALLBACK_MODELS') if fallback not in models]
+    retries = get_setting('LLM_MAX_RETRIES')
+    for attempt in range(retries + 1):
+        try:
+            return await _attempt(client, models, prompt, deadline, kwargs)
+        except LLMUnavailable:
+            raise
+        except Exception as e:
+            if attempt == retries or not _retryable(e):
+                raise
+            delay = get_setting('LLM_RETRY_BACKOFF') * 2 ** attempt * random.uniform(0.5, 1.5)
+            if loop.time() + delay >= deadline:
+                raise LLMUnavailable('LLM deadline exceeded') from e
+            await asyncio.sleep(delay)
+
+
+async def open_stream(client, prompt, model=None, **kwargs):
+    """Streaming completion from the first model that accepts the request within ``LLM_TIMEOUT``.
+
+    Failover happens only before the first chunk, so streams are not
+    hedged or retried once they have started.
+    """
+    models = [model or get_setting('LLM_MODEL')]
+    models += [fallback for fallback in get_setting('LLM_FALLBACK_MODELS') if fallback not in models]
+    error = LLMUnavailable(f"Circuit open for every model ({', '.join(models)})")
+    for candidate in models:
+        permit = get_breaker(candidate).allow()
+        if permit is None:
+            continue
+        try:
+            return await _request(client, candidate, permit, prompt, get_setting('LLM_TIMEOUT'),
+                                  dict(kwargs, stream=True))
+        except Exception as e:
+            logger.warning(f"LLM stream from {candidate} failed to start: {e!r}")
+            error = e
+    raise error
+
+
+def complete_sync(prompt, model=None, **client_kwargs):
+    """Blocking :func:`complete` for scripts, on a client of its own"""
+    async def run():
+        client = make_client(**client_kwargs)
+        try:
+            return await complete(client, prompt, model=model)
+        finally:
+            await client.close()
+
+    return asyncio.run(run())
@@ -0,0 +1,92 @@
+import os
+import shutil
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.ai_processor import PROMPT_VERSION, get_dream_analyzer
+from myapp.conf import get_setting
+from myapp.corpus import load_corpus, read_manifest as read_corpus_manifest
+from myapp.corpus_analysis import (
+    analyze_shard, init_worker, merge_shards, read_manifest, shard_path, shard_ranges, write_manifest,
+)
+from myapp.executors import available_cores
+from myapp.fakes import OFFLINE_MODEL
+
+
+class Command(BaseCommand):
+    help = 'Analyze the whole backend/dreams corpus in parallel, resuming from the last checkpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2, help='Worker processes (each loads BERT)')
+        parser.add_argument('--shard-size', type=int, default=256, help='Dreams per shard (checkpoint unit)')
+        parser.add_argument('--llm-concurrency', type=int, default=8, help='Concurrent LLM calls per worker')
+        parser.add_argument('--limit', type=int, help='Only analyze the first N dreams')
+        parser.add_argument('--output', help='Output directory (defaults to CORPUS_ANALYSIS_DIR)')
+        parser.add_argument(
+            '--offline', action='store_true',
+            help='Use the deterministic local fake LLM instead of OpenRouter',
+        )
+        parser.add_argument('--restart', action='store_true', help='Discard existing checkpoints')
+
+    def handle(self, *args, **options):
+        output_dir = options['output'] or str(get_setting('CORPUS_ANALYSIS_DIR'))
+        cache_dir = str(get_setting('CORPUS_CACHE_DIR'))
+        corpus = load_corpus()
+        rows = min(len(corpus), options['limit'] or len(corpus))
+        shards = shard_ranges(rows, options['shard_size'])
+
+        manifest = {
+            'corpus_files': read_corpus_manifest(cache_dir)['files'],
+            'rows': rows,
+            'shard_size': options['shard_size'],
+            'model': get_dream_analyzer().document_model,
+            'llm': OFFLINE_MODEL if options['offline'] else get_setting('LLM_MODEL'),
+            'prompt_version': PROMPT_VERSION,
+        }
+        if options['restart'] and os.path.exists(output_dir):
+            shutil.rmtree(output_dir)
+        previous = read_manifest(output_dir)
+        if previous is not None and previous != manifest:
+            raise CommandError(
+                f'{output_dir} holds checkpoints from a different corpus or configuration; '
+                'pass --restart to discard them')
+        write_manifest(output_dir, manifest)
+
+        todo = [shard for shard in shards if not os.path.exists(shard_path(output_dir, shard[0]))]
+        done_rows = rows - sum(end - start for _, start, end in todo)
+        if done_rows:
+            self.stdout.write(f"Resuming: {len(shards) - len(todo)}/{len(shards)} shards already done")
+
+        processes = max(1, min(options['processes'], len(todo) or 1))
+        torch_threads = max(1, available_cores() // processes)
+        started = time.monotonic()
+        new_rows = 0
+        if todo:
+            with ProcessPoolExecutor(
+                max_workers=processes,
+                initializer=init_worker,
+                initargs=(options['offline'], torch_threads),
+            ) as pool:
+                pending = {
+                    pool.submit(analyze_shard, cache_dir, output_dir, shard, start, end, options['llm_concurrency'])
+                    for shard, start, end in todo
+                }
+                while pending:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        shard, shard_rows = future.result()
+                        new_rows += shard_rows
+                        done_rows += shard_rows
+                        elapsed = time.monotonic() - started
+                        rate = new_rows / max(elapsed, 1e-9)
+                        eta = (rows - done_rows) / rate if rate else 0
+                        self.stdout.write(
+                            f"Shard {shard} done: {done_rows}/{rows} dreams "
+                            f"({rate:.1f} dreams/s, ETA {eta:.0f}s)")
+
+        result_dir = merge_shards(output_dir, [shard for shard, _, _ in shards])
+        self.stdout.write(self.style.SUCCESS(
+            f"Analyzed {rows} dreams ({new_rows} this run in {time.monotonic() - started:.1f}s); "
+            f"results in {result_dir}"))
@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from myapp.ai_processor import get_dream_analyzer
+from myapp.conf import get_setting
+from myapp.corpus import load_corpus, read_manifest
+from myapp.similarity import SimilarityIndex
+
+
+class Command(BaseCommand):
+    help = 'Embed the backend/dreams corpus and build the similar-dreams index'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--clusters', type=int, default=0,
+            help='Number of IVF clusters (0 builds a flat index, fine for tens of thousands of dreams)',
+        )
+        parser.add_argument('--chunk-size', type=int, default=512, help='Dreams embedded per progress step')
+
+    def handle(self, *args, **options):
+        corpus = load_corpus()
+        analyzer = get_dream_analyzer()
+        contents = list(corpus['content'])
+        chunk_size = options['chunk_size']
+
+        started = time.monotonic()
+        vectors = []
+        for start in range(0, len(contents), chunk_size):
+            vectors.extend(analyzer.embed_many(contents[start:start + chunk_size]))
+            done = min(start + chunk_size, len(contents))
+            rate = done / max(time.monotonic() - started, 1e-9)
+            self.stdout.write(f"Embedded {done}/{len(contents)} dreams ({rate:.1f}/s)")
+
+        index = SimilarityIndex.build(
+            vectors,
+            n_clusters=options['clusters'],
+            meta={
+                'model': analyzer.document_model,
+                'corpus_files': read_manifest(str(get_setting('CORPUS_CACHE_DIR')))['files'],
+            },
+        )
+        index.save(str(get_setting('SIMILARITY_INDEX_DIR')))
+        self.stdout.write(self.style.SUCCESS(
+            f"Built {'IVF' if index.is_ivf else 'flat'} index over {len(index)} dreams"))
@@ -0,0 +1,100 @@
+import io
+import time
+
+import numpy as np
+import torch
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.conf import get_setting
+from myapp.dream_dictionary import get_shared_dictionary
+from myapp.executors import configure_torch_threads
+from myapp.model_loader import INFERENCE_MODES, load_encoder
+from myapp.similarity import normalize_rows, top_k
+
+
+def _encode(tokenizer, encoder, texts, batch_size):
+    vectors = []
+    for start in range(0, len(texts), batch_size):
+        inputs = tokenizer(
+            texts[start:start + batch_size], return_tensors='pt',
+            max_length=512, truncation=True, padding='longest')
+        with torch.no_grad():
+            hidden = encoder(inputs['input_ids'], inputs['attention_mask'])
+        mask = inputs['attention_mask'].unsqueeze(-1).to(hidden.dtype)
+        vectors.append(((hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)).numpy())
+    return np.concatenate(vectors)
+
+
+def _timed_encode(tokenizer, encoder, texts, batch_size):
+    _encode(tokenizer, encoder, texts[:batch_size], batch_size)  # warm-up
+    started = time.perf_counter()
+    vectors = _encode(tokenizer, encoder, texts, batch_size)
+    return vectors, (time.perf_counter() - started) / len(texts)
+
+
+def _weights_mb(encoder):
+    buffer = io.BytesIO()
+    if isinstance(encoder, torch.jit.ScriptModule):
+        torch.jit.save(encoder, buffer)
+    else:
+        torch.save(encoder.state_dict(), buffer)
+    return buffer.tell() / 2 ** 20
+
+
+class Command(BaseCommand):
+    help = 'Compare an optimised inference mode against the fp32 model for accuracy and speed'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--mode', choices=INFERENCE_MODES,
+            help='Mode to check (defaults to INFERENCE_MODE)',
+        )
+        parser.add_argument('--samples', type=int, default=256, help='Dictionary entries to embed')
+        parser.add_argument('--batch-size', type=int, default=16)
+        parser.add_argument(
+            '--min-cosine', type=float, default=0.99,
+            help='Fail if any embedding is less similar than this to its fp32 counterpart',
+        )
+        parser.add_argument('--neighbours', type=int, default=10, help='k for the nearest-neighbour overlap')
+
+    def handle(self, *args, **options):
+        mode = options['mode'] or get_setting('INFERENCE_MODE')
+        if mode == 'fp32':
+            raise CommandError('fp32 is the reference; pass --mode to pick the mode to check')
+        texts = [interpretation for _, interpretation in get_shared_dictionary().snapshot().entries]
+        texts = [text for text in texts if text][:options['samples']]
+        if len(texts) < 2:
+            raise CommandError('Not enough dictionary entries to compare')
+        batch_size = options['batch_size']
+
+        configure_torch_threads()
+        tokenizer, reference = load_encoder(mode='fp32')
+        expected, reference_latency = _timed_encode(tokenizer, reference, texts, batch_size)
+        reference_mb = _weights_mb(reference)
+        del reference
+        _, candidate = load_encoder(mode=mode)
+        actual, candidate_latency = _timed_encode(tokenizer, candidate, texts, batch_size)
+        candidate_mb = _weights_mb(candidate)
+
+        expected, actual = normalize_rows(expected), normalize_rows(actual)
+        cosine = (expected * actual).sum(axis=1)
+        k = min(options['neighbours'], len(texts) - 1)
+        overlap = []
+        for i in range(len(texts)):
+            # Skip the text itself (always the top hit)
+            want = set(top_k(expected @ expected[i], k + 1).tolist()) - {i}
+            got = set(top_k(actual @ actual[i], k + 1).tolist()) - {i}
+            overlap.append(len(want & got) / k)
+
+        self.stdout.write(f"Model: {get_setting('BERT_MODEL_NAME')}, {len(texts)} texts, batch size {batch_size}")
+        self.stdout.write(
+            f"Cosine to fp32: min {cosine.min():.4f}, mean {cosine.mean():.4f}; "
+            f"top-{k} neighbour overlap {np.mean(overlap):.1%}")
+        self.stdout.write(
+            f"Latency per text: fp32 {reference_latency * 1000:.2f} ms, "
+            f"{mode} {candidate_latency * 1000:.2f} ms ({reference_latency / candidate_latency:.2f}x)")
+        self.stdout.write(f"Weights: fp32 {reference_mb:.1f} MB, {mode} {candidate_mb:.1f} MB")
+
+        if cosine.min() < options['min_cosine']:
+            raise CommandError(f"{mode} diverges from fp32 (min cosine {cosine.min():.4f} < {options['min_cosine']})")
+        self.stdout.write(self.style.SUCCESS(f'{mode} is within tolerance of fp32'))
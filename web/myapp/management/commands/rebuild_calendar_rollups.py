@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from myapp.models import DreamDayRollup, ThemePeriodCount
+from myapp.pagination import DREAM_FIELDS, after_cursor, encode_cursor, newest_first, serialize_dream
+from myapp.rollups import apply_to_rollups
+from myapp.supabase_client import get_supabase
+
+
+class Command(BaseCommand):
+    help = 'Recompute the calendar rollups and theme counters from the Dreams table (backfill or repair)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only rebuild this Supabase user id')
+        parser.add_argument('--page-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        names = ['dream_id', 'created_at', 'themes']
+        columns = ','.join(sorted({DREAM_FIELDS[name] for name in names} | {'user_id'}))
+        dreams_by_user = {}
+        cursor = None
+        while True:
+            query = get_supabase().table('Dreams').select(columns)
+            if options['user']:
+                query = query.eq('user_id', options['user'])
+            if cursor:
+                query = after_cursor(query, cursor)
+            rows = newest_first(query).limit(options['page_size']).execute().data
+            for row in rows:
+                dreams_by_user.setdefault(row['user_id'], []).append(serialize_dream(row, names))
+            if len(rows) < options['page_size']:
+                break
+            cursor = encode_cursor(rows[-1]['timestamp'], rows[-1]['dream_id'])
+
+        with transaction.atomic():
+            for model in (DreamDayRollup, ThemePeriodCount):
+                stale = model.objects.all()
+                if options['user']:
+                    stale = stale.filter(user_id=options['user'])
+                stale.delete()
+            for user_id, dreams in dreams_by_user.items():
+                apply_to_rollups(user_id, dreams)
+        total = sum(len(dreams) for dreams in dreams_by_user.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt rollups for {len(dreams_by_user)} users from {total} dreams"))
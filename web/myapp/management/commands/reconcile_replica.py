@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand
+
+from myapp.models import Dream
+from myapp.pagination import after_cursor, encode_cursor, newest_first
+from myapp.replica import differs, invalidate, mirror_rows
+from myapp.supabase_client import get_supabase
+
+
+class Command(BaseCommand):
+    help = 'Bring the local Dream replica in line with the Supabase Dreams table (backfill or repair drift)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only reconcile this Supabase user id')
+        parser.add_argument('--page-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without changing the replica')
+
+    def handle(self, *args, **options):
+        local = Dream.objects.filter(remote_id__isnull=False)
+        if options['user']:
+            local = local.filter(user__username=options['user'])
+
+        seen = set()
+        missing = changed = 0
+        cursor = None
+        while True:
+            query = get_supabase().table('Dreams').select('*')
+            if options['user']:
+                query = query.eq('user_id', options['user'])
+            if cursor:
+                query = after_cursor(query, cursor)
+            rows = newest_first(query).limit(options['page_size']).execute().data
+
+            mirrored = Dream.objects.select_related('user').in_bulk(
+                [row['dream_id'] for row in rows], field_name='remote_id')
+            stale = []
+            for row in rows:
+                seen.add(row['dream_id'])
+                dream = mirrored.get(row['dream_id'])
+                if dream is None:
+                    missing += 1
+                elif differs(dream, row) or dream.user.username != row['user_id']:
+                    changed += 1
+                else:
+                    continue
+                stale.append(row)
+            if stale and not options['dry_run']:
+                mirror_rows(stale)
+
+            if len(rows) < options['page_size']:
+                break
+            cursor = encode_cursor(rows[-1]['timestamp'], rows[-1]['dream_id'])
+
+        # Rows deleted from Supabase since they were mirrored
+        orphaned = [dream_id for dream_id in local.values_list('remote_id', flat=True).iterator() if dream_id not in seen]
+        if not options['dry_run']:
+            for start in range(0, len(orphaned), 500):
+                invalidate(orphaned[start:start + 500])
+
+        verb = 'Found' if options['dry_run'] else 'Reconciled'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {len(seen)} dreams: {missing} missing, {changed} changed, {len(orphaned)} orphaned"))
@@ -0,0 +1,29 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+
+from myapp.jobs import WorkerPool
+
+
+class Command(BaseCommand):
+    help = 'Run background dream analysis workers until interrupted'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=2,
+            help='Number of jobs to run at once',
+        )
+
+    def handle(self, *args, **options):
+        stopping = threading.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *_: stopping.set())
+
+        pool = WorkerPool(options['concurrency'])
+        pool.start()
+        self.stdout.write(f"Running {options['concurrency']} analysis workers")
+        stopping.wait()
+        self.stdout.write('Stopping; waiting for running jobs to finish')
+        pool.stop()
+        self.stdout.write(self.style.SUCCESS('Workers stopped'))
@@ -0,0 +1,74 @@
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from myapp.benchmarks import compare, load_results, run_benchmarks, save_results
+from myapp.conf import REPO_ROOT
+from myapp.embedding_cache import reset_embedding_cache
+
+
+class Command(BaseCommand):
+    help = 'Run the hot-path microbenchmarks and compare them against a saved baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--only', nargs='+',
+            help='Only run these groups (e.g. dictionary) or benchmarks whose name contains one of these '
+                 '(qualified by group, e.g. bert.forward)',
+        )
+        parser.add_argument('--repeat', type=int, default=20, help='Timed samples per benchmark')
+        parser.add_argument('--quick', action='store_true', help='Fewer batch sizes and text lengths')
+        parser.add_argument(
+            '--output', default=str(REPO_ROOT / 'cache' / 'benchmarks' / 'latest.json'),
+            help='Where to write the results JSON',
+        )
+        parser.add_argument(
+            '--baseline', default=str(REPO_ROOT / 'benchmarks' / 'baseline.json'),
+            help='Results JSON to compare against',
+        )
+        parser.add_argument(
+            '--threshold', type=float, default=0.2,
+            help='Fail when a median is more than this fraction slower than the baseline',
+        )
+        parser.add_argument('--save-baseline', action='store_true', help='Write the results as the new baseline')
+
+    def handle(self, *args, **options):
+        # Keep benchmark embeddings out of the real cache
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            analyzer_settings = dict(
+                getattr(settings, 'DREAM_ANALYZER', {}),
+                EMBEDDING_CACHE_PATH=os.path.join(tmp_dir, 'embeddings.sqlite3'),
+                JOB_IN_PROCESS_WORKERS=0,
+            )
+            # The cache singleton keeps its path, so it is reopened under the override
+            reset_embedding_cache()
+            try:
+                with override_settings(DREAM_ANALYZER=analyzer_settings):
+                    document = run_benchmarks(
+                        only=options['only'], repeat=options['repeat'], quick=options['quick'],
+                        log=self.stdout.write)
+            finally:
+                reset_embedding_cache()
+
+        save_results(options['output'], document)
+        self.stdout.write(f"Wrote {len(document['results'])} results to {options['output']}")
+        if options['save_baseline']:
+            save_results(options['baseline'], document)
+            self.stdout.write(self.style.SUCCESS(f"Saved baseline to {options['baseline']}"))
+            return
+
+        if not os.path.exists(options['baseline']):
+            self.stdout.write(f"No baseline at {options['baseline']}; run with --save-baseline to create one")
+            return
+        rows = compare(document, load_results(options['baseline']), options['threshold'])
+        regressions = [row for row in rows if row[4]]
+        for name, before, after, ratio, regressed in rows:
+            line = f"{name:55s} {before:10.3f} -> {after:10.3f} ms ({ratio:.2f}x)"
+            self.stdout.write(self.style.ERROR(line) if regressed else line)
+        if regressions:
+            raise CommandError(
+                f"{len(regressions)} benchmark(s) regressed by more than {options['threshold']:.0%}")
+        self.stdout.write(self.style.SUCCESS(f"No regressions beyond {options['threshold']:.0%}"))
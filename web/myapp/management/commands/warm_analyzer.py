@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from myapp.ai_processor import get_dream_analyzer
+from myapp.model_loader import export_model, is_cached, local_model_dir
+
+
+class Command(BaseCommand):
+    help = "Load the dream analyzer's BERT model from the local cache and run a warm-up pass"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--download', action='store_true',
+            help='Export the model from the Hugging Face hub into MODEL_CACHE_DIR if it is missing',
+        )
+
+    def handle(self, *args, **options):
+        if options['download'] and not is_cached():
+            export_model()
+            self.stdout.write(f"Exported model to {local_model_dir()}")
+
+        get_dream_analyzer().warm_up()
+        self.stdout.write(self.style.SUCCESS('Dream analyzer is warm'))
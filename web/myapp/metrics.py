@@ -0,0 +1,395 @@
+"""Stage latency histograms and runtime gauges, exported in Prometheus text format.
+
+Code times its stages with :func:`span` (or :func:`timed`); durations go
+into fixed-bucket histograms labelled by stage.  Components that own a
+cache, queue or pool register a collector with :func:`register_collector`
+that reports their current counters and gauges.
+
+With ``METRICS_ENABLED`` on, each process periodically writes a
+snapshot of its histograms and collector samples to
+``METRICS_DIR/<pid>.json``, and removes it when it exits.  :func:`render`
+merges the snapshots of all live processes (bucket counts and samples are
+summed), so any worker can serve ``/metrics`` for the whole server;
+snapshots left behind by processes that died are pruned.  Metrics are
+always recorded in memory, since hedging reads this process's latencies.
+Quantiles (p50/p95/p99) are estimated from the merged buckets the same
+way Prometheus' ``histogram_quantile`` does.
+"""
+import asyncio
+import atexit
+import functools
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from .conf import get_setting
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+# name -> (type, help); every metric rendered must be declared here
+FAMILIES = {
+    'dream_stage_duration_seconds': ('histogram', 'Time spent in each processing stage'),
+    'dream_request_duration_seconds': ('histogram', 'Time to build the response of each view'),
+    'dream_cache_hits_total': ('counter', 'Cache lookups that hit'),
+    'dream_cache_misses_total': ('counter', 'Cache lookups that missed'),
+    'dream_cache_items': ('gauge', 'Entries held in memory by each cache'),
+    'dream_inflight': ('gauge', 'Operations currently in progress'),
+    'dream_inflight_max': ('gauge', 'Most operations in progress at once since the process started'),
+    'dream_clients_created_total': ('counter', 'Upstream clients (each with its own connection pool) created'),
+    'dream_pool_size': ('gauge', 'Connection limit of each upstream connection pool'),
+    'dream_pool_connections': ('gauge', 'Connections open in each upstream connection pool'),
+    'dream_queue_depth': ('gauge', 'Items waiting in each queue'),
+    'dream_requests_total': ('counter', 'Upstream requests made'),
+    'dream_errors_total': ('counter', 'Upstream requests that failed'),
+    'dream_hedged_total': ('counter', 'Upstream requests hedged to a fallback'),
+    'dream_llm_tokens_total': ('counter', 'Prompt and completion tokens of answered LLM requests'),
+    'dream_circuit_open': ('gauge', 'Whether the circuit breaker of an upstream is open'),
+    'dream_rollup_failures_total': ('counter', 'Rollup updates that failed (repair with rebuild_calendar_rollups)'),
+}
+# Families summed across processes and then turned into a ratio
+DERIVED_RATIOS = {
+    'dream_cache_hit_ratio': ('dream_cache_hits_total', 'dream_cache_misses_total', 'Cache hit rate'),
+}
+
+
+def _key(labels):
+    return json.dumps(sorted(labels.items()), separators=(',', ':'))
+
+
+class Histogram:
+    """Cumulative-bucket histogram with a running sum and count."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, counts, total, count):
+        self.counts = [a + b for a, b in zip(self.counts, counts)]
+        self.sum += total
+        self.count += count
+
+    def quantile(self, q):
+        """Linear interpolation inside the bucket holding the ``q`` quantile."""
+        if not self.count:
+            return float('nan')
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+class Registry:
+    """Histograms of one process, keyed by family and label set."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+
+    def observe(self, family, labels, value):
+        key = _key(labels)
+        with self._lock:
+            histogram = self.histograms.setdefault(family, {}).get(key)
+            if histogram is None:
+                histogram = self.histograms[family][key] = Histogram()
+            histogram.observe(value)
+
+    def quantile(self, family, labels, q, min_count=1):
+        with self._lock:
+            histogram = self.histograms.get(family, {}).get(_key(labels))
+            if histogram is None or histogram.count < min_count:
+                return None
+            return histogram.quantile(q)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                family: {key: [h.counts, h.sum, h.count] for key, h in series.items()}
+                for family, series in self.histograms.items()
+            }
+
+
+_registry = Registry()
+_collectors = []
+_flusher = None
+_flusher_pid = None
+_flusher_lock = threading.Lock()
+
+
+def register_collector(collect):
+    """Register ``collect() -> [(family, labels, value), ...]``, called at every snapshot."""
+    _collectors.append(collect)
+
+
+def observe(family, labels, seconds):
+    _registry.observe(family, labels, seconds)
+    _ensure_flusher()
+
+
+def local_quantile(family, labels, q, min_count=1):
+    """``q`` quantile of this process's histogram, or ``None`` before ``min_count`` samples."""
+    return _registry.quantile(family, labels, q, min_count)
+
+
+@contextmanager
+def span(stage, family='dream_stage_duration_seconds', **labels):
+    """Record the time spent in the ``with`` block as ``stage``."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(family, dict(labels, stage=stage), time.perf_counter() - started)
+
+
+def timed(stage):
+    """Decorator form of :func:`span` for plain and ``async`` functions."""
+    def decorate(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def _collect():
+    samples = []
+    for collect in list(_collectors):
+        try:
+            samples.extend(collect())
+        except Exception as e:
+            logger.warning(f"Metrics collector failed: {str(e)}")
+    return samples
+
+
+def local_snapshot():
+    return {
+        'pid': os.getpid(),
+        'histograms': _registry.snapshot(),
+        'samples': [[family, _key(labels), value] for family, labels, value in _collect()],
+    }
+
+
+def enabled():
+    return bool(get_setting('METRICS_ENABLED'))
+
+
+def _snapshot_dir():
+    metrics_dir = get_setting('METRICS_DIR')
+    return str(metrics_dir) if enabled() and metrics_dir else None
+
+
+def flush():
+    """Write this process's snapshot to ``METRICS_DIR`` (no-op unless metrics are enabled)."""
+    metrics_dir = _snapshot_dir()
+    if not metrics_dir:
+        return
+    os.makedirs(metrics_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix='.metrics-', dir=metrics_dir)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(local_snapshot(), f)
+        os.replace(tmp_path, os.path.join(metrics_dir, f'{os.getpid()}.json'))
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def _flush_loop():
+    interval = get_setting('METRICS_FLUSH_INTERVAL')
+    while True:
+        time.sleep(interval)
+        try:
+            flush()
+        except Exception as e:
+            logger.warning(f"Could not write metrics snapshot: {str(e)}")
+
+
+def _ensure_flusher():
+    global _flusher, _flusher_pid
+    if _flusher_pid == os.getpid() or not _snapshot_dir():
+        return
+    with _flusher_lock:
+        if _flusher_pid != os.getpid():
+            try:
+                prune_snapshots()
+            except OSError as e:
+                logger.warning(f"Could not prune metrics snapshots: {str(e)}")
+            _flusher = threading.Thread(target=_flush_loop, name='metrics-flush', daemon=True)
+            _flusher.start()
+            _flusher_pid = os.getpid()
+
+
+@atexit.register
+def _remove_snapshot():
+    metrics_dir = _snapshot_dir() if _flusher_pid == os.getpid() else None
+    if metrics_dir:
+        try:
+            os.remove(os.path.join(metrics_dir, f'{os.getpid()}.json'))
+        except OSError:
+            pass
+
+
+def _reset_after_fork():
+    global _registry, _flusher_lock
+    # The child reports its own numbers; the parent's stay in the parent's file
+    _registry = Registry()
+    _flusher_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _snapshot_files(metrics_dir):
+    """``(pid, path)`` of the snapshots in ``metrics_dir``"""
+    for name in os.listdir(metrics_dir):
+        pid = name[:-len('.json')]
+        if name.endswith('.json') and pid.isdigit():
+            yield int(pid), os.path.join(metrics_dir, name)
+
+
+def prune_snapshots():
+    """Remove the snapshots of processes that no longer exist"""
+    metrics_dir = _snapshot_dir()
+    if not metrics_dir or not os.path.isdir(metrics_dir):
+        return
+    for pid, path in _snapshot_files(metrics_dir):
+        if pid != os.getpid() and not _alive(pid):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def gather_snapshots():
+    """Snapshots of every live process (this one fresh), removing those of dead ones."""
+    prune_snapshots()
+    snapshots = [local_snapshot()]
+    metrics_dir = _snapshot_dir()
+    if not metrics_dir or not os.path.isdir(metrics_dir):
+        return snapshots
+    for pid, path in _snapshot_files(metrics_dir):
+        if pid == os.getpid():
+            continue
+        try:
+            with open(path, 'r') as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue  # being replaced right now, or its process just exited
+    return snapshots
+
+
+def merge(snapshots):
+    """Sum histograms and samples across snapshots."""
+    histograms = {}
+    samples = {}
+    for snapshot in snapshots:
+        for family, series in snapshot['histograms'].items():
+            for key, (counts, total, count) in series.items():
+                histogram = histograms.setdefault(family, {}).get(key)
+                if histogram is None:
+                    histogram = histograms[family][key] = Histogram()
+                histogram.merge(counts, total, count)
+        for family, key, value in snapshot['samples']:
+            samples.setdefault(family, {})
+            samples[family][key] = samples[family].get(key, 0) + value
+    return histograms, samples
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(key, **extra):
+    labels = dict(json.loads(key), **extra)
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in sorted(labels.items())) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if value != value:
+        return 'NaN'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(extra_samples=()):
+    """Prometheus text exposition of the merged metrics of all workers."""
+    histograms, samples = merge(gather_snapshots())
+    for family, labels, value in extra_samples:
+        samples.setdefault(family, {})[_key(labels)] = value
+
+    lines = []
+    for family, series in sorted(histograms.items()):
+        kind, help_text = FAMILIES[family]
+        lines += [f'# HELP {family} {help_text}', f'# TYPE {family} histogram']
+        for key, histogram in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + (float('inf'),), histogram.counts):
+                cumulative += count
+                lines.append(f'{family}_bucket{_format_labels(key, le=_format_value(bound))} {cumulative}')
+            lines.append(f'{family}_sum{_format_labels(key)} {_format_value(histogram.sum)}')
+            lines.append(f'{family}_count{_format_labels(key)} {histogram.count}')
+        # Pre-computed quantiles for dashboards that don't run histogram_quantile
+        quantile_family = family.replace('_seconds', '_quantile_seconds')
+        lines += [f'# HELP {quantile_family} {help_text} (p50/p95/p99)', f'# TYPE {quantile_family} gauge']
+        for key, histogram in sorted(series.items()):
+            for q in QUANTILES:
+                lines.append(f'{quantile_family}{_format_labels(key, quantile=q)} '
+                             f'{_format_value(histogram.quantile(q))}')
+
+    for family, series in sorted(samples.items()):
+        kind, help_text = FAMILIES[family]
+        lines += [f'# HELP {family} {help_text}', f'# TYPE {family} {kind}']
+        for key, value in sorted(series.items()):
+            lines.append(f'{family}{_format_labels(key)} {_format_value(value)}')
+
+    for family, (hits_family, misses_family, help_text) in DERIVED_RATIOS.items():
+        hits, misses = samples.get(hits_family, {}), samples.get(misses_family, {})
+        if not hits:
+            continue
+        lines += [f'# HELP {family} {help_text}', f'# TYPE {family} gauge']
+        for key, hit_count in sorted(hits.items()):
+            lookups = hit_count + misses.get(key, 0)
+            lines.append(f'{family}{_format_labels(key)} {_format_value(hit_count / lookups if lookups else 0.0)}')
+    return '\n'.join(lines) + '\n'
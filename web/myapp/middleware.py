@@ -0,0 +1,21 @@
+import time
+
+from .metrics import observe
+
+
+class RequestMetricsMiddleware:
+    """Record how long each view takes to produce its response, per URL name"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        response = self.get_response(request)
+        match = request.resolver_match
+        observe('dream_request_duration_seconds', {
+            'view': (match.url_name or match.view_name) if match else 'unmatched',
+            'method': request.method,
+            'status': f'{response.status_code // 100}xx',
+        }, time.perf_counter() - started)
+        return response
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:23
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0002_dream_day_rollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThemePeriodCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.CharField(max_length=255)),
+                ('period', models.CharField(choices=[('week', 'Week'), ('month', 'Month'), ('all', 'All time')], max_length=8)),
+                ('period_start', models.DateField()),
+                ('theme', models.CharField(max_length=255)),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='dream',
+            index=models.Index(fields=['user', 'created_at'], name='myapp_dream_user_id_08e5c1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='themeperiodcount',
+            index=models.Index(fields=['user_id', 'period', 'period_start'], name='myapp_theme_user_id_792053_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='themeperiodcount',
+            constraint=models.UniqueConstraint(fields=('user_id', 'period', 'period_start', 'theme'), name='unique_theme_period_count'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:25
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0003_theme_period_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dream',
+            name='remote_id',
+            field=models.BigIntegerField(blank=True, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='dream',
+            name='analysis',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='dream',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='dream',
+            name='themes',
+            field=models.JSONField(default=list),
+        ),
+    ]
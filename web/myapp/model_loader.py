@@ -0,0 +1,136 @@
+"""Loading BERT from a local weights cache.
+
+Weights are exported once into ``MODEL_CACHE_DIR`` as safetensors, which
+``from_pretrained`` maps into memory instead of copying.  The export
+happens on first use (or ahead of time with ``python manage.py
+warm_analyzer --download``); later loads never touch the network.
+
+``load_encoder`` additionally prepares the model for CPU inference
+according to ``INFERENCE_MODE``: dynamic INT8 quantization of the linear
+layers and/or a traced, frozen TorchScript graph.  Any encoder with the
+BERT interface (e.g. ``distilbert-base-uncased``) can be configured as
+``BERT_MODEL_NAME``.
+"""
+import logging
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import torch
+
+from .conf import get_setting
+
+logger = logging.getLogger(__name__)
+
+
+INFERENCE_MODES = ('fp32', 'int8', 'fp32-traced', 'int8-traced')
+
+
+class ModelNotCached(RuntimeError):
+    pass
+
+
+def local_model_dir(model_name=None):
+    """Directory in ``MODEL_CACHE_DIR`` holding the exported ``model_name``."""
+    model_name = model_name or get_setting('BERT_MODEL_NAME')
+    return Path(get_setting('MODEL_CACHE_DIR')) / model_name.replace('/', '--')
+
+
+def is_cached(model_name=None):
+    path = local_model_dir(model_name)
+    return (path / 'config.json').exists() and (path / 'model.safetensors').exists()
+
+
+def export_model(model_name=None):
+    """Download ``model_name`` from the hub and save it to the local cache as safetensors."""
+    from transformers import AutoModel, AutoTokenizer
+
+    model_name = model_name or get_setting('BERT_MODEL_NAME')
+    path = local_model_dir(model_name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    logger.info(f"Exporting {model_name} to {path}")
+    # Export next to the target and swap it in, so a concurrent load never
+    # sees a half-written directory
+    tmp_dir = tempfile.mkdtemp(prefix='.export-', dir=path.parent)
+    try:
+        AutoTokenizer.from_pretrained(model_name).save_pretrained(tmp_dir)
+        AutoModel.from_pretrained(model_name).save_pretrained(tmp_dir, safe_serialization=True)
+        if is_cached(model_name):
+            shutil.rmtree(tmp_dir)  # another process finished first
+        else:
+            shutil.rmtree(path, ignore_errors=True)
+            os.replace(tmp_dir, path)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    return path
+
+
+def load_bert(model_name=None):
+    """Return ``(tokenizer, model)`` loaded from the local cache, without network lookups.
+
+    A model that is not cached yet is downloaded and cached first, unless
+    ``MODEL_ALLOW_DOWNLOAD`` is off.  Raises :class:`ModelNotCached` when
+    the model is neither cached nor downloadable.
+    """
+    from transformers import AutoModel, AutoTokenizer
+
+    model_name = model_name or get_setting('BERT_MODEL_NAME')
+    if not is_cached(model_name):
+        if not get_setting('MODEL_ALLOW_DOWNLOAD'):
+            raise ModelNotCached(
+                f"{model_name} is not in {get_setting('MODEL_CACHE_DIR')}; "
+                f"run 'python manage.py warm_analyzer --download' first")
+        try:
+            export_model(model_name)
+        except OSError as e:
+            raise ModelNotCached(
+                f"{model_name} is not in {get_setting('MODEL_CACHE_DIR')} and could not be downloaded: {e}") from e
+
+    path = local_model_dir(model_name)
+    tokenizer = AutoTokenizer.from_pretrained(path, local_files_only=True)
+    model = AutoModel.from_pretrained(path, local_files_only=True, use_safetensors=True)
+    model.eval()
+    logger.info(f"Loaded {model_name} from {path}")
+    return tokenizer, model
+
+
+class HiddenStates(torch.nn.Module):
+    """``(input_ids, attention_mask) -> last_hidden_state``, a traceable signature for any encoder."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        return self.model(input_ids=input_ids, attention_mask=attention_mask, return_dict=False)[0]
+
+
+def optimize_for_inference(model, tokenizer, mode):
+    """Wrap ``model`` as :class:`HiddenStates` and apply ``mode`` (one of ``INFERENCE_MODES``)."""
+    if mode not in INFERENCE_MODES:
+        raise ValueError(f"INFERENCE_MODE must be one of {', '.join(INFERENCE_MODES)}, not {mode!r}")
+    encoder = HiddenStates(model).eval()
+    if mode.startswith('int8'):
+        encoder = torch.ao.quantization.quantize_dynamic(encoder, {torch.nn.Linear}, dtype=torch.qint8)
+    if mode.endswith('-traced'):
+        # Sequence length stays dynamic: BERT's ops don't specialise on it
+        example = tokenizer(['Tracing example dream'] * 2, return_tensors='pt', padding=True)
+        with torch.no_grad():
+            traced = torch.jit.trace(
+                encoder, (example['input_ids'], example['attention_mask']), check_trace=False)
+            encoder = torch.jit.freeze(traced)
+    return encoder
+
+
+def load_encoder(model_name=None, mode=None):
+    """Return ``(tokenizer, encoder)`` where ``encoder(input_ids, attention_mask)`` gives hidden states.
+
+    ``mode`` defaults to ``INFERENCE_MODE``.
+    """
+    mode = mode or get_setting('INFERENCE_MODE')
+    tokenizer, model = load_bert(model_name)
+    encoder = optimize_for_inference(model, tokenizer, mode)
+    logger.info(f"Prepared encoder for {mode} inference")
+    return tokenizer, encoder
@@ -1,18 +1,22 @@
+import uuid
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 
 User = get_user_model()
 
 class Dream(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
+    remote_id = models.BigIntegerField(unique=True, null=True, blank=True)  # Supabase Dreams.dream_id when mirrored
     dream_text = models.TextField()
-    themes = models.JSONField()  # Stores extracted themes
-    analysis = models.TextField()  # Stores Gemini analysis
-    created_at = models.DateTimeField(auto_now_add=True)
+    themes = models.JSONField(default=list)  # Stores extracted themes
+    analysis = models.TextField(null=True, blank=True)  # Stores Gemini analysis
+    created_at = models.DateTimeField(default=timezone.now)  # Supabase Dreams.timestamp when mirrored
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [models.Index(fields=['user', 'created_at'])]
 
 class DreamAnalysis(models.Model):
     dream = models.ForeignKey(Dream, on_delete=models.CASCADE, related_name='analyses')
@@ -21,3 +25,65 @@ class DreamAnalysis(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+
+class AnalysisJob(models.Model):
+    """Queued BERT + LLM analysis of a dream already saved to Supabase"""
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    dream_id = models.BigIntegerField()  # Supabase Dreams.dream_id
+    dream_text = models.TextField()
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    progress = models.CharField(max_length=32, blank=True)  # current pipeline stage
+    attempts = models.PositiveIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)  # not claimable before this
+    lease_expires_at = models.DateTimeField(null=True, blank=True)  # visibility timeout
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [models.Index(fields=['status', 'available_at'])]
+
+class DreamDayRollup(models.Model):
+    """Dream count and theme counts for one user and UTC day, kept up to date on submit"""
+    user_id = models.CharField(max_length=255)  # Supabase user id, as in Dreams.user_id
+    day = models.DateField()
+    dream_count = models.PositiveIntegerField(default=0)
+    theme_counts = models.JSONField(default=dict)  # theme -> number of dreams
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['day']
+        constraints = [
+            models.UniqueConstraint(fields=['user_id', 'day'], name='unique_rollup_user_day'),
+        ]
+
+class ThemePeriodCount(models.Model):
+    """Number of a user's dreams with a theme in one week, month or overall ("all")"""
+    PERIOD_CHOICES = [('week', 'Week'), ('month', 'Month'), ('all', 'All time')]
+
+    user_id = models.CharField(max_length=255)  # Supabase user id, as in Dreams.user_id
+    period = models.CharField(max_length=8, choices=PERIOD_CHOICES)
+    period_start = models.DateField()  # Monday, first of the month, or 1970-01-01 for "all"
+    theme = models.CharField(max_length=255)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user_id', 'period', 'period_start', 'theme'], name='unique_theme_period_count'),
+        ]
+        indexes = [models.Index(fields=['user_id', 'period', 'period_start'])]
@@ -0,0 +1,82 @@
+"""Keyset (cursor) pagination for Supabase queries ordered by ``(timestamp, dream_id)``.
+
+Pages are addressed by the last row already seen rather than an offset,
+so each page is one indexed range read no matter how deep the user pages.
+"""
+import base64
+import json
+from datetime import datetime
+
+# API field name -> Dreams column
+DREAM_FIELDS = {
+    'dream_id': 'dream_id',
+    'dream_text': 'dream_text',
+    'themes': 'themes_symbols',
+    'analysis': 'interpretation',
+    'created_at': 'timestamp',
+}
+
+
+def encode_cursor(timestamp, dream_id):
+    raw = json.dumps([timestamp, dream_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def normalize_timestamp(timestamp):
+    """``timestamp`` re-formatted from its parsed ISO 8601 value; raises ``ValueError`` if it doesn't parse"""
+    return datetime.fromisoformat(timestamp.replace('Z', '+00:00')).isoformat()
+
+
+def decode_cursor(cursor):
+    """Return ``(timestamp, dream_id)``; raises ``ValueError`` for malformed cursors.
+
+    Cursors come from clients and end up in a PostgREST filter, so the
+    timestamp must parse as ISO 8601 and is returned re-formatted from
+    the parsed value, never as the client sent it.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        timestamp, dream_id = json.loads(raw)
+        timestamp = normalize_timestamp(timestamp)
+    except (AttributeError, TypeError, ValueError) as e:
+        raise ValueError('Invalid cursor') from e
+    if type(dream_id) is not int:  # bool is an int subclass
+        raise ValueError('Invalid cursor')
+    return timestamp, dream_id
+
+
+def parse_fields(fields):
+    """Map a ``fields=`` list of API names to the columns to select.
+
+    ``dream_id`` and ``timestamp`` are always selected since the cursor
+    is built from them.
+    """
+    if not fields:
+        names = list(DREAM_FIELDS)
+    else:
+        names = [name.strip() for name in fields.split(',') if name.strip()]
+        unknown = [name for name in names if name not in DREAM_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    columns = {DREAM_FIELDS[name] for name in names} | {'dream_id', 'timestamp'}
+    return names, ','.join(sorted(columns))
+
+
+def newest_first(query):
+    # postgrest-py 0.13 has no multi-column order() or or_(), so the
+    # PostgREST parameters are added directly
+    query.params = query.params.add('order', 'timestamp.desc,dream_id.desc')
+    return query
+
+
+def after_cursor(query, cursor):
+    """Restrict ``query`` to rows strictly after ``cursor`` in newest-first order."""
+    timestamp, dream_id = decode_cursor(cursor)
+    query.params = query.params.add(
+        'or', f'(timestamp.lt."{timestamp}",and(timestamp.eq."{timestamp}",dream_id.lt.{dream_id}))')
+    return query
+
+
+def serialize_dream(dream, names):
+    """API representation of a Dreams row restricted to ``names``."""
+    return {name: dream[DREAM_FIELDS[name]] for name in names}
@@ -0,0 +1,149 @@
+"""Token-budgeted LLM prompts.
+
+A prompt is a fixed template around three variable parts, each held to
+a token budget:
+
+* the dream text (``PROMPT_DREAM_TOKENS``): longer dreams keep their
+  opening and closing sentences, with the middle elided;
+* the dream dictionary meanings of the symbols that actually occur in
+  the dream, most frequent first, each cut to ``PROMPT_SYMBOL_TOKENS``
+  and all together to ``PROMPT_DICTIONARY_TOKENS``;
+* the list of themes.
+
+Tokens are counted with ``tiktoken`` when it is installed, otherwise
+estimated from the text (about four characters per token), which is
+close enough for budgeting.
+"""
+import math
+import re
+from collections import namedtuple
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken is optional, the estimate is good enough for budgets
+    tiktoken = None
+
+from .conf import get_setting
+from .segments import split_segments
+from .symbol_scanner import get_symbol_scanner
+
+Prompt = namedtuple('Prompt', ['text', 'tokens', 'dream_tokens', 'trimmed', 'symbols'])
+
+ELISION = ' [...] '
+# Share of the dream budget spent on its opening; the rest goes to its ending
+HEAD_SHARE = 0.75
+
+ANALYSIS_TEMPLATE = """Analyze this dream and its themes:
+Dream: {dream}
+Extracted Themes: {themes}
+{dictionary}
+Provide a detailed psychological analysis including:
+1. Key symbols and their meanings
+2. Emotional undertones
+3. Possible interpretations
+4. Connections to the dreamer's psyche"""
+
+INTERPRETATION_TEMPLATE = """Analyze this dream: {dream}
+Its themes: {themes}
+{dictionary}
+Give a detailed response to why someone may be having these dreams and using these symbols, and explain what they represent. Tell the person whether they would need to be more mindful of their activities if their dreams are very negative. Explain also any emotional undertones they might be going through."""
+
+_WORD_RE = re.compile(r'\w+|[^\w\s]')
+_encoding = None
+
+
+def count_tokens(text):
+    """Tokens in ``text`` (cl100k_base with tiktoken, else an estimate)"""
+    global _encoding
+    if tiktoken is not None:
+        if _encoding is None:
+            _encoding = tiktoken.get_encoding('cl100k_base')
+        return len(_encoding.encode(text, disallowed_special=()))
+    return max(len(_WORD_RE.findall(text)), math.ceil(len(text) / 4))
+
+
+def _sentences(text):
+    return split_segments(text, max_words=10 ** 6)
+
+
+def _cut_words(text, budget):
+    """Longest run of leading words within ``budget`` tokens"""
+    words = text.split()
+    low, high = 0, len(words)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(' '.join(words[:middle])) <= budget:
+            low = middle
+        else:
+            high = middle - 1
+    return ' '.join(words[:low])
+
+
+def head(text, budget):
+    """Whole leading sentences of ``text`` within ``budget`` tokens (at least part of the first)"""
+    if count_tokens(text) <= budget:
+        return text
+    kept, used = [], 0
+    for sentence in _sentences(text):
+        tokens = count_tokens(sentence) + 1
+        if used + tokens > budget:
+            break
+        kept.append(sentence)
+        used += tokens
+    return ' '.join(kept) if kept else _cut_words(text, budget)
+
+
+def trim_to_budget(text, budget):
+    """``(text, trimmed)`` with ``text`` cut to its opening and closing sentences within ``budget``"""
+    if count_tokens(text) <= budget:
+        return text, False
+    sentences = _sentences(text)
+    costs = [count_tokens(sentence) + 1 for sentence in sentences]
+    budget -= count_tokens(ELISION)
+
+    first, used = 0, 0
+    while first < len(sentences) and used + costs[first] <= budget * HEAD_SHARE:
+        used += costs[first]
+        first += 1
+    last = len(sentences)
+    while last > first and used + costs[last - 1] <= budget:
+        last -= 1
+        used += costs[last]
+    if first == 0 and last == len(sentences):
+        # Not even one whole sentence fits
+        return _cut_words(text, budget) + ELISION.rstrip(), True
+    return ' '.join(sentences[:first]) + ELISION + ' '.join(sentences[last:]), True
+
+
+def dictionary_entries(themes, budget, entry_budget):
+    """``[(symbol, meaning)]`` for ``themes`` in order, each within ``entry_budget`` tokens, all within ``budget``"""
+    scanner = get_symbol_scanner()
+    entries, used = [], 0
+    for symbol in themes:
+        interpretation = scanner.interpretation(symbol)
+        if not interpretation:
+            continue
+        meaning = head(interpretation, entry_budget)
+        tokens = count_tokens(f'- {symbol}: {meaning}\n')
+        if used + tokens > budget:
+            continue  # a shorter entry further down may still fit
+        entries.append((symbol, meaning))
+        used += tokens
+    return entries
+
+
+def build_prompt(dream_text, themes, template=ANALYSIS_TEMPLATE):
+    """:class:`Prompt` for ``dream_text`` with the dictionary meanings of its ``themes``.
+
+    ``themes`` are dictionary symbols, most relevant first (as returned
+    by :meth:`SymbolScanner.themes`); symbols without an entry are only
+    listed by name.
+    """
+    dream, trimmed = trim_to_budget(' '.join(dream_text.split()), get_setting('PROMPT_DREAM_TOKENS'))
+    entries = dictionary_entries(themes, get_setting('PROMPT_DICTIONARY_TOKENS'), get_setting('PROMPT_SYMBOL_TOKENS'))
+    dictionary = ''
+    if entries:
+        dictionary = 'Dictionary meanings of these symbols:\n' + ''.join(
+            f'- {symbol}: {meaning}\n' for symbol, meaning in entries)
+    text = template.format(dream=dream, themes=', '.join(themes), dictionary=dictionary)
+    return Prompt(text, count_tokens(text), count_tokens(dream), trimmed, [symbol for symbol, _ in entries])
@@ -0,0 +1,185 @@
+"""Local mirror of the Supabase ``Dreams`` table in the ``Dream`` model.
+
+With ``LOCAL_REPLICA`` on, every dream written to Supabase is mirrored
+into the local database (keyed by ``remote_id``, the Supabase dream_id)
+and dream lookups and history pages are served from it with one indexed
+query instead of a PostgREST round trip.  A dream missing locally is
+read through from Supabase.  When mirroring a write fails, the local copy
+is dropped so it cannot serve stale data; ``manage.py reconcile_replica``
+backfills such gaps and repairs any other drift (rows written or deleted
+outside this app).
+
+SQLite databases are switched to WAL mode, so history reads are not
+blocked while a mirror write is being committed.
+"""
+import logging
+import threading
+from datetime import datetime, timezone
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models import Q
+from django.dispatch import receiver
+from django.utils import timezone as django_timezone
+
+from .conf import get_setting
+from .metrics import register_collector
+from .models import Dream
+from .pagination import decode_cursor, encode_cursor
+
+logger = logging.getLogger(__name__)
+
+# API field name -> Dream field
+LOCAL_FIELDS = {
+    'dream_id': 'remote_id',
+    'dream_text': 'dream_text',
+    'themes': 'themes',
+    'analysis': 'analysis',
+    'created_at': 'created_at',
+}
+MIRRORED_FIELDS = ('user', 'dream_text', 'themes', 'analysis', 'created_at', 'updated_at')
+
+
+def enabled():
+    return bool(get_setting('LOCAL_REPLICA'))
+
+
+@receiver(connection_created)
+def enable_wal(sender, connection, **kwargs):
+    """Readers never wait for the mirror writer on a WAL-mode SQLite file"""
+    if connection.vendor == 'sqlite' and enabled():
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode=WAL')
+            cursor.execute('PRAGMA synchronous=NORMAL')
+
+
+def parse_timestamp(timestamp):
+    """Aware datetime of a Supabase timestamp (ISO 8601 string)"""
+    moment = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment
+
+
+def format_timestamp(moment):
+    return moment.astimezone(timezone.utc).isoformat()
+
+
+def mirrored_fields(row):
+    """``Dream`` field values for a Supabase ``Dreams`` row (without the user)"""
+    return {
+        'dream_text': row.get('dream_text') or '',
+        'themes': row.get('themes_symbols') or [],
+        'analysis': row.get('interpretation'),
+        'created_at': parse_timestamp(row['timestamp']),
+    }
+
+
+def differs(dream, row):
+    return any(getattr(dream, name) != value for name, value in mirrored_fields(row).items())
+
+
+def mirror_rows(rows):
+    """Insert or update full Supabase ``Dreams`` rows (with ``user_id``) in the mirror"""
+    if not rows:
+        return
+    User = get_user_model()
+    users = {
+        user_id: User.objects.get_or_create(username=user_id)[0]
+        for user_id in {row['user_id'] for row in rows}
+    }
+    now = django_timezone.now()
+    with transaction.atomic():
+        existing = Dream.objects.select_for_update().in_bulk([row['dream_id'] for row in rows], field_name='remote_id')
+        created, changed = [], []
+        for row in rows:
+            fields = dict(mirrored_fields(row), user=users[row['user_id']], updated_at=now)
+            dream = existing.get(row['dream_id'])
+            if dream is None:
+                created.append(Dream(remote_id=row['dream_id'], **fields))
+                continue
+            for name, value in fields.items():
+                setattr(dream, name, value)
+            changed.append(dream)
+        # A concurrent read-through may have inserted the same row first
+        Dream.objects.bulk_create(created, ignore_conflicts=True)
+        Dream.objects.bulk_update(changed, MIRRORED_FIELDS)
+
+
+def invalidate(dream_ids):
+    """Drop the local copies of ``dream_ids``; the next lookup reads through"""
+    Dream.objects.filter(remote_id__in=list(dream_ids)).delete()
+
+
+def mirror(rows):
+    """Mirror rows just written to (or read from) Supabase; failures are logged, never raised"""
+    if not enabled() or not rows:
+        return
+    try:
+        mirror_rows(rows)
+    except Exception as e:
+        logger.error(f"Error mirroring dreams locally: {str(e)}")
+        try:
+            invalidate(row['dream_id'] for row in rows)
+        except Exception as e:
+            # `reconcile_replica` repairs whatever is left behind
+            logger.error(f"Error invalidating mirrored dreams: {str(e)}")
+
+
+def serialize(values, names):
+    """API representation of a ``Dream.values()`` row restricted to ``names``"""
+    dream = {name: values[LOCAL_FIELDS[name]] for name in names}
+    if 'created_at' in dream:
+        dream['created_at'] = format_timestamp(dream['created_at'])
+    return dream
+
+
+_stats = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
+
+def _count(outcome):
+    with _stats_lock:
+        _stats[outcome] += 1
+
+
+def _collect_metrics():
+    return [
+        ('dream_cache_hits_total', {'cache': 'replica'}, _stats['hits']),
+        ('dream_cache_misses_total', {'cache': 'replica'}, _stats['misses']),
+    ]
+
+
+register_collector(_collect_metrics)
+
+
+def get_dream(user, dream_id):
+    """The user's mirrored dream in API form, or ``None`` if it is not held locally"""
+    values = Dream.objects.filter(remote_id=dream_id, user=user).values(*LOCAL_FIELDS.values()).first()
+    _count('hits' if values else 'misses')
+    return serialize(values, LOCAL_FIELDS) if values else None
+
+
+def history_page(user, names, limit, cursor=None, since=None):
+    """One newest-first page of the user's mirrored dreams: ``(dreams, next_cursor)``.
+
+    Cursors are interchangeable with those of the Supabase history query.
+    Raises ``ValueError`` for a malformed cursor or ``since``.
+    """
+    dreams = Dream.objects.filter(user=user, remote_id__isnull=False)
+    if since:
+        dreams = dreams.filter(created_at__gt=parse_timestamp(since))
+    if cursor:
+        timestamp, dream_id = decode_cursor(cursor)
+        moment = parse_timestamp(timestamp)
+        dreams = dreams.filter(Q(created_at__lt=moment) | Q(created_at=moment, remote_id__lt=dream_id))
+    columns = {LOCAL_FIELDS[name] for name in names} | {'remote_id', 'created_at'}
+    rows = list(dreams.order_by('-created_at', '-remote_id').values(*columns)[:limit + 1])
+    _count('hits')
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(format_timestamp(rows[-1]['created_at']), rows[-1]['remote_id'])
+    return [serialize(row, names) for row in rows], next_cursor
@@ -0,0 +1,202 @@
+"""Per-user rollups behind the calendar, timeline and theme-trend views.
+
+Every saved dream adds one to its day's count and to the counts of its
+themes, so reading a date range is one indexed range scan over at most
+one row per day; weeks and months are folded from days at read time.
+
+Theme trends use one counter row per (user, period, period start,
+theme) for weeks, months and all time, so top-k and time-window queries
+cost O(distinct themes in the window), however many dreams the user
+has written.  Re-analysis moves a dream's counts from its old themes to
+its new ones.  Days are UTC calendar days.
+"""
+import logging
+import threading
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta, timezone
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import Greatest
+from django.utils import timezone as django_timezone
+
+from .metrics import register_collector
+from .models import DreamDayRollup, ThemePeriodCount
+
+logger = logging.getLogger(__name__)
+
+PERIODS = ('day', 'week', 'month')
+THEME_PERIODS = ('week', 'month', 'all')
+ALL_TIME = date(1970, 1, 1)
+
+
+def dream_day(timestamp):
+    """UTC day of a Supabase timestamp (ISO 8601 string)"""
+    moment = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc)
+    return moment.date()
+
+
+def apply_to_rollups(user_id, dreams, sign=1, count_dreams=True):
+    """Add (``sign=1``) or remove (``sign=-1``) ``dreams`` from the user's daily rollups.
+
+    ``dreams`` are API dicts with ``created_at`` and ``themes``.  With
+    ``count_dreams=False`` only the theme counts change, e.g. when a
+    queued analysis fills in the themes of a dream counted earlier.
+    """
+    days = defaultdict(lambda: [0, Counter()])
+    for dream in dreams:
+        day = days[dream_day(dream['created_at'])]
+        day[0] += 1 if count_dreams else 0
+        day[1].update(set(dream.get('themes') or []))
+
+    # A concurrent first write for the same counter row loses the unique
+    # constraint race; the retry then finds the row and increments it
+    for attempt in range(3):
+        try:
+            with transaction.atomic():
+                _apply_days(user_id, days, sign)
+                _apply_theme_counts(user_id, days, sign)
+            return
+        except IntegrityError:
+            if attempt == 2:
+                raise
+
+
+def _apply_days(user_id, days, sign):
+    now = django_timezone.now()
+    for day, (count, themes) in sorted(days.items()):
+        rollups = DreamDayRollup.objects.filter(user_id=user_id, day=day)
+        # The increment is written first: it takes the row's write lock (the
+        # database's on SQLite, where select_for_update() does nothing), so
+        # the theme counts read below can't change until they are written back
+        if not rollups.update(dream_count=Greatest(F('dream_count') + sign * count, 0), updated_at=now):
+            DreamDayRollup.objects.create(
+                user_id=user_id, day=day, dream_count=max(0, sign * count),
+                theme_counts={theme: n for theme, n in themes.items() if sign * n > 0})
+            continue
+        theme_counts = Counter(rollups.values_list('theme_counts', flat=True).get())
+        theme_counts.update({theme: sign * n for theme, n in themes.items()})
+        rollups.update(theme_counts={theme: n for theme, n in theme_counts.items() if n > 0})
+
+
+def _apply_theme_counts(user_id, days, sign):
+    deltas = Counter()
+    for day, (_, themes) in days.items():
+        for period in THEME_PERIODS:
+            start = period_start(day, period)
+            for theme, n in themes.items():
+                deltas[(period, start, theme)] += sign * n
+    deltas = {key: n for key, n in deltas.items() if n}
+    if not deltas:
+        return
+
+    # Counters move by atomic increments, one UPDATE per (period, start, amount)
+    groups = defaultdict(list)
+    for (period, start, theme), n in deltas.items():
+        groups[(period, start, n)].append(theme)
+    rows = ThemePeriodCount.objects.filter(user_id=user_id)
+    for (period, start, n), themes in sorted(groups.items()):
+        rows.filter(period=period, period_start=start, theme__in=themes) \
+            .update(count=Greatest(F('count') + n, 0))
+
+    touched = rows.filter(
+        period__in={period for period, _, _ in deltas},
+        period_start__in={start for _, start, _ in deltas},
+        theme__in={theme for _, _, theme in deltas},
+    )
+    existing = set(touched.values_list('period', 'period_start', 'theme'))
+    ThemePeriodCount.objects.bulk_create([
+        ThemePeriodCount(user_id=user_id, period=period, period_start=start, theme=theme, count=n)
+        for (period, start, theme), n in deltas.items()
+        if n > 0 and (period, start, theme) not in existing
+    ])
+    touched.filter(count=0).delete()
+
+
+_failures = 0
+_failures_lock = threading.Lock()
+
+
+def _count_failure():
+    global _failures
+    with _failures_lock:
+        _failures += 1
+
+
+register_collector(lambda: [('dream_rollup_failures_total', {}, _failures)])
+
+
+def record_dreams(user_id, dreams, count_dreams=True):
+    """Add newly saved dreams to the rollups; failures are logged and counted, never raised"""
+    try:
+        apply_to_rollups(user_id, dreams, count_dreams=count_dreams)
+    except Exception as e:
+        # The dream itself is saved; `rebuild_calendar_rollups` repairs the rollup
+        logger.error(f"Error updating calendar rollups for {user_id}: {str(e)}")
+        _count_failure()
+
+
+def record_reanalysis(user_id, dream, old_themes):
+    """Move ``dream``'s theme counts from ``old_themes`` to its current themes; failures are logged and counted"""
+    try:
+        # Both or neither: a failed add must not leave the old themes subtracted
+        with transaction.atomic():
+            apply_to_rollups(user_id, [dict(dream, themes=old_themes)], sign=-1, count_dreams=False)
+            apply_to_rollups(user_id, [dream], count_dreams=False)
+    except Exception as e:
+        logger.error(f"Error updating theme rollups for {user_id}: {str(e)}")
+        _count_failure()
+
+
+def period_start(day, period):
+    if period == 'all':
+        return ALL_TIME
+    if period == 'week':
+        return day - timedelta(days=day.weekday())  # ISO weeks start on Monday
+    if period == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def calendar(user_id, start, end, period='day', top_themes=5):
+    """Non-empty ``period`` buckets between ``start`` and ``end`` (inclusive dates)"""
+    buckets = {}
+    rollups = DreamDayRollup.objects.filter(user_id=user_id, day__gte=start, day__lte=end) \
+        .order_by('day').values_list('day', 'dream_count', 'theme_counts')
+    for day, count, theme_counts in rollups:
+        if not count and not theme_counts:
+            continue
+        bucket = buckets.setdefault(period_start(day, period), [0, Counter()])
+        bucket[0] += count
+        bucket[1].update(theme_counts)
+    return [
+        {
+            'start': key.isoformat(),
+            'count': count,
+            'top_themes': [{'theme': theme, 'count': n} for theme, n in themes.most_common(top_themes)],
+        }
+        for key, (count, themes) in buckets.items()
+    ]
+
+
+def top_themes(user_id, period='month', start=None, end=None, k=10):
+    """The ``k`` most frequent themes in periods starting within ``[start, end]``"""
+    rows = ThemePeriodCount.objects.filter(user_id=user_id, period=period)
+    if period != 'all':
+        rows = rows.filter(period_start__gte=period_start(start, period), period_start__lte=end)
+    rows = rows.values('theme').annotate(total=Sum('count')).order_by('-total', 'theme')[:k]
+    return [{'theme': row['theme'], 'count': row['total']} for row in rows]
+
+
+def theme_trends(user_id, themes, period, start, end):
+    """Per-period counts of ``themes`` between ``start`` and ``end``, as one series per theme"""
+    series = {theme: [] for theme in themes}
+    rows = ThemePeriodCount.objects.filter(
+        user_id=user_id, period=period, theme__in=themes,
+        period_start__gte=period_start(start, period), period_start__lte=end,
+    ).order_by('period_start').values_list('theme', 'period_start', 'count')
+    for theme, start_day, count in rows:
+        series[theme].append({'start': start_day.isoformat(), 'count': count})
+    return [{'theme': theme, 'points': points} for theme, points in series.items()]
@@ -0,0 +1,37 @@
+"""Sentence segmentation and pooling for dream embeddings.
+
+A dream is embedded as the pooled embeddings of its sentences.  Each
+sentence is cached by content hash, so editing one sentence re-encodes
+only that sentence, and long dreams are covered in full instead of being
+truncated at BERT's 512-token window.
+"""
+import re
+
+import numpy as np
+
+from .embedding_cache import normalize_text
+
+# A sentence ends at ., ! or ? (or one of them and a closing quote or bracket)
+# before whitespace, or at a blank line
+_SENTENCE_END = re.compile(r'(?<=[.!?…])\s+|(?<=[.!?…]["\'”’)\]])\s+|\n\s*\n')
+
+
+def split_segments(text, max_words=128):
+    """Normalised sentences of ``text``; sentences over ``max_words`` words are split.
+
+    Text without any words is returned as a single segment so it still
+    gets an embedding.
+    """
+    segments = []
+    for sentence in _SENTENCE_END.split(text):
+        words = normalize_text(sentence).split()
+        for start in range(0, len(words), max_words):
+            segments.append(' '.join(words[start:start + max_words]))
+    return segments or [normalize_text(text)]
+
+
+def pool_segments(segments, vectors):
+    """Mean of the segment vectors weighted by segment length in words"""
+    weights = np.array([max(1, len(segment.split())) for segment in segments], dtype=np.float32)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return (weights[:, None] * vectors).sum(axis=0) / weights.sum()
@@ -0,0 +1,187 @@
+"""Cosine-similarity index over dream embeddings.
+
+Vectors are stored L2-normalised as a float32 ``.npy`` matrix that is
+memory-mapped at query time, so a query is one matrix-vector product plus
+an ``argpartition`` for the top k.  For larger corpora the index can also
+hold an IVF layout (k-means centroids with rows grouped per cluster) and
+only score the ``nprobe`` closest clusters.
+"""
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+
+from .conf import get_setting
+from .corpus import CorpusTable, read_manifest
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = 'manifest.json'
+
+
+def normalize_rows(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def top_k(scores, k):
+    """Indexes of the ``k`` highest scores, best first."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates])]
+
+
+def spherical_kmeans(vectors, n_clusters, iterations=20, seed=0, sample_size=20000):
+    """Cluster unit vectors by cosine similarity; returns unit-norm centroids."""
+    rng = np.random.default_rng(seed)
+    sample = vectors
+    if len(vectors) > sample_size:
+        sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    centroids = sample[rng.choice(len(sample), n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(sample @ centroids.T, axis=1)
+        for cluster in range(n_clusters):
+            members = sample[assignment == cluster]
+            if len(members):
+                centroids[cluster] = members.sum(axis=0)
+        centroids = normalize_rows(centroids)
+    return centroids
+
+
+class SimilarityIndex:
+    """Top-k cosine search over L2-normalised rows, with optional IVF pruning."""
+
+    def __init__(self, vectors, centroids=None, order=None, list_offsets=None, meta=None):
+        self.vectors = vectors
+        self.centroids = centroids
+        self.order = order
+        self.list_offsets = list_offsets
+        self.meta = meta or {}
+
+    def __len__(self):
+        return len(self.vectors)
+
+    @property
+    def is_ivf(self):
+        return self.centroids is not None
+
+    @classmethod
+    def build(cls, vectors, n_clusters=0, meta=None):
+        vectors = normalize_rows(vectors)
+        if not n_clusters or n_clusters >= len(vectors):
+            return cls(vectors, meta=meta)
+        centroids = spherical_kmeans(vectors, n_clusters)
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        order = np.argsort(assignment, kind='stable').astype(np.int64)
+        counts = np.bincount(assignment, minlength=n_clusters)
+        list_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        return cls(vectors, centroids, order, list_offsets, meta=meta)
+
+    def search(self, query, k=10, nprobe=None):
+        """Return ``[(row, score), ...]`` for the ``k`` rows most similar to ``query``.
+
+        With an IVF layout only the ``nprobe`` closest clusters are scored;
+        ``nprobe=None`` uses ``SIMILARITY_NPROBE`` and ``0`` scans everything.
+        """
+        query = normalize_rows(query)
+        if nprobe is None:
+            nprobe = get_setting('SIMILARITY_NPROBE')
+        if self.is_ivf and nprobe and nprobe < len(self.centroids):
+            clusters = top_k(self.centroids @ query, nprobe)
+            rows = np.concatenate([
+                self.order[self.list_offsets[c]:self.list_offsets[c + 1]] for c in clusters
+            ])
+            rows.sort()  # sequential reads from the memory map
+            scores = self.vectors[rows] @ query
+            best = top_k(scores, k)
+            return [(int(rows[i]), float(scores[i])) for i in best]
+
+        scores = self.vectors @ query
+        return [(int(i), float(scores[i])) for i in top_k(scores, k)]
+
+    def save(self, index_dir):
+        parent = os.path.dirname(os.path.abspath(index_dir))
+        os.makedirs(parent, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix='.similarity-', dir=parent)
+        try:
+            np.save(os.path.join(tmp_dir, 'vectors.npy'), np.ascontiguousarray(self.vectors, dtype=np.float32))
+            if self.is_ivf:
+                np.save(os.path.join(tmp_dir, 'centroids.npy'), self.centroids)
+                np.save(os.path.join(tmp_dir, 'order.npy'), self.order)
+                np.save(os.path.join(tmp_dir, 'list_offsets.npy'), self.list_offsets)
+            with open(os.path.join(tmp_dir, MANIFEST), 'w') as f:
+                json.dump(dict(self.meta, rows=len(self), ivf=self.is_ivf), f)
+            if os.path.exists(index_dir):
+                shutil.rmtree(index_dir)
+            os.replace(tmp_dir, index_dir)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+    @classmethod
+    def load(cls, index_dir):
+        with open(os.path.join(index_dir, MANIFEST), 'r') as f:
+            meta = json.load(f)
+        vectors = np.load(os.path.join(index_dir, 'vectors.npy'), mmap_mode='r')
+        if not meta.get('ivf'):
+            return cls(vectors, meta=meta)
+        return cls(
+            vectors,
+            np.load(os.path.join(index_dir, 'centroids.npy')),
+            np.load(os.path.join(index_dir, 'order.npy')),
+            np.load(os.path.join(index_dir, 'list_offsets.npy')),
+            meta=meta,
+        )
+
+
+_index = None  # (manifest versions, model, (index, corpus) or (None, None))
+_index_lock = threading.Lock()
+
+
+def _manifest_version(directory):
+    try:
+        st = os.stat(os.path.join(directory, MANIFEST))
+    except OSError:
+        return None
+    # Rebuilds swap in a new directory, so the inode changes even within one mtime tick
+    return st.st_mtime_ns, st.st_ino
+
+
+def _load_corpus_index(index_dir, corpus_dir, model):
+    if not os.path.exists(os.path.join(index_dir, MANIFEST)):
+        return None, None
+    index = SimilarityIndex.load(index_dir)
+    corpus_manifest = read_manifest(corpus_dir)
+    if not corpus_manifest or corpus_manifest.get('files') != index.meta.get('corpus_files'):
+        logger.warning("Similarity index is out of date with the corpus cache; rebuild it")
+        return None, None
+    if index.meta.get('model') != model:
+        logger.warning(f"Similarity index was built with {index.meta.get('model')}, not {model}")
+        return None, None
+    return index, CorpusTable.open(corpus_dir)
+
+
+def get_corpus_index(model):
+    """The corpus index and its corpus table, or ``(None, None)`` if unavailable.
+
+    The index is only used while the corpus cache it was built from is
+    unchanged and its vectors come from ``model``, so result rows always
+    line up with corpus records and with query embeddings.  The outcome
+    (including "unavailable") is kept until the index or corpus manifest
+    changes on disk, so a rebuilt index is picked up without a restart.
+    """
+    global _index
+    index_dir = str(get_setting('SIMILARITY_INDEX_DIR'))
+    corpus_dir = str(get_setting('CORPUS_CACHE_DIR'))
+    versions = (_manifest_version(index_dir), _manifest_version(corpus_dir))
+    with _index_lock:
+        if _index is None or _index[:2] != (versions, model):
+            _index = (versions, model, _load_corpus_index(index_dir, corpus_dir, model))
+        return _index[2]
@@ -0,0 +1,165 @@
+"""Process-wide Supabase client with a pooled, metered HTTP session.
+
+``create_client`` builds a new client (and a new HTTP session) every time,
+so calling it per request throws away keep-alive connections.  Views call
+:func:`get_supabase` instead, which returns one client per process whose
+PostgREST session keeps a bounded pool of connections alive.  The client is
+rebuilt in a forked child, since sockets must not be shared across fork.
+"""
+import logging
+import os
+import threading
+
+import httpx
+from django.conf import settings
+from postgrest.utils import SyncClient
+from supabase import create_client
+from supabase.lib.client_options import ClientOptions
+
+from .conf import get_setting
+from .metrics import register_collector, span
+
+logger = logging.getLogger(__name__)
+
+
+class PoolStats:
+    """Counters describing how the Supabase HTTP pool is being used."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clients_created = 0
+        self.requests = 0
+        self.errors = 0
+        self.inflight = 0
+        self.max_inflight = 0
+
+    def started(self):
+        with self._lock:
+            self.requests += 1
+            self.inflight += 1
+            self.max_inflight = max(self.max_inflight, self.inflight)
+
+    def finished(self, failed):
+        with self._lock:
+            self.inflight -= 1
+            if failed:
+                self.errors += 1
+
+
+# HTTP method -> stage name for latency metrics
+OPERATIONS = {'GET': 'select', 'POST': 'insert', 'PATCH': 'update', 'DELETE': 'delete'}
+
+
+class _MeteredTransport(httpx.HTTPTransport):
+    def __init__(self, stats, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats
+
+    def handle_request(self, request):
+        self.stats.started()
+        failed = True
+        try:
+            with span(f"supabase_{OPERATIONS.get(request.method, request.method.lower())}"):
+                response = super().handle_request(request)
+            failed = response.status_code >= 500
+            return response
+        finally:
+            self.stats.finished(failed)
+
+    def open_connections(self):
+        return len(self._pool.connections)
+
+
+_lock = threading.Lock()
+_client = None
+_transport = None
+_pid = None
+stats = PoolStats()
+
+
+def _build_client():
+    global _transport
+    timeout = get_setting('SUPABASE_TIMEOUT')
+    pool_size = get_setting('SUPABASE_POOL_SIZE')
+    client = create_client(
+        settings.SUPABASE['URL'],
+        settings.SUPABASE['KEY'],
+        options=ClientOptions(postgrest_client_timeout=timeout),
+    )
+
+    # Swap PostgREST's default session for one with an explicit, metered pool
+    postgrest = client.postgrest
+    default_session = postgrest.session
+    _transport = _MeteredTransport(
+        stats,
+        limits=httpx.Limits(
+            max_connections=pool_size,
+            max_keepalive_connections=pool_size,
+            keepalive_expiry=get_setting('SUPABASE_KEEPALIVE_EXPIRY'),
+        ),
+    )
+    postgrest.session = SyncClient(
+        base_url=default_session.base_url,
+        headers=default_session.headers,
+        timeout=timeout,
+        transport=_transport,
+    )
+    default_session.close()
+    stats.clients_created += 1
+    logger.info(f"Created Supabase client (pool size {pool_size}, pid {os.getpid()})")
+    return client
+
+
+def get_supabase():
+    """Shared Supabase client for this process."""
+    global _client, _pid
+    client = _client
+    if client is not None and _pid == os.getpid():
+        return client
+    with _lock:
+        if _client is None or _pid != os.getpid():
+            _client = _build_client()
+            _pid = os.getpid()
+        return _client
+
+
+def reset_client():
+    """Close the shared client; the next :func:`get_supabase` builds a new one from current settings."""
+    global _client, _transport, _pid
+    with _lock:
+        if _client is not None and _pid == os.getpid():
+            _client.postgrest.session.close()
+        _client = None
+        _transport = None
+        _pid = None
+
+
+def _reset_after_fork():
+    global _client, _transport, _pid, stats, _lock
+    # Drop the parent's sockets without closing them (the parent still owns them)
+    _client = None
+    _transport = None
+    _pid = None
+    _lock = threading.Lock()
+    stats = PoolStats()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _collect_metrics():
+    labels = {'service': 'supabase'}
+    transport = _transport
+    return [
+        ('dream_requests_total', labels, stats.requests),
+        ('dream_errors_total', labels, stats.errors),
+        ('dream_inflight', labels, stats.inflight),
+        ('dream_inflight_max', labels, stats.max_inflight),
+        ('dream_clients_created_total', labels, stats.clients_created),
+        ('dream_pool_size', labels, get_setting('SUPABASE_POOL_SIZE')),
+        ('dream_pool_connections', labels, transport.open_connections() if transport is not None else 0),
+    ]
+
+
+register_collector(_collect_metrics)
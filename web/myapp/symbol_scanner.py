@@ -0,0 +1,163 @@
+"""Lexical symbol extraction over the dream dictionary.
+
+All dictionary symbols are compiled once into a token-level Aho-Corasick
+automaton.  Both the symbols and the dream text go through the same
+normalisation (case folding plus a light plural stemmer), so a dream is
+scanned in a single linear pass regardless of how many symbols exist.
+"""
+import re
+import threading
+from collections import namedtuple
+
+from .dream_dictionary import get_shared_dictionary
+
+SymbolMatch = namedtuple('SymbolMatch', ['symbol', 'start', 'end', 'text', 'interpretation'])
+
+_TOKEN_RE = re.compile(r"[^\W_]+(?:['’][^\W_]+)*")
+_PARENS_RE = re.compile(r'\([^)]*\)')
+_ALTERNATIVES_RE = re.compile(r'\s+or\s+|/', re.IGNORECASE)
+
+# Single-word symbols that are too common in ordinary prose to be meaningful
+IGNORED_SYMBOLS = {'up', 'yes'}
+
+
+def stem(token):
+    """Case-fold a token and strip possessives and regular plurals."""
+    token = token.casefold().replace('’', "'")
+    if token.endswith("'s"):
+        token = token[:-2]
+    if len(token) > 4 and token.endswith('ies'):
+        return token[:-3] + 'y'
+    if len(token) > 4 and token.endswith(('sses', 'ches', 'shes', 'xes', 'zes')):
+        return token[:-2]
+    if len(token) > 3 and token.endswith('s') and not token.endswith(('ss', 'us', 'is')):
+        return token[:-1]
+    return token
+
+
+def tokenize(text):
+    """Yield ``(stemmed_token, start, end)`` for each word in ``text``."""
+    for match in _TOKEN_RE.finditer(text):
+        yield stem(match.group()), match.start(), match.end()
+
+
+def symbol_variants(symbol):
+    """Token sequences that should match ``symbol``.
+
+    ``"Bed or Bedroom"`` and ``"China/Chinese"`` yield one variant per
+    alternative, parenthesised notes are dropped and a trailing
+    ``"Dreams"`` (``"Chase Dreams"``) is optional.
+    """
+    variants = []
+    for alternative in _ALTERNATIVES_RE.split(_PARENS_RE.sub(' ', symbol)):
+        tokens = tuple(token for token, _, _ in tokenize(alternative))
+        if not tokens:
+            continue
+        variants.append(tokens)
+        if len(tokens) > 1 and tokens[-1] == 'dream':
+            variants.append(tokens[:-1])
+    return [v for v in variants if not (len(v) == 1 and v[0] in IGNORED_SYMBOLS)]
+
+
+class SymbolScanner:
+    """Token-level Aho-Corasick automaton over ``(symbol, interpretation)`` entries."""
+
+    def __init__(self, entries):
+        self.entries = list(entries)
+        self._interpretations = dict(self.entries)
+        self._goto = [{}]
+        self._fail = [0]
+        # Per state: list of (entry index, pattern length in tokens)
+        self._output = [[]]
+        for index, (symbol, _) in enumerate(self.entries):
+            for tokens in symbol_variants(symbol):
+                self._add(tokens, index)
+        self._build_failure_links()
+
+    def _add(self, tokens, index):
+        state = 0
+        for token in tokens:
+            next_state = self._goto[state].get(token)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+                self._goto[state][token] = next_state
+            state = next_state
+        if all(existing != index for existing, _ in self._output[state]):
+            self._output[state].append((index, len(tokens)))
+
+    def _build_failure_links(self):
+        queue = list(self._goto[0].values())
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for token, child in self._goto[state].items():
+                queue.append(child)
+                fallback = self._fail[state]
+                while fallback and token not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(token, 0)
+                self._fail[child] = target if target != child else 0
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def scan(self, text, overlapping=False):
+        """Return the :class:`SymbolMatch` list for ``text`` in text order.
+
+        By default overlapping matches are resolved leftmost-longest, so
+        ``"air balloon"`` reports *Air Balloon* rather than *Air* and
+        *Balloon* as well.
+        """
+        tokens = list(tokenize(text))
+        found = []
+        state = 0
+        for position, (token, _, end) in enumerate(tokens):
+            while state and token not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(token, 0)
+            for index, length in self._output[state]:
+                start = tokens[position - length + 1][1]
+                found.append((start, end, index))
+
+        found.sort(key=lambda m: (m[0], -m[1]))
+        matches = []
+        last_end = -1
+        for start, end, index in found:
+            if not overlapping and start < last_end:
+                continue
+            symbol, interpretation = self.entries[index]
+            matches.append(SymbolMatch(symbol, start, end, text[start:end], interpretation))
+            last_end = max(last_end, end)
+        return matches
+
+    def interpretation(self, symbol):
+        """Dictionary interpretation of ``symbol``, or ``None``."""
+        return self._interpretations.get(symbol)
+
+    def themes(self, text, limit=None):
+        """Distinct symbols in ``text``, most frequent first (ties by first appearance)."""
+        counts = {}
+        for match in self.scan(text):
+            counts[match.symbol] = counts.get(match.symbol, 0) + 1
+        ranked = sorted(counts, key=lambda symbol: -counts[symbol])
+        return ranked[:limit] if limit else ranked
+
+
+_scanner = None
+_scanner_lock = threading.Lock()
+
+
+def get_symbol_scanner():
+    """Return the scanner for the current dream dictionary, rebuilding it if the CSV changed."""
+    global _scanner
+    snapshot = get_shared_dictionary().snapshot()
+    scanner = _scanner
+    if scanner is None or scanner[0] != snapshot.version:
+        with _scanner_lock:
+            scanner = _scanner
+            if scanner is None or scanner[0] != snapshot.version:
+                scanner = (snapshot.version, SymbolScanner(snapshot.entries))
+                _scanner = scanner
+    return scanner[1]
@@ -1,3 +1,725 @@
-from django.test import TestCase
+import asyncio
+import base64
+import os
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.signals import request_started
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from openai import BadRequestError
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from . import api, jobs, llm_client, rollups
+from .auth import _get_user, get_claims_cache, get_user_cache, reset_auth_caches
+from .analysis_cache import SingleFlightCache
+from .batching import InferenceBatcher
+from .benchmarks import selects_group
+from .embedding_cache import get_embedding_cache, reset_embedding_cache
+from .fakes import FakeAsyncOpenAI, FakeOpenAIServer, FakePostgrest, fake_dreams
+from .llm_client import CircuitBreaker, LLMUnavailable, complete, get_breaker, make_client, open_stream
+from .metrics import local_quantile, render
+from .models import AnalysisJob, DreamDayRollup, ThemePeriodCount
+from .pagination import decode_cursor, encode_cursor
+from .supabase_client import reset_client
+from .symbol_scanner import SymbolScanner, stem
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 100.0
+        patcher = mock.patch.object(llm_client.time, 'monotonic', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker(failures=2, cooldown=30)
+
+    def trip(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+
+    def test_closed_until_consecutive_failures(self):
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertIsNotNone(self.breaker.allow())
+
+    def test_opens_after_consecutive_failures(self):
+        self.trip()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertIsNone(self.breaker.allow())
+
+    def test_lets_one_trial_through_after_cooldown(self):
+        self.trip()
+        self.now += 30
+        self.assertIsNotNone(self.breaker.allow())
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertIsNone(self.breaker.allow())
+
+    def test_successful_trial_closes(self):
+        self.trip()
+        self.now += 30
+        self.breaker.allow()
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(self.breaker.consecutive_failures, 0)
+        self.assertIsNotNone(self.breaker.allow())
+
+    def test_failed_trial_reopens_for_another_cooldown(self):
+        self.trip()
+        self.now += 30
+        self.breaker.allow()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertIsNone(self.breaker.allow())
+        self.now += 30
+        self.assertIsNotNone(self.breaker.allow())
+
+    def test_released_trial_can_be_retried_straight_away(self):
+        self.trip()
+        self.now += 30
+        self.breaker.release(self.breaker.allow())
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertIsNotNone(self.breaker.allow())
+
+    def test_release_leaves_other_states_alone(self):
+        permit = self.breaker.allow()
+        self.breaker.release(permit)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.trip()
+        self.breaker.release(permit)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertIsNone(self.breaker.allow())
+
+    def test_only_the_trial_request_releases_the_trial(self):
+        # Sent while closed, still running when the trial starts, then cancelled
+        regular = self.breaker.allow()
+        self.trip()
+        self.now += 30
+        trial = self.breaker.allow()
+        self.breaker.release(regular)
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertIsNone(self.breaker.allow())
+        # A trial that was settled can't be released afterwards either
+        self.breaker.record_failure()
+        self.now += 30
+        self.breaker.allow()
+        self.breaker.release(trial)
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+
+
+LLM_SETTINGS = {
+    'METRICS_DIR': None,
+    'LLM_MODEL': 'primary',
+    'LLM_FALLBACK_MODELS': [],
+    'LLM_HEDGE_AFTER': None,
+    'LLM_DEADLINE': 5,
+    'LLM_TIMEOUT': 5,
+    'LLM_MAX_RETRIES': 0,
+    'LLM_RETRY_BACKOFF': 0.01,
+    'LLM_BREAKER_FAILURES': 5,
+    'LLM_BREAKER_COOLDOWN': 30,
+}
+
+
+def llm_settings(**overrides):
+    return override_settings(DREAM_ANALYZER=dict(LLM_SETTINGS, **overrides))
+
+
+@llm_settings()
+class LLMClientTests(SimpleTestCase):
+    """:func:`complete` against a local OpenAI-compatible server"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = FakeOpenAIServer().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.latency = 0.0
+        self.server.errors = {}
+        self.server.requests.clear()
+        llm_client._breakers.clear()
+        self.addCleanup(llm_client._breakers.clear)
+
+    def run_client(self, call):
+        async def run():
+            client = make_client(api_key='test', base_url=self.server.base_url)
+            try:
+                return await call(client)
+            finally:
+                await client.close()
+
+        return asyncio.run(run())
+
+    def complete(self, prompt='I dreamt of a river', **kwargs):
+        return self.run_client(lambda client: complete(client, prompt, **kwargs))
+
+    def test_answers_from_primary_model(self):
+        response = self.complete()
+        self.assertEqual(response.model, 'primary')
+        self.assertEqual(dict(self.server.requests), {'primary': 1})
+
+    @llm_settings(LLM_DEADLINE=0.3)
+    def test_gives_up_at_the_deadline(self):
+        self.server.latency = 2.0
+        started = time.monotonic()
+        with self.assertRaises(LLMUnavailable):
+            self.complete()
+        self.assertLess(time.monotonic() - started, 1.5)
+
+    @llm_settings(LLM_MAX_RETRIES=2, LLM_RETRY_BACKOFF=0.2)
+    def test_retries_with_backoff(self):
+        self.server.errors = {'primary': 503}
+
+        def recover():
+            # During the first backoff (0.1 to 0.3 seconds), once the failure is in
+            while not get_breaker('primary').consecutive_failures:
+                time.sleep(0.005)
+            self.server.errors.clear()
+
+        recovery = threading.Thread(target=recover, daemon=True)
+        recovery.start()
+        self.addCleanup(recovery.join, 1)
+        started = time.monotonic()
+        response = self.complete()
+        self.assertEqual(response.model, 'primary')
+        self.assertEqual(self.server.requests['primary'], 2)
+        self.assertGreaterEqual(time.monotonic() - started, 0.1)
+
+    @llm_settings(LLM_MAX_RETRIES=2)
+    def test_gives_up_after_max_retries(self):
+        self.server.errors = {'primary': 503}
+        with self.assertRaises(Exception):
+            self.complete()
+        self.assertEqual(self.server.requests['primary'], 3)
+
+    @llm_settings(LLM_MAX_RETRIES=2)
+    def test_does_not_retry_client_errors(self):
+        self.server.errors = {'primary': 400}
+        with self.assertRaises(BadRequestError):
+            self.complete()
+        self.assertEqual(self.server.requests['primary'], 1)
+
+    @llm_settings(LLM_FALLBACK_MODELS=['backup'])
+    def test_fails_over_to_fallback_on_error(self):
+        self.server.errors = {'primary': 503}
+        response = self.complete()
+        self.assertEqual(response.model, 'backup')
+        self.assertEqual(dict(self.server.requests), {'primary': 1, 'backup': 1})
+
+    @llm_settings(LLM_FALLBACK_MODELS=['backup'], LLM_HEDGE_AFTER=0.1)
+    def test_hedges_slow_request_to_fallback(self):
+        self.server.latency = {'primary': 2.0}
+        started = time.monotonic()
+        response = self.complete()
+        self.assertEqual(response.model, 'backup')
+        self.assertLess(time.monotonic() - started, 1.5)
+        # Losing the race says nothing about the primary model
+        self.assertEqual(get_breaker('primary').state, CircuitBreaker.CLOSED)
+
+    @llm_settings(LLM_FALLBACK_MODELS=['backup'], LLM_HEDGE_AFTER=1.0)
+    def test_does_not_hedge_fast_requests(self):
+        self.complete()
+        self.assertEqual(dict(self.server.requests), {'primary': 1})
+
+    @llm_settings(LLM_BREAKER_FAILURES=2, LLM_BREAKER_COOLDOWN=0.2)
+    def test_breaker_skips_failing_model_until_trial_succeeds(self):
+        self.server.errors = {'primary': 503}
+        for _ in range(2):
+            with self.assertRaises(Exception):
+                self.complete()
+        self.assertEqual(get_breaker('primary').state, CircuitBreaker.OPEN)
+        with self.assertRaises(LLMUnavailable):
+            self.complete()
+        self.assertEqual(self.server.requests['primary'], 2)
+
+        time.sleep(0.25)
+        self.server.errors = {}
+        self.assertEqual(self.complete().model, 'primary')
+        self.assertEqual(get_breaker('primary').state, CircuitBreaker.CLOSED)
+
+    @llm_settings(LLM_BREAKER_FAILURES=1, LLM_BREAKER_COOLDOWN=0.2)
+    def test_client_error_settles_half_open_trial(self):
+        self.server.errors = {'primary': 503}
+        with self.assertRaises(Exception):
+            self.complete()
+        time.sleep(0.25)
+        self.server.errors = {'primary': 400}
+        with self.assertRaises(BadRequestError):
+            self.complete()
+        self.assertEqual(get_breaker('primary').state, CircuitBreaker.CLOSED)
+        self.server.errors = {}
+        self.assertEqual(self.complete().model, 'primary')
+
+    @llm_settings(LLM_MODEL='streamed')
+    def test_stream_opens_do_not_feed_hedge_latency(self):
+        async def stream(client):
+            response = await open_stream(client, 'I dreamt of a river')
+            return [event async for event in response]
+
+        self.assertTrue(self.run_client(stream))
+        labels = {'stage': 'llm_attempt', 'model': 'streamed'}
+        self.assertIsNone(local_quantile('dream_stage_duration_seconds', labels, 0.95))
+
+
+class SymbolScannerTests(SimpleTestCase):
+    def setUp(self):
+        self.scanner = SymbolScanner([
+            ('Air', 'breath'),
+            ('Balloon', 'lightness'),
+            ('Air Balloon', 'ambition'),
+            ('Big Red Door', 'a bold choice'),
+            ('Red House', 'passion at home'),
+            ('Chase Dreams', 'avoidance'),
+            ('Bed or Bedroom', 'rest'),
+            ('Up', 'too common to count'),
+        ])
+
+    def symbols(self, text, **kwargs):
+        return [match.symbol for match in self.scanner.scan(text, **kwargs)]
+
+    def test_prefers_the_longest_of_overlapping_matches(self):
+        self.assertEqual(self.symbols('I flew up in an air balloon'), ['Air Balloon'])
+
+    def test_reports_every_overlap_on_request(self):
+        self.assertEqual(self.symbols('an air balloon', overlapping=True), ['Air Balloon', 'Air', 'Balloon'])
+
+    def test_follows_failure_links_between_multi_word_symbols(self):
+        # "big red" is a prefix of one symbol; its "red" starts another
+        self.assertEqual(self.symbols('a big red house'), ['Red House'])
+        self.assertEqual(self.symbols('a big red door'), ['Big Red Door'])
+
+    def test_match_offsets_point_into_the_original_text(self):
+        text = 'Two Air  Balloons rose'
+        match, = self.scanner.scan(text)
+        self.assertEqual((match.text, text[match.start:match.end]), ('Air  Balloons', 'Air  Balloons'))
+        self.assertEqual(match.interpretation, 'ambition')
+
+    def test_matches_variants_of_dictionary_symbols(self):
+        self.assertEqual(self.symbols("I was chased... no, a chase, by my bedroom's balloons"),
+                         ['Chase Dreams', 'Bed or Bedroom', 'Balloon'])
+
+    def test_themes_rank_by_frequency(self):
+        self.assertEqual(self.scanner.themes('air, a balloon, more balloons and air balloons'),
+                         ['Balloon', 'Air', 'Air Balloon'])
+        self.assertEqual(self.scanner.themes('air, a balloon, more balloons', limit=1), ['Balloon'])
+
+    def test_stem(self):
+        self.assertEqual([stem(t) for t in ['Stories', 'Boxes', 'Glass', "Dog's", 'Bus', 'Cats']],
+                         ['story', 'box', 'glass', 'dog', 'bus', 'cat'])
+
+
+
+class InferenceBatcherTests(SimpleTestCase):
+    def setUp(self):
+        self.batches = []
+
+        def run_batch(items):
+            self.batches.append(items)
+            time.sleep(0.05)
+            return [item.upper() for item in items]
+
+        self.batcher = InferenceBatcher(run_batch, max_batch_size=8, max_wait_ms=50)
+
+    def test_batches_concurrent_callers(self):
+        async def run():
+            return await asyncio.gather(*[self.batcher.infer(text) for text in ['a', 'b', 'c']])
+
+        self.assertEqual(asyncio.run(run()), ['A', 'B', 'C'])
+        self.assertEqual(self.batches, [['a', 'b', 'c']])
+
+    def test_cancelled_caller_does_not_strand_its_batch(self):
+        async def run():
+            callers = [asyncio.ensure_future(self.batcher.infer(text)) for text in ['a', 'b', 'c']]
+            await asyncio.sleep(0.01)
+            callers[0].cancel()
+            return await asyncio.wait_for(asyncio.gather(*callers[1:]), 1)
+
+        self.assertEqual(asyncio.run(run()), ['B', 'C'])
+        self.assertEqual(self.batches, [['b', 'c']])
+
+    def test_caller_cancelled_while_its_batch_runs(self):
+        async def run():
+            callers = [asyncio.ensure_future(self.batcher.infer(text)) for text in ['a', 'b']]
+            await asyncio.sleep(0.08)  # collected and running
+            callers[0].cancel()
+            return await asyncio.wait_for(callers[1], 1)
+
+        self.assertEqual(asyncio.run(run()), 'B')
+        self.assertEqual(self.batches, [['a', 'b']])
+
+
+
+class BenchmarkTests(SimpleTestCase):
+    def test_only_selects_groups_before_running_them(self):
+        self.assertTrue(selects_group('bert', None))
+        self.assertTrue(selects_group('bert', ['dictionary', 'bert']))
+        self.assertTrue(selects_group('bert', ['bert.forward[batch=8']))
+        self.assertFalse(selects_group('bert', ['dictionary', 'berth']))
+
+    def test_reset_embedding_cache_follows_settings(self):
+        self.addCleanup(reset_embedding_cache)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'embeddings.sqlite3')
+            with override_settings(DREAM_ANALYZER={'METRICS_DIR': None, 'EMBEDDING_CACHE_PATH': path}):
+                reset_embedding_cache()
+                self.assertEqual(get_embedding_cache().path, path)
+            reset_embedding_cache()
+            self.assertNotEqual(get_embedding_cache().path, path)
+
+
+
+class AuthCacheTests(TestCase):
+    def setUp(self):
+        reset_auth_caches()
+        self.addCleanup(reset_auth_caches)
+
+    @override_settings(DREAM_ANALYZER={'METRICS_DIR': None, 'AUTH_TOKEN_CACHE_ITEMS': 3,
+                                       'AUTH_USER_CACHE_ITEMS': 4, 'AUTH_USER_CACHE_TTL': 5})
+    def test_caches_are_sized_from_current_settings(self):
+        self.assertEqual(get_claims_cache().max_items, 3)
+        self.assertEqual((get_user_cache().max_items, get_user_cache().ttl), (4, 5))
+
+    def test_saving_a_user_evicts_it(self):
+        user = _get_user('supabase-id', 'a@example.com')
+        self.assertIs(_get_user('supabase-id', 'a@example.com'), user)
+        user.email = 'b@example.com'
+        user.save()
+        self.assertIsNone(get_user_cache().get('supabase-id'))
+
+
+class CursorTests(SimpleTestCase):
+    def test_round_trip(self):
+        cursor = encode_cursor('2024-01-28T09:00:00+00:00', 42)
+        self.assertNotIn('=', cursor)
+        self.assertEqual(decode_cursor(cursor), ('2024-01-28T09:00:00+00:00', 42))
+
+    def test_normalises_the_timestamp(self):
+        self.assertEqual(decode_cursor(encode_cursor('2024-01-28T09:00:00Z', 1))[0], '2024-01-28T09:00:00+00:00')
+
+    def test_rejects_malformed_cursors(self):
+        def raw(text):
+            return base64.urlsafe_b64encode(text.encode('utf-8')).decode('ascii')
+
+        for cursor in ['', 'not a cursor', raw('{}'), raw('[1, 2]'), raw('["2024-01-28", 1, 2]'),
+                       raw('["2024-01-28\\",dream_id.gt.0)", 1]'), raw('["2024-01-28", "1"]'),
+                       raw('["2024-01-28", true]'), raw('["2024-01-28", 1.5]')]:
+            with self.subTest(cursor=cursor), self.assertRaises(ValueError):
+                decode_cursor(cursor)
+
+
+class SingleFlightCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = SingleFlightCache(max_items=10, ttl=60)
+        self.openai = FakeAsyncOpenAI(latency=0.05)
+
+    async def analyse(self):
+        response = await self.openai.chat.completions.create(
+            model='fake', messages=[{'role': 'user', 'content': 'I dreamt of a river'}])
+        return response.choices[0].message.content
+
+    def test_coalesces_concurrent_misses(self):
+        async def run():
+            return await asyncio.gather(*[self.cache.get_or_call('key', self.analyse) for _ in range(5)])
+
+        results = asyncio.run(run())
+        self.assertEqual(len(set(results)), 1)
+        self.assertEqual(self.openai.calls, 1)
+        self.assertEqual(self.cache.coalesced, 4)
+        self.assertEqual(self.cache.inflight(), 0)
+        # Later callers are served from the cache
+        self.assertEqual(asyncio.run(self.cache.get_or_call('key', self.analyse)), results[0])
+        self.assertEqual(self.openai.calls, 1)
+
+    def test_coalesces_across_threads(self):
+        future, leader = self.cache.join('key')
+        self.assertTrue(leader)
+        results = []
+        waiter = threading.Thread(target=lambda: results.append(asyncio.run(self.cache.get_or_call('key', self.analyse))))
+        waiter.start()
+        time.sleep(0.05)
+        self.cache.settle('key', future, 'answer')
+        waiter.join(1)
+        self.assertEqual(results, ['answer'])
+        self.assertEqual(self.openai.calls, 0)
+
+    def test_errors_reach_every_waiter_and_are_not_cached(self):
+        async def fail():
+            await asyncio.sleep(0.05)
+            raise RuntimeError('upstream failed')
+
+        async def run():
+            return await asyncio.gather(*[self.cache.get_or_call('key', fail) for _ in range(3)],
+                                        return_exceptions=True)
+
+        self.assertEqual([type(e) for e in asyncio.run(run())], [RuntimeError] * 3)
+        self.assertEqual(self.cache.inflight(), 0)
+        asyncio.run(self.cache.get_or_call('key', self.analyse))
+        self.assertEqual(self.openai.calls, 1)
+
+    def test_waiter_takes_over_from_a_cancelled_leader(self):
+        async def run():
+            leader = asyncio.ensure_future(self.cache.get_or_call('key', self.analyse))
+            await asyncio.sleep(0.01)
+            waiter = asyncio.ensure_future(self.cache.get_or_call('key', self.analyse))
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            return await waiter
+
+        self.assertTrue(asyncio.run(run()))
+        self.assertEqual(self.openai.calls, 2)
+        self.assertEqual(self.cache.inflight(), 0)
+
+
+@override_settings(DREAM_ANALYZER={'METRICS_DIR': None, 'JOB_IN_PROCESS_WORKERS': 0,
+                                   'JOB_MAX_ATTEMPTS': 2, 'JOB_RETRY_BACKOFF': 60})
+class JobQueueTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='dreamer')
+        self.job = jobs.enqueue_analysis(self.user, 7, 'I dreamt of a river')
+
+    dream = {'dream_id': 7, 'created_at': '2024-01-04T08:00:00+00:00', 'themes': ['River']}
+
+    def make_due(self):
+        AnalysisJob.objects.filter(pk=self.job.pk).update(available_at=timezone.now())
+
+    def test_a_job_is_claimed_once(self):
+        job = jobs.claim_job()
+        self.assertEqual((job.pk, job.status, job.attempts), (self.job.pk, AnalysisJob.STATUS_RUNNING, 1))
+        self.assertIsNotNone(job.lease_expires_at)
+        self.assertIsNone(jobs.claim_job())
+        self.assertEqual(jobs.queue_depth(), 0)
+
+    def test_failure_is_retried_after_backoff(self):
+        jobs.fail_job(jobs.claim_job(), 'timeout')
+        job = AnalysisJob.objects.get(pk=self.job.pk)
+        self.assertEqual((job.status, job.error), (AnalysisJob.STATUS_QUEUED, 'timeout'))
+        self.assertGreater(job.available_at, timezone.now() + timedelta(seconds=29))
+        self.assertIsNone(jobs.claim_job())
+
+        self.make_due()
+        self.assertEqual(jobs.claim_job().attempts, 2)
+
+    def test_gives_up_after_max_attempts(self):
+        jobs.fail_job(jobs.claim_job(), 'timeout')
+        self.make_due()
+        jobs.fail_job(jobs.claim_job(), 'timeout again')
+        job = AnalysisJob.objects.get(pk=self.job.pk)
+        self.assertEqual((job.status, job.error), (AnalysisJob.STATUS_FAILED, 'timeout again'))
+        self.assertIsNone(jobs.claim_job())
+
+    def test_expired_lease_is_reclaimed(self):
+        first = jobs.claim_job()
+        AnalysisJob.objects.filter(pk=self.job.pk).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        second = jobs.claim_job()
+        self.assertEqual(second.attempts, 2)
+        # The first worker lost its lease, so its outcome is ignored
+        self.assertFalse(jobs.complete_job(first, self.dream))
+        self.assertEqual(AnalysisJob.objects.get(pk=self.job.pk).status, AnalysisJob.STATUS_RUNNING)
+        self.assertFalse(ThemePeriodCount.objects.exists())
+
+        self.assertTrue(jobs.complete_job(second, self.dream))
+        self.assertEqual(dict(ThemePeriodCount.objects.filter(period='all').values_list('theme', 'count')),
+                         {'River': 1})
+
+    def test_expired_lease_on_final_attempt_fails(self):
+        jobs.claim_job()
+        AnalysisJob.objects.filter(pk=self.job.pk).update(
+            attempts=2, lease_expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertIsNone(jobs.claim_job())
+        self.assertEqual(AnalysisJob.objects.get(pk=self.job.pk).status, AnalysisJob.STATUS_FAILED)
+
+    def test_process_next_job(self):
+        with mock.patch.object(jobs, 'run_job', side_effect=[Exception('LLM down'), self.dream]):
+            self.assertTrue(jobs.process_next_job())
+            self.make_due()
+            self.assertTrue(jobs.process_next_job())
+        job = AnalysisJob.objects.get(pk=self.job.pk)
+        self.assertEqual((job.status, job.result, job.attempts), (AnalysisJob.STATUS_SUCCEEDED, self.dream, 2))
+        self.assertFalse(jobs.process_next_job())
+        rollup = DreamDayRollup.objects.get(user_id='dreamer')
+        self.assertEqual((rollup.dream_count, rollup.theme_counts), (0, {'River': 1}))
+
+    @override_settings(DREAM_ANALYZER={'METRICS_DIR': None, 'JOB_IN_PROCESS_WORKERS': 2})
+    def test_workers_start_on_the_first_request(self):
+        self.addCleanup(request_started.disconnect, jobs.start_workers_on_request)
+        with mock.patch.object(jobs, 'WorkerPool') as pool, mock.patch.object(jobs, '_pool', None):
+            apps.get_app_config('myapp').ready()
+            pool.assert_not_called()
+            request_started.send(sender=None)
+            request_started.send(sender=None)
+        pool.assert_called_once_with(2)
+        pool.return_value.start.assert_called_once_with()
+
+
+class RollupTests(TestCase):
+    user = 'user-1'
+
+    def dream(self, created_at, *themes):
+        return {'created_at': created_at, 'themes': list(themes)}
+
+    def counts(self, period):
+        return dict(ThemePeriodCount.objects.filter(user_id=self.user, period=period)
+                    .values_list('theme', 'count'))
+
+    def test_counts_dreams_and_themes_per_day(self):
+        rollups.apply_to_rollups(self.user, [
+            self.dream('2024-01-03T23:30:00-02:00', 'River', 'House'),  # 01:30 UTC on the 4th
+            self.dream('2024-01-04T08:00:00Z', 'River', 'River'),
+            self.dream('2024-01-10T08:00:00Z', 'Door'),
+        ])
+        self.assertEqual(rollups.calendar(self.user, date(2024, 1, 1), date(2024, 1, 31)), [
+            {'start': '2024-01-04', 'count': 2,
+             'top_themes': [{'theme': 'River', 'count': 2}, {'theme': 'House', 'count': 1}]},
+            {'start': '2024-01-10', 'count': 1, 'top_themes': [{'theme': 'Door', 'count': 1}]},
+        ])
+        weeks = rollups.calendar(self.user, date(2024, 1, 1), date(2024, 1, 31), period='week', top_themes=1)
+        self.assertEqual(weeks, [
+            {'start': '2024-01-01', 'count': 2, 'top_themes': [{'theme': 'River', 'count': 2}]},
+            {'start': '2024-01-08', 'count': 1, 'top_themes': [{'theme': 'Door', 'count': 1}]},
+        ])
+
+    def test_theme_counters_per_period(self):
+        rollups.apply_to_rollups(self.user, [
+            self.dream('2024-01-04T08:00:00Z', 'River'),
+            self.dream('2024-01-10T08:00:00Z', 'River', 'Door'),
+            self.dream('2024-02-01T08:00:00Z', 'Door'),
+        ])
+        self.assertEqual(self.counts('all'), {'River': 2, 'Door': 2})
+        self.assertEqual(rollups.top_themes(self.user, 'month', date(2024, 1, 1), date(2024, 1, 31)),
+                         [{'theme': 'River', 'count': 2}, {'theme': 'Door', 'count': 1}])
+        self.assertEqual(rollups.top_themes(self.user, 'all', k=1), [{'theme': 'Door', 'count': 2}])
+        self.assertEqual(rollups.theme_trends(self.user, ['River'], 'week', date(2024, 1, 3), date(2024, 2, 29)), [
+            {'theme': 'River', 'points': [{'start': '2024-01-01', 'count': 1}, {'start': '2024-01-08', 'count': 1}]},
+        ])
+
+    def test_removing_dreams_drops_empty_counters(self):
+        dreams = [self.dream('2024-01-04T08:00:00Z', 'River'), self.dream('2024-01-04T09:00:00Z', 'River', 'Door')]
+        rollups.apply_to_rollups(self.user, dreams)
+        rollups.apply_to_rollups(self.user, dreams[1:], sign=-1)
+        self.assertEqual(self.counts('week'), {'River': 1})
+        rollup = DreamDayRollup.objects.get(user_id=self.user)
+        self.assertEqual((rollup.dream_count, rollup.theme_counts), (1, {'River': 1}))
+
+        # Counts never go below zero, even if a dream is removed twice
+        rollups.apply_to_rollups(self.user, dreams, sign=-1)
+        rollups.apply_to_rollups(self.user, dreams, sign=-1)
+        rollup.refresh_from_db()
+        self.assertEqual((rollup.dream_count, rollup.theme_counts), (0, {}))
+        self.assertFalse(ThemePeriodCount.objects.exists())
+        self.assertEqual(rollups.calendar(self.user, date(2024, 1, 1), date(2024, 1, 31)), [])
+
+    def test_queued_analysis_adds_themes_only(self):
+        rollups.record_dreams(self.user, [self.dream('2024-01-04T08:00:00Z')])
+        rollups.record_dreams(self.user, [self.dream('2024-01-04T08:00:00Z', 'River')], count_dreams=False)
+        rollup = DreamDayRollup.objects.get(user_id=self.user)
+        self.assertEqual((rollup.dream_count, rollup.theme_counts), (1, {'River': 1}))
+
+    def test_reanalysis_moves_theme_counts(self):
+        rollups.record_dreams(self.user, [self.dream('2024-01-04T08:00:00Z', 'River', 'House')])
+        rollups.record_reanalysis(self.user, self.dream('2024-01-04T08:00:00Z', 'River', 'Door'), ['River', 'House'])
+        self.assertEqual(self.counts('month'), {'River': 1, 'Door': 1})
+        rollup = DreamDayRollup.objects.get(user_id=self.user)
+        self.assertEqual((rollup.dream_count, rollup.theme_counts), (1, {'River': 1, 'Door': 1}))
+
+    def test_failed_reanalysis_leaves_counts_alone(self):
+        rollups.record_dreams(self.user, [self.dream('2024-01-04T08:00:00Z', 'House')])
+        apply = rollups.apply_to_rollups
+        failures = rollups._failures
+
+        def subtract_then_fail(user_id, dreams, sign=1, count_dreams=True):
+            if sign > 0:
+                raise Exception('database gone')
+            apply(user_id, dreams, sign=sign, count_dreams=count_dreams)
+
+        with mock.patch.object(rollups, 'apply_to_rollups', subtract_then_fail):
+            rollups.record_reanalysis(self.user, self.dream('2024-01-04T08:00:00Z', 'Door'), ['House'])
+        self.assertEqual(self.counts('all'), {'House': 1})
+        self.assertEqual(rollups._failures, failures + 1)
+
+
+class PostgrestTestCase(SimpleTestCase):
+    """Views against a local PostgREST stand-in serving :func:`fake_dreams`"""
+
+    def setUp(self):
+        self.postgrest = FakePostgrest(fake_dreams(5)).start()
+        self.addCleanup(self.postgrest.stop)
+        settings = override_settings(SUPABASE={'URL': self.postgrest.url, 'KEY': 'header.payload.signature'})
+        settings.enable()
+        self.addCleanup(settings.disable)
+        reset_client()
+        self.addCleanup(reset_client)
+
+
+class DreamHistoryTests(PostgrestTestCase):
+    def history(self, **params):
+        request = APIRequestFactory().get('/api/dreams/history/', params)
+        force_authenticate(request, user=User(username='benchmark-user'))
+        return api.get_dream_history(request)
+
+    def test_pages_with_a_cursor(self):
+        response = self.history(limit=2, fields='dream_id,themes')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['dreams'], [
+            {'dream_id': 5, 'themes': ['House']},
+            {'dream_id': 4, 'themes': ['House', 'Door']},
+        ])
+        self.assertEqual(decode_cursor(response.data['next_cursor']), ('2024-01-27T01:00:00+00:00', 4))
+
+        # FakePostgrest ignores filters, so only the status of the next page is checked
+        self.assertEqual(self.history(limit=2, cursor=response.data['next_cursor']).status_code, 200)
+        self.assertIsNone(self.history(limit=10).data['next_cursor'])
+
+    def test_exports_pool_gauges(self):
+        self.history(limit=2)
+        exported = render()
+        self.assertIn('dream_pool_connections{service="supabase"} 1', exported)
+        self.assertIn('dream_pool_size{service="supabase"} 20', exported)
+
+    def test_since_is_sent_as_a_parsed_timestamp(self):
+        self.assertEqual(self.history(since='2024-01-20T00:00:00Z').status_code, 200)
+        self.assertEqual(self.postgrest.requests, 1)
+
+    def test_rejects_bad_parameters(self):
+        self.assertEqual(self.history(fields='dream_id,password').status_code, 400)
+        self.assertEqual(self.history(cursor='not a cursor').status_code, 400)
+        self.assertEqual(self.history(since='yesterday').status_code, 400)
+        self.assertEqual(self.history(since='2024-01-01,dream_id.gt.0').status_code, 400)
+        self.assertEqual(self.postgrest.requests, 0)
+
+
+@override_settings(DREAM_ANALYZER={'METRICS_DIR': None, 'SIMILAR_EMBED_LIMIT': 2})
+class SimilarDreamsTests(PostgrestTestCase):
+    def setUp(self):
+        super().setUp()
+        self.analyzer = mock.Mock(embed=mock.AsyncMock(return_value=np.array([1.0, 0.0])))
+        # Dreams 5 and 3 have cached embeddings, 4, 2 and 1 don't
+        self.analyzer.cached_embeddings.return_value = [
+            np.array([1.0, 0.0]), None, np.array([0.6, 0.8]), None, None]
+        for target, value in (('get_dream_analyzer', self.analyzer), ('get_corpus_index', (None, None))):
+            patcher = mock.patch.object(api, target, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_compares_cached_embeddings_and_queues_a_few_misses(self):
+        request = APIRequestFactory().post('/api/dreams/similar/', {'dream_text': 'a river', 'k': 5}, format='json')
+        force_authenticate(request, user=User(username='benchmark-user'))
+        response = api.similar_dreams(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([match['dream_id'] for match in response.data['history']], [5, 3])
+        self.assertEqual(response.data['history_pending'], 3)
+        queued, = self.analyzer.cache_embeddings.call_args.args
+        self.assertEqual(len(queued), 2)
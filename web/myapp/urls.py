@@ -7,7 +7,14 @@ urlpatterns = [
     path('callback/', views.auth_callback, name='auth_callback'),
     # API endpoints
     path('api/dreams/', api.submit_dream, name='submit_dream'),
+    path('api/dreams/stream/', api.submit_dream_stream, name='submit_dream_stream'),
+    path('api/dreams/bulk/', api.bulk_import_dreams, name='bulk_import_dreams'),
+    path('api/dreams/jobs/', api.submit_dream_job, name='submit_dream_job'),
+    path('api/dreams/jobs/<uuid:job_id>/', api.get_dream_job, name='dream_job_status'),
     path('api/dreams/history/', api.get_dream_history, name='dream_history'),
+    path('api/dreams/calendar/', api.dream_calendar, name='dream_calendar'),
+    path('api/dreams/themes/', api.dream_theme_trends, name='dream_theme_trends'),
     path('api/dreams/<int:dream_id>/', api.get_dream, name='get_dream'),
+    path('api/dreams/similar/', api.similar_dreams, name='similar_dreams'),
     path('api/dream-dictionary/', views.get_dream_dictionary, name='dream_dictionary'),
 ] 
\ No newline at end of file
@@ -1,5 +1,5 @@
 from django.shortcuts import render, redirect
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
 import json
@@ -8,11 +8,15 @@ from rest_framework.response import Response
 from .models import Dream
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.authentication import BaseAuthentication, TokenAuthentication, SessionAuthentication
-from supabase import create_client
+from .supabase_client import get_supabase
 import jwt
-import csv
-import codecs
-import os
+import logging
+from .dream_dictionary import dictionary_response, get_shared_dictionary
+from .conf import get_setting
+from . import metrics as dream_metrics
+import hmac
+
+logger = logging.getLogger(__name__)
 
 # Create your views here.
 
@@ -62,11 +66,8 @@ class SupabaseAuthentication(BaseAuthentication):
 @permission_classes([IsAuthenticated])
 def get_dream(request, dream_id):
     try:
-        # Create Supabase client
-        supabase = create_client(
-            settings.SUPABASE['URL'],
-            settings.SUPABASE['KEY']
-        )
+        # Shared, pooled Supabase client
+        supabase = get_supabase()
         
         # Use the authenticated user_id from the token
         user_id = request.user  # This will be the sub claim from the JWT
@@ -97,42 +98,25 @@ def get_dream(request, dream_id):
 
 @api_view(['GET'])
 def get_dream_dictionary(request):
+    """Serve the pre-encoded dream dictionary (supports ?offset=&limit=&prefix=)"""
     try:
-        # Debug: Print current working directory and file path
-        current_dir = os.getcwd()
-        file_path = os.path.join(current_dir, 'backend', 'dream_dict.csv')
-        print(f"Current directory: {current_dir}")
-        print(f"Looking for file at: {file_path}")
-        print(f"File exists: {os.path.exists(file_path)}")
-        
-        dream_dict = []
-        with codecs.open(file_path, 'r', encoding='utf-8-sig') as file:
-            # Read first few lines to debug
-            print("First few lines of file:")
-            for i, line in enumerate(file):
-                if i < 5:  # Print first 5 lines
-                    print(f"Line {i}: {line.strip()}")
-                else:
-                    break
-            file.seek(0)  # Reset file pointer
-            
-            # Continue with normal processing...
-            csv_reader = csv.reader(file)
-            header = next(csv_reader)
-            print(f"CSV Header: {header}")
-            
-            for row in csv_reader:
-                if len(row) >= 2:
-                    symbol = row[0].strip()
-                    interpretation = row[1].strip()
-                    if symbol:
-                        dream_dict.append({
-                            'symbol': symbol,
-                            'interpretation': interpretation
-                        })
-
-        print(f"Processed {len(dream_dict)} dream symbols")
-        return JsonResponse(dream_dict, safe=False)
+        return dictionary_response(request, get_shared_dictionary())
     except Exception as e:
-        print(f"Error reading dream dictionary: {str(e)}")
+        logger.error(f"Error reading dream dictionary: {str(e)}")
         return JsonResponse({'error': str(e)}, status=500)
+
+def metrics(request):
+    """Prometheus metrics for all workers, if METRICS_ENABLED (Bearer METRICS_TOKEN required if set)"""
+    if not dream_metrics.enabled():
+        return HttpResponse(status=404)
+    token = get_setting('METRICS_TOKEN')
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse(status=401)
+
+    extra = []
+    try:
+        from .jobs import queue_depth
+        extra.append(('dream_queue_depth', {'queue': 'analysis_jobs'}, queue_depth()))
+    except Exception as e:
+        logger.warning(f"Could not read analysis job queue depth: {str(e)}")
+    return HttpResponse(dream_metrics.render(extra), content_type='text/plain; version=0.0.4; charset=utf-8')
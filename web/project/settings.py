@@ -37,6 +37,15 @@ SUPABASE = {
     'CALLBACK_URL': os.getenv('SUPABASE_CALLBACK_URL'),
 }
 
+# Overrides for the defaults in myapp/conf.py
+DREAM_ANALYZER = {
+    # Set in worker processes so the model is loaded before taking traffic
+    'WARM_ON_STARTUP': os.getenv('DREAM_ANALYZER_WARM_ON_STARTUP') == '1',
+    # Opt in to /metrics; set a token so only the scraper can read it
+    'METRICS_ENABLED': os.getenv('DREAM_ANALYZER_METRICS') == '1',
+    'METRICS_TOKEN': os.getenv('DREAM_ANALYZER_METRICS_TOKEN') or None,
+}
+
 # Add to ALLOWED_HOSTS if you're using the callback URL
 ALLOWED_HOSTS = ['localhost', '127.0.0.1']
 
@@ -56,6 +65,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "myapp.middleware.RequestMetricsMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
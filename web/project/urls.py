@@ -19,9 +19,11 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from myapp import views as myapp_views
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("auth/", include("myapp.auth_urls")),
     path("api/", include("myapp.urls")),
+    path("metrics", myapp_views.metrics, name="metrics"),
 ] + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
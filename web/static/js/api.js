@@ -33,10 +33,162 @@ export async function submitDream(dreamText) {
     }
 }
 
-export async function getDreamHistory() {
+// Saves an edited dream; its themes and analysis are refreshed and only new
+// sentences are re-embedded on the server.
+export async function updateDream(dreamId, dreamText) {
+    const headers = await getAuthHeaders();
+    const response = await fetch(`${API_BASE}/dreams/${dreamId}/`, {
+        method: 'PATCH',
+        headers,
+        credentials: 'include',
+        body: JSON.stringify({ dream_text: dreamText }),
+    });
+
+    if (!response.ok) {
+        throw new Error('Failed to update dream');
+    }
+
+    return await response.json();
+}
+
+// Streams the analysis: onEvent(type, data) is called with 'themes' first,
+// then 'token' for each chunk of text, and finally 'done' or 'error'.
+export async function submitDreamStream(dreamText, onEvent) {
+    const headers = await getAuthHeaders();
+    const response = await fetch(`${API_BASE}/dreams/stream/`, {
+        method: 'POST',
+        headers,
+        credentials: 'include',
+        body: JSON.stringify({ dream_text: dreamText }),
+    });
+
+    if (!response.ok) {
+        throw new Error('Failed to submit dream');
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    for (;;) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const message = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            const type = message.match(/^event: (.*)$/m)?.[1];
+            const data = message.match(/^data: (.*)$/m)?.[1];
+            if (type && data) onEvent(type, JSON.parse(data));
+        }
+    }
+}
+
+// `payload` is a list of dream texts or a journal export ({ dreams: [...] }).
+// Resolves with { status, imported, failed, results } (one result per dream).
+export async function importDreams(payload) {
+    const headers = await getAuthHeaders();
+    const response = await fetch(`${API_BASE}/dreams/bulk/`, {
+        method: 'POST',
+        headers,
+        credentials: 'include',
+        body: JSON.stringify(payload),
+    });
+
+    if (!response.ok) {
+        throw new Error('Failed to import dreams');
+    }
+
+    return await response.json();
+}
+
+// Queues the analysis and resolves with { job_id, dream_id, status }
+// as soon as the dream is saved; poll getDreamJob(job_id) for the result.
+export async function submitDreamJob(dreamText) {
+    const headers = await getAuthHeaders();
+    const response = await fetch(`${API_BASE}/dreams/jobs/`, {
+        method: 'POST',
+        headers,
+        credentials: 'include',
+        body: JSON.stringify({ dream_text: dreamText }),
+    });
+
+    if (response.status !== 202) {
+        throw new Error('Failed to submit dream');
+    }
+
+    return (await response.json()).data;
+}
+
+// { status: queued|running|succeeded|failed, progress, result, error }
+export async function getDreamJob(jobId) {
+    const headers = await getAuthHeaders();
+    const response = await fetch(`${API_BASE}/dreams/jobs/${jobId}/`, {
+        headers,
+        credentials: 'include',
+    });
+
+    if (!response.ok) {
+        throw new Error('Failed to fetch job status');
+    }
+
+    return (await response.json()).data;
+}
+
+// Returns { period, start, end, total, buckets: [{ start, count, top_themes }] }
+// for period 'day' | 'week' | 'month'; start/end are YYYY-MM-DD (UTC days).
+export async function getDreamCalendar({ start, end, period = 'day', top } = {}) {
+    const headers = await getAuthHeaders();
+    const params = new URLSearchParams({ period });
+    if (start) params.set('start', start);
+    if (end) params.set('end', end);
+    if (top !== undefined) params.set('top', top);
+    const response = await fetch(`${API_BASE}/dreams/calendar/?${params}`, {
+        headers,
+        credentials: 'include',
+    });
+
+    if (!response.ok) {
+        throw new Error('Failed to fetch dream calendar');
+    }
+
+    return await response.json();
+}
+
+// Returns { period, top: [{ theme, count }], start, end, series: [{ theme, points: [{ start, count }] }] }
+// for period 'week' | 'month'; period 'all' returns only the all-time top themes.
+// Pass `themes` to get series for those themes instead of the top ones.
+export async function getThemeTrends({ start, end, period = 'month', top, themes = [] } = {}) {
+    const headers = await getAuthHeaders();
+    const params = new URLSearchParams({ period });
+    if (start) params.set('start', start);
+    if (end) params.set('end', end);
+    if (top !== undefined) params.set('top', top);
+    themes.forEach((theme) => params.append('theme', theme));
+    const response = await fetch(`${API_BASE}/dreams/themes/?${params}`, {
+        headers,
+        credentials: 'include',
+    });
+
+    if (!response.ok) {
+        throw new Error('Failed to fetch theme trends');
+    }
+
+    return await response.json();
+}
+
+// Returns one page: { dreams, next_cursor }. Pass next_cursor back as `cursor`
+// to fetch the following page; `fields`, `since` and `limit` are optional.
+export async function getDreamHistory({ cursor, limit, fields, since } = {}) {
     try {
         const headers = await getAuthHeaders();
-        const response = await fetch(`${API_BASE}/dreams/history/`, {
+        const params = new URLSearchParams();
+        if (cursor) params.set('cursor', cursor);
+        if (limit) params.set('limit', limit);
+        if (fields) params.set('fields', fields);
+        if (since) params.set('since', since);
+        const query = params.toString() ? `?${params}` : '';
+        const response = await fetch(`${API_BASE}/dreams/history/${query}`, {
             headers,
             credentials: 'include',
         });